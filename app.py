@@ -1,26 +1,45 @@
 import os
 import sys
-from flask import Flask, render_template, send_from_directory
+
+# 起動時間の内訳を計測する（STARTUP_PROFILE=1 のときのみ。以降のインポートが対象）
+from src.core import startup_profile
+startup_profile.install()
+
+from flask import Flask
 from flask_cors import CORS
-from vertexai.generative_models import GenerativeModel
-import vertexai
 from flask_dance.contrib.google import make_google_blueprint
 import logging
 from werkzeug.middleware.proxy_fix import ProxyFix
+from src.core import logging_config
+
+# 構造化ログ（JSON）をバックグラウンドのスレッドから出力する（LOG_LEVEL / LOG_LEVELS / LOG_FORMAT 等）
+logging_config.configure_logging()
 
 # Add src directory to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
 
-from api.v1.activities import activities_bp
-from api.v1.users import bp as users_bp
-from api.v1.weekly_reflections import weekly_reflections_bp
+# Blueprint は src. 経由で読み込む（api.v1.* と src.api.v1.* の二重インポートで
+# サービスのインスタンスが重複しないようにする）
+with startup_profile.phase("import blueprints"):
+    from src.api.v1.activities import activities_bp, activity_service
+    from src.api.v1.users import bp as users_bp, password_hasher
+    from src.api.v1.weekly_reflections import weekly_reflections_bp
+    from src.api.v1.dashboard import dashboard_bp
+from src.core import compression, json_provider, request_stats, static_assets
+from src.core.clients import get_client_registry
+
+FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'frontend', 'build')
 
+# /static は static_assets が配信する（圧縮済みファイルの選択とキャッシュヘッダ）
 app = Flask(
     __name__,
-    static_folder='static/frontend/build/static',
+    static_folder=None,
     template_folder='static/frontend/build'
 )
 
+# jsonify を orjson で行う（日時は従来と同じ HTTP-date 形式）
+json_provider.init_app(app)
+
 # .envからFLASK_SECRET_KEYを取得して設定
 app.secret_key = os.environ.get("FLASK_SECRET_KEY", "dev_secret_key_123")
 
@@ -60,19 +79,39 @@ CORS(app,
      supports_credentials=True, 
      methods=["GET", "POST", "DELETE", "PATCH", "OPTIONS"])
 
-# Initialize Vertex AI
-PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "health-report-465810") # Get from env or use default
-LOCATION = os.environ.get("GCP_LOCATION", "us-central1") # Get from env or use default
-vertexai.init(project=PROJECT_ID, location=LOCATION)
+# Vertex AI は初回のAI診断時に初期化する（src/core/clients.py）
 
 # Register Blueprints
 app.register_blueprint(activities_bp)
 app.register_blueprint(users_bp, url_prefix='/api/v1')
 app.register_blueprint(weekly_reflections_bp)
+app.register_blueprint(dashboard_bp)
+
+# リクエスト毎のストレージジョブ数を計測（X-Storage-Jobs ヘッダ）
+request_stats.init_app(app)
+# DEBUGログのリクエスト単位のサンプリング（LOG_DEBUG_SAMPLE_RATE）
+logging_config.init_app(app)
+# 大きな JSON 応答の gzip 圧縮（RESPONSE_GZIP_MIN_BYTES / RESPONSE_GZIP_LEVEL）
+compression.init_app(app)
+# フロントエンドのビルド成果物の配信（起動時に gzip / brotli 版を作る。STATIC_PRECOMPRESS）
+frontend_assets = static_assets.init_app(app, FRONTEND_BUILD_DIR)
+
+
+def warm_up():
+    """
+    行動記録のwrite-behindバッファのワーカーを起動し、終了したプロセスのスピルファイルを回収する
+    （最初のPOSTを待たずに、残っていた行へのGET・PATCH・DELETEにも応答できるようにする）。
+    WARM_UP_ON_START=1 の場合は、トラフィックを受ける前に外部サービスへの接続も確立する。
+    いずれもプロセス毎に持つため、gunicornではfork後の各ワーカーで呼ぶ（gunicorn.conf.py の post_worker_init）。
+    """
+    if activity_service.write_buffer is not None:
+        activity_service.write_buffer.start()
+    if os.environ.get("WARM_UP_ON_START", "").lower() in ("1", "true", "yes"):
+        with startup_profile.phase("warm-up"):
+            get_client_registry().warm_up()
+            password_hasher.warm_up()
+    startup_profile.log_report()
 
-@app.route('/manifest.json')
-def manifest():
-    return send_from_directory('static/frontend/build', 'manifest.json')
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -80,10 +119,14 @@ def catch_all(path):
     # APIリクエストはここで処理しない
     if path.startswith('api/'):
         return '', 404
-    # それ以外は全てindex.htmlを返す
-    return render_template('index.html')
+    # ビルド直下のファイル（manifest.json, favicon.ico 等）はそのまま返す
+    if frontend_assets.has_root_file(path):
+        return frontend_assets.send_root_file(path)
+    # それ以外は全てメモリ上のindex.html（SPAのシェル）を返す
+    return frontend_assets.send_shell()
 
 if __name__ == '__main__':
-    # This is used when running locally. Gunicorn is used in production.
+    # This is used when running locally. Gunicorn is used in production (gunicorn.conf.py).
     print(app.url_map)
+    warm_up()
     app.run(debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 8080)))
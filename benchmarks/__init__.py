@@ -0,0 +1,3 @@
+"""
+オフラインのベンチマーク（外部サービスへの接続は不要）。使い方は endpoint_bench.py を参照。
+"""
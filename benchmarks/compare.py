@@ -0,0 +1,79 @@
+"""
+2回のベンチマーク結果（endpoint_bench の出力JSON）をシナリオ毎に比較します。
+
+    python -m benchmarks.compare before.json after.json [--threshold 10]
+
+変化率が threshold（%）を超えて悪化したシナリオがあれば終了コード1で終了します。
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+# (表示名, 取り出し方, 大きいほど良いか)
+METRICS = (
+    ("rps", lambda s: s["rps"], True),
+    ("p50_ms", lambda s: s["latency_ms"]["p50"], False),
+    ("p95_ms", lambda s: s["latency_ms"]["p95"], False),
+    ("p99_ms", lambda s: s["latency_ms"]["p99"], False),
+    ("jobs_per_req", lambda s: s["storage_jobs_per_request"]["mean"], False),
+    ("peak_rss_mb", lambda s: s["peak_rss_mb"], False),
+)
+
+
+def _change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before is None or after is None or before == 0:
+        return None
+    return (after - before) / before * 100
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """両方の結果にあるシナリオについて、指標毎の値と変化率（%）、悪化の有無を返します。"""
+    before_by_name = {s["name"]: s for s in before["scenarios"]}
+    rows = []
+    for scenario in after["scenarios"]:
+        base = before_by_name.get(scenario["name"])
+        if base is None:
+            continue
+        metrics = {}
+        regressed = False
+        for name, get, higher_is_better in METRICS:
+            change = _change(get(base), get(scenario))
+            worse = change is not None and (-change if higher_is_better else change) > threshold
+            regressed = regressed or worse
+            metrics[name] = {"before": get(base), "after": get(scenario), "change_pct": change, "regressed": worse}
+        rows.append({"name": scenario["name"], "metrics": metrics, "regressed": regressed})
+    return rows
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="2回のベンチマーク結果を比較します")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=10.0, help="悪化とみなす変化率（%%）")
+    parser.add_argument("--json", action="store_true", help="比較結果をJSONで出力します")
+    args = parser.parse_args(argv)
+
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    rows = compare(before, after, args.threshold)
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'scenario':28}" + "".join(f"{name:>22}" for name, _, _ in METRICS))
+        for row in rows:
+            cells = []
+            for name, _, _ in METRICS:
+                metric = row["metrics"][name]
+                change = "n/a" if metric["change_pct"] is None else f"{metric['change_pct']:+.1f}%"
+                mark = "!" if metric["regressed"] else " "
+                cells.append(f"{metric['after']:>12} {change:>8}{mark}")
+            print(f"{row['name']:28}" + "".join(cells))
+    sys.exit(1 if any(row["regressed"] for row in rows) else 0)
+
+
+if __name__ == "__main__":
+    main()
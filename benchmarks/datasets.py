@@ -0,0 +1,132 @@
+"""
+ベンチマーク用の合成データ（ユーザー・行動記録・週次振り返り）の生成とロード。
+
+行動記録は1日あたり数件の活動を期間内に割り振り、乱数のシードが同じなら同じデータを生成します。
+行はNDJSONのチャンクで load_ndjson に渡すため、1000万件でも保持するのは1チャンク分だけです。
+"""
+import io
+import json
+import random
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterator, List, NamedTuple, Optional
+import bcrypt
+from src.core.storage import StorageBackend
+
+ACTIVITIES_TABLE_ID = "health-report-465810.health_data.activities"
+USERS_TABLE_ID = "health-report-465810.health_data.users"
+REFLECTIONS_TABLE_ID = "health-report-465810.health_data.WeeklyReflections"
+
+CATEGORY_IDS = ("business", "study", "private", "sleep", "meal", "exercise")
+BENCH_PASSWORD = "bench-password"
+LOAD_CHUNK_ROWS = 10000
+
+
+class Dataset(NamedTuple):
+    """ロードしたデータの概要。ids_by_user はユーザー毎に参照・更新・削除に使う行動記録IDの一部。"""
+    user_ids: List[str]
+    usernames: List[str]
+    start_date: date
+    days: int
+    activities: int
+    ids_by_user: Dict[str, List[str]]
+
+
+def _iso(value: datetime) -> str:
+    return value.isoformat().replace("+00:00", "Z")
+
+
+def generate_activities(user_ids: List[str], count: int, start_date: date, days: int,
+                        seed: int = 0) -> Iterator[dict]:
+    """count 件の行動記録をユーザー・日付に均等に割り振って生成します（ユーザー毎に日付の昇順）。"""
+    rng = random.Random(seed)
+    per_user, remainder = divmod(count, len(user_ids))
+    for index, user_id in enumerate(user_ids):
+        n = per_user + (1 if index < remainder else 0)
+        for i in range(n):
+            day = start_date + timedelta(days=(i * days) // max(n, 1))
+            start = datetime.combine(day, time(6, 0), tzinfo=timezone.utc) + timedelta(minutes=rng.randrange(0, 16 * 60))
+            end = start + timedelta(minutes=rng.choice((15, 30, 45, 60, 90, 120)))
+            yield {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "user_id": user_id,
+                "start_time": _iso(start),
+                "end_time": _iso(end),
+                "activity_content": f"bench activity {i}",
+                "category_id": rng.choice(CATEGORY_IDS),
+                "fatigue_level": rng.randint(0, 5),
+                "fatigue_notes": None,
+                "created_at": _iso(start),
+                "updated_at": _iso(start),
+            }
+
+
+def _load_chunks(backend: StorageBackend, table_id: str, rows: Iterator[dict], chunk_rows: int) -> int:
+    loaded = 0
+    buffer = io.BytesIO()
+    pending = 0
+    for row in rows:
+        buffer.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+        pending += 1
+        if pending >= chunk_rows:
+            buffer.seek(0)
+            loaded += backend.load_ndjson(table_id, buffer)
+            buffer, pending = io.BytesIO(), 0
+    if pending:
+        buffer.seek(0)
+        loaded += backend.load_ndjson(table_id, buffer)
+    return loaded
+
+
+def load_dataset(backend: StorageBackend, activities: int, users: int = 10, days: int = 90,
+                 start_date: Optional[date] = None, reflections: bool = True, seed: int = 0,
+                 sample_ids_per_user: int = 200) -> Dataset:
+    """
+    ユーザー・行動記録・週次振り返りをロードします。
+    ユーザーのパスワードは全員 BENCH_PASSWORD（ハッシュは既定のコストで1度だけ計算する）。
+    """
+    start_date = start_date or date.today() - timedelta(days=days)
+    rng = random.Random(seed)
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128), version=4)) for _ in range(users)]
+    usernames = [f"bench-user-{i}" for i in range(users)]
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    now = _iso(datetime.now(timezone.utc))
+    _load_chunks(backend, USERS_TABLE_ID, (
+        {"id": user_id, "username": username, "password_hash": password_hash, "created_at": now, "updated_at": now}
+        for user_id, username in zip(user_ids, usernames)
+    ), LOAD_CHUNK_ROWS)
+
+    ids_by_user: Dict[str, List[str]] = {user_id: [] for user_id in user_ids}
+
+    def sampled(rows: Iterator[dict]) -> Iterator[dict]:
+        for row in rows:
+            ids = ids_by_user[row["user_id"]]
+            if len(ids) < sample_ids_per_user:
+                ids.append(row["id"])
+            yield row
+
+    loaded = _load_chunks(backend, ACTIVITIES_TABLE_ID,
+                          sampled(generate_activities(user_ids, activities, start_date, days, seed)), LOAD_CHUNK_ROWS)
+
+    if reflections:
+        first_monday = start_date + timedelta(days=(7 - start_date.weekday()) % 7)
+        weeks = [first_monday + timedelta(weeks=w) for w in range(days // 7)]
+        _load_chunks(backend, REFLECTIONS_TABLE_ID, (
+            {
+                "id": str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                "user_id": user_id,
+                "week_start_date": str(week),
+                "title": f"week of {week}",
+                "questions": json.dumps([{"text": "よく眠れましたか", "score": rng.randint(1, 5)}], ensure_ascii=False),
+                "anxieties": "特になし",
+                "good_things": "散歩した",
+                "reflection_notes": None,
+                "ai_diagnosis_result": None,
+                "weekly_total_load_points": None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for user_id in user_ids for week in weeks
+        ), LOAD_CHUNK_ROWS)
+
+    return Dataset(user_ids, usernames, start_date, days, loaded, ids_by_user)
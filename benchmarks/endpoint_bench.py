@@ -0,0 +1,447 @@
+"""
+エンドポイントのスループット・レイテンシのベンチマーク（オフライン、外部サービス不要）
+
+    python -m benchmarks.endpoint_bench --activities 100000 --concurrency 16 --output result.json
+    python -m benchmarks.endpoint_bench --list
+    python -m benchmarks.compare before.json after.json
+
+bigquery.Client と GenerativeModel を遅延を注入できる代替（benchmarks/fakes.py）に差し替えてアプリを起動し、
+src/api/v1 の各ルートを指定した同時実行数で呼び出して、p50/p95/p99 レイテンシ、RPS、
+1リクエストあたりのストレージジョブ数、ピークRSSをJSONで出力します。
+キャッシュ・write-behind・日次集計などの設定は通常どおり環境変数で指定します（結果の meta に記録する）。
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import numpy as np
+
+# 計測対象の環境変数（meta に記録する）
+RECORDED_ENV_PREFIXES = ("ACTIVITY_", "AI_", "BCRYPT_", "DAILY_ROLLUPS_", "DASHBOARD_", "DATA_VERSION_", "FANOUT_", "GCP_",
+                         "LOG_", "PASSWORD_HASHER_", "RESPONSE_GZIP_", "SERVER_TIMING_", "USER_CACHE_")
+
+
+class Scenario(NamedTuple):
+    name: str
+    description: str
+    build: Callable[["BenchContext", random.Random], Dict[str, Any]]
+    # 正常とみなすステータスコード
+    expected: tuple = (200, 201, 204)
+
+
+class BenchContext:
+    """アプリ・ロード済みデータ・ユーザー毎のセッションCookieをまとめたもの"""
+
+    def __init__(self, app, dataset, fake_bigquery, fake_model):
+        self.app = app
+        self.dataset = dataset
+        self.fake_bigquery = fake_bigquery
+        self.fake_model = fake_model
+        serializer = app.session_interface.get_signing_serializer(app)
+        self.cookies = {user_id: serializer.dumps({"user_id": user_id}) for user_id in dataset.user_ids}
+        end = dataset.start_date + timedelta(days=dataset.days)
+        # データのある期間の最後の月曜日
+        self.week_start = end - timedelta(days=end.weekday() + 7)
+        self._deletable = {user_id: list(ids[len(ids) // 2:]) for user_id, ids in dataset.ids_by_user.items()}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def pick_user(self, rng: random.Random) -> str:
+        return rng.choice(self.dataset.user_ids)
+
+    def existing_id(self, user_id: str, rng: random.Random) -> str:
+        # 前半は参照・更新用、後半は削除用
+        ids = self.dataset.ids_by_user[user_id]
+        return rng.choice(ids[:max(len(ids) // 2, 1)])
+
+    def pop_deletable(self, user_id: str) -> str:
+        with self._lock:
+            ids = self._deletable[user_id]
+            return ids.pop() if ids else str(uuid.uuid4())
+
+
+def _activity_body(ctx: BenchContext, rng: random.Random) -> Dict[str, Any]:
+    day = ctx.week_start + timedelta(days=rng.randrange(7))
+    hour = rng.randrange(6, 22)
+    return {
+        "start_time": f"{day}T{hour:02d}:00:00Z",
+        "end_time": f"{day}T{hour:02d}:45:00Z",
+        "activity_content": "bench",
+        "category_id": rng.choice(("business", "study", "private")),
+        "fatigue_level": rng.randint(0, 5),
+    }
+
+
+def _reflection_body(ctx: BenchContext, rng: random.Random) -> Dict[str, Any]:
+    # AI診断のキャッシュに当たらないよう、本文はリクエスト毎に変える
+    return {
+        "week_start_date": str(ctx.week_start),
+        "title": "bench",
+        "questions": [{"text": "よく眠れましたか", "score": rng.randint(1, 5)}],
+        "anxieties": f"不安 {rng.getrandbits(32)}",
+        "good_things": "散歩した",
+    }
+
+
+def _week_range(ctx: BenchContext) -> str:
+    return f"start_date={ctx.week_start}&end_date={ctx.week_start + timedelta(days=6)}"
+
+
+def _get(path: str) -> Callable[[BenchContext, random.Random], Dict[str, Any]]:
+    def build(ctx, rng):
+        user_id = ctx.pick_user(rng)
+        return {"method": "GET", "path": path.format(week=_week_range(ctx), week_start=ctx.week_start),
+                "user_id": user_id}
+    return build
+
+
+def _build_revalidate_activities(ctx, rng):
+    # 変更されていない一覧を最新の ETag で再検証するクライアント
+    from src.api.v1.activities import activity_service
+    user_id = ctx.pick_user(rng)
+    version = activity_service.data_version(user_id)
+    headers = {"If-None-Match": f'W/"{version.etag}"'} if version is not None else {}
+    return {"method": "GET", "path": "/api/v1/activities", "headers": headers, "user_id": user_id}
+
+
+def _build_get_activity(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    return {"method": "GET", "path": f"/api/v1/activities/{ctx.existing_id(user_id, rng)}", "user_id": user_id}
+
+
+def _build_create_activity(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    return {"method": "POST", "path": "/api/v1/activities", "json": _activity_body(ctx, rng), "user_id": user_id}
+
+
+def _build_update_activity(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    return {"method": "PATCH", "path": f"/api/v1/activities/{ctx.existing_id(user_id, rng)}",
+            "json": {"fatigue_level": rng.randint(0, 5)}, "user_id": user_id}
+
+
+def _build_delete_activity(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    return {"method": "DELETE", "path": f"/api/v1/activities/{ctx.pop_deletable(user_id)}", "user_id": user_id}
+
+
+def _build_import(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    lines = "\n".join(json.dumps(_activity_body(ctx, rng)) for _ in range(100))
+    return {"method": "POST", "path": "/api/v1/activities/import?format=ndjson", "data": lines,
+            "content_type": "application/x-ndjson", "user_id": user_id}
+
+
+def _build_register(ctx, rng):
+    return {"method": "POST", "path": "/api/v1/register",
+            "json": {"username": f"bench-new-{uuid.uuid4().hex}", "password": "bench-password"}}
+
+
+def _build_login(ctx, rng):
+    from benchmarks.datasets import BENCH_PASSWORD
+    return {"method": "POST", "path": "/api/v1/login",
+            "json": {"username": rng.choice(ctx.dataset.usernames), "password": BENCH_PASSWORD}}
+
+
+def _build_session(ctx, rng):
+    return {"method": "GET", "path": "/api/v1/session", "user_id": ctx.pick_user(rng)}
+
+
+def _build_upsert_reflection(ctx, rng):
+    user_id = ctx.pick_user(rng)
+    return {"method": "POST", "path": "/api/v1/weekly-reflections", "json": _reflection_body(ctx, rng),
+            "user_id": user_id}
+
+
+def _post_reflection(path: str) -> Callable[[BenchContext, random.Random], Dict[str, Any]]:
+    def build(ctx, rng):
+        return {"method": "POST", "path": path, "json": _reflection_body(ctx, rng), "user_id": ctx.pick_user(rng)}
+    return build
+
+
+# 読み取り → 書き込み → 削除 の順に実行する
+SCENARIOS: List[Scenario] = [
+    Scenario("session", "GET /api/v1/session", _build_session),
+    Scenario("login", "POST /api/v1/login（bcrypt照合を含む）", _build_login),
+    Scenario("activities_list_week", "GET /api/v1/activities（1週間分）", _get("/api/v1/activities?{week}")),
+    Scenario("activities_list_all", "GET /api/v1/activities（期間指定なし）", _get("/api/v1/activities")),
+    Scenario("activities_list_revalidate", "GET /api/v1/activities（If-None-Match、変更なし）",
+             _build_revalidate_activities, expected=(200, 304)),
+    Scenario("activities_page", "GET /api/v1/activities?limit=100（キーセットページング）",
+             _get("/api/v1/activities?limit=100")),
+    Scenario("activities_get", "GET /api/v1/activities/<id>", _build_get_activity),
+    Scenario("activities_export", "GET /api/v1/activities/export?format=ndjson（全件）",
+             _get("/api/v1/activities/export?format=ndjson")),
+    Scenario("weekly_reflections_list", "GET /api/v1/weekly-reflections", _get("/api/v1/weekly-reflections")),
+    Scenario("weekly_load_summary", "GET /api/v1/weekly-reflections/weekly-load-summary",
+             _get("/api/v1/weekly-reflections/weekly-load-summary?week_start_date={week_start}")),
+    Scenario("dashboard_week", "GET /api/v1/dashboard（行動記録・振り返り・負荷サマリーを並列取得）",
+             _get("/api/v1/dashboard?week_start_date={week_start}")),
+    Scenario("load_trends", "GET /api/v1/weekly-reflections/load-trends（4週）",
+             _get("/api/v1/weekly-reflections/load-trends?week_start_date={week_start}&weeks=4")),
+    Scenario("weekly_reflections_export", "GET /api/v1/weekly-reflections/export?format=ndjson",
+             _get("/api/v1/weekly-reflections/export?format=ndjson")),
+    Scenario("ai_diagnosis", "POST /api/v1/weekly-reflections/ai-diagnosis（同期）",
+             _post_reflection("/api/v1/weekly-reflections/ai-diagnosis")),
+    Scenario("ai_diagnosis_stream", "POST /api/v1/weekly-reflections/ai-diagnosis/stream（SSE全体）",
+             _post_reflection("/api/v1/weekly-reflections/ai-diagnosis/stream")),
+    Scenario("ai_diagnosis_job", "POST /ai-diagnosis/jobs → 完了までGETでポーリング",
+             _post_reflection("/api/v1/weekly-reflections/ai-diagnosis/jobs"), expected=(200, 202)),
+    Scenario("register", "POST /api/v1/register（bcryptハッシュを含む）", _build_register),
+    Scenario("activities_create", "POST /api/v1/activities", _build_create_activity),
+    Scenario("activities_update", "PATCH /api/v1/activities/<id>", _build_update_activity),
+    Scenario("activities_import", "POST /api/v1/activities/import（100行のNDJSON）", _build_import),
+    Scenario("weekly_reflections_upsert", "POST /api/v1/weekly-reflections", _build_upsert_reflection),
+    Scenario("activities_delete", "DELETE /api/v1/activities/<id>", _build_delete_activity),
+]
+
+
+def _send(ctx: BenchContext, spec: Dict[str, Any]):
+    spec = dict(spec)
+    method = spec.pop("method")
+    path = spec.pop("path")
+    user_id = spec.pop("user_id", None)
+    client = ctx.client()
+    # ログイン済みのユーザーとして送る（user_id が無い場合はセッションなし）
+    if user_id is not None:
+        client.set_cookie("session", ctx.cookies[user_id])
+    else:
+        client.delete_cookie("session")
+    response = client.open(path, method=method, **spec)
+    # ストリーミングのレスポンスも最後まで読む
+    response.get_data()
+    return response
+
+
+def _wait_for_job(ctx: BenchContext, response, user_id: str, interval: float = 0.05):
+    """ジョブの投入レスポンスから、完了（succeeded / failed）するまでポーリングします。"""
+    job_id = response.get_json()["job_id"]
+    jobs = int(response.headers.get("X-Storage-Jobs", 0))
+    while True:
+        poll = _send(ctx, {"method": "GET", "path": f"/api/v1/weekly-reflections/ai-diagnosis/jobs/{job_id}",
+                           "user_id": user_id})
+        jobs += int(poll.headers.get("X-Storage-Jobs", 0))
+        if poll.status_code != 200 or poll.get_json()["status"] in ("succeeded", "failed"):
+            return poll, jobs
+        time.sleep(interval)
+
+
+def rss_mb() -> Optional[float]:
+    """現在の常駐メモリ（MB）。/proc が無い環境では None"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux はKB、macOS はバイト
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_scenario(ctx: BenchContext, scenario: Scenario, requests: int, concurrency: int,
+                 warmup: int = 0, seed: int = 0) -> Dict[str, Any]:
+    """scenario を requests 回（同時実行数 concurrency）実行し、集計結果を返します。"""
+    latencies = np.zeros(requests)
+    jobs = np.zeros(requests, dtype=np.int64)
+    statuses: Dict[str, int] = {}
+    errors = 0
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def one(rng: random.Random, index: Optional[int]):
+        nonlocal errors
+        spec = scenario.build(ctx, rng)
+        started = time.perf_counter()
+        response = _send(ctx, spec)
+        job_count = int(response.headers.get("X-Storage-Jobs", 0))
+        if scenario.name == "ai_diagnosis_job" and response.status_code == 202:
+            response, job_count = _wait_for_job(ctx, response, spec["user_id"])
+        elapsed = time.perf_counter() - started
+        if index is None:
+            return
+        latencies[index] = elapsed
+        jobs[index] = job_count
+        with lock:
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+            if response.status_code not in scenario.expected:
+                errors += 1
+
+    def worker(worker_index: int):
+        # シナリオ毎に乱数列を変え、前のシナリオと同じ本文（AI診断のキャッシュヒット）にならないようにする
+        rng = random.Random(f"{seed}:{scenario.name}:{worker_index}")
+        while True:
+            with lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            one(rng, index)
+
+    warmup_rng = random.Random(f"{seed}:{scenario.name}:warmup")
+    for _ in range(warmup):
+        one(warmup_rng, None)
+
+    model_calls = ctx.fake_model.calls
+    bigquery_jobs = ctx.fake_bigquery.jobs
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies_ms = latencies * 1000
+    return {
+        "name": scenario.name,
+        "description": scenario.description,
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2) if elapsed else None,
+        "errors": errors,
+        "status_counts": statuses,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies_ms, 50)), 2),
+            "p95": round(float(np.percentile(latencies_ms, 95)), 2),
+            "p99": round(float(np.percentile(latencies_ms, 99)), 2),
+            "mean": round(float(latencies_ms.mean()), 2),
+            "max": round(float(latencies_ms.max()), 2),
+        },
+        "storage_jobs_per_request": {
+            "mean": round(float(jobs.mean()), 3),
+            "max": int(jobs.max()),
+            # バックグラウンド処理（write-behindのフラッシュ、ジョブキュー）を含む実際のジョブ数
+            "backend_total": ctx.fake_bigquery.jobs - bigquery_jobs,
+        },
+        "model_calls": ctx.fake_model.calls - model_calls,
+        "rss_mb": round(rss_mb() or 0, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def create_context(args) -> BenchContext:
+    """代替クライアントでアプリを起動し、合成データをロードします。"""
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("AI_DIAGNOSIS_MAX_PENDING", str(max(args.concurrency * 4, 64)))
+    # Blueprint の読み込み（サービスの生成）より前にストレージバックエンドを差し替える
+    from src.core import db
+    from src.core.bigquery_backend import BigQueryBackend
+    from src.core.sqlite_backend import SQLiteBackend
+    from benchmarks.datasets import load_dataset
+    from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel, LatencyModel
+
+    sqlite = SQLiteBackend(args.db_path)
+    fake_bigquery = FakeBigQueryClient(
+        sqlite,
+        query_latency=LatencyModel(args.bq_latency_ms / 1000, args.bq_per_row_us / 1e6, args.jitter, args.seed),
+        insert_latency=LatencyModel(args.insert_latency_ms / 1000, 0, args.jitter, args.seed + 1),
+    )
+    started = time.perf_counter()
+    dataset = load_dataset(sqlite, activities=args.activities, users=args.users, days=args.days, seed=args.seed)
+    print(f"loaded {dataset.activities} activities for {args.users} users in {time.perf_counter() - started:.1f}s",
+          file=sys.stderr)
+    db._backend = BigQueryBackend(client=fake_bigquery)
+
+    from app import app
+    from src.api.v1 import weekly_reflections
+    from src.services.ai_model_client import VertexAIModelClient
+
+    fake_model = FakeGenerativeModel(LatencyModel(args.ai_latency_ms / 1000, 0, args.jitter, args.seed + 2))
+    if isinstance(weekly_reflections.service.model_client, VertexAIModelClient):
+        weekly_reflections.service.model_client._model = fake_model
+
+    if os.environ.get("DAILY_ROLLUPS_ENABLED", "").lower() in ("1", "true", "yes"):
+        weekly_reflections.service.rollups.rebuild()
+    return BenchContext(app, dataset, fake_bigquery, fake_model)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="エンドポイントのスループット・レイテンシを計測します")
+    parser.add_argument("--activities", type=int, default=10000, help="行動記録の総件数（1k〜10M）")
+    parser.add_argument("--users", type=int, default=10, help="ユーザー数（行動記録は均等に割り振る）")
+    parser.add_argument("--days", type=int, default=90, help="行動記録の期間（日）")
+    parser.add_argument("--db-path", default=":memory:", help="SQLiteのパス（大きなデータはファイルを推奨）")
+    parser.add_argument("--requests", type=int, default=200, help="シナリオ毎のリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同時実行数")
+    parser.add_argument("--warmup", type=int, default=5, help="計測前に実行するリクエスト数")
+    parser.add_argument("--scenarios", help="実行するシナリオ（カンマ区切り、省略時はすべて）")
+    parser.add_argument("--bq-latency-ms", type=float, default=50.0, help="BigQueryのクエリ1ジョブあたりの遅延")
+    parser.add_argument("--bq-per-row-us", type=float, default=0.0, help="結果1行あたりの追加遅延（マイクロ秒）")
+    parser.add_argument("--insert-latency-ms", type=float, default=30.0, help="挿入・ロード1回あたりの遅延")
+    parser.add_argument("--ai-latency-ms", type=float, default=1500.0, help="生成モデル1回あたりの遅延")
+    parser.add_argument("--jitter", type=float, default=0.2, help="遅延の揺らぎ（割合）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    parser.add_argument("--list", action="store_true", help="シナリオの一覧を表示して終了します")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:28} {scenario.description}")
+        return
+    selected = SCENARIOS
+    if args.scenarios:
+        names = {name.strip() for name in args.scenarios.split(",")}
+        unknown = names - {s.name for s in SCENARIOS}
+        if unknown:
+            parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+        selected = [s for s in SCENARIOS if s.name in names]
+
+    ctx = create_context(args)
+    results = []
+    for scenario in selected:
+        result = run_scenario(ctx, scenario, args.requests, args.concurrency, args.warmup, args.seed)
+        results.append(result)
+        latency = result["latency_ms"]
+        print(f"{scenario.name:28} rps={result['rps']:>8} p50={latency['p50']:>8}ms p95={latency['p95']:>8}ms "
+              f"p99={latency['p99']:>8}ms jobs/req={result['storage_jobs_per_request']['mean']:<6} "
+              f"errors={result['errors']}", file=sys.stderr)
+
+    report = {
+        "meta": {
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "list")},
+            "env": {key: value for key, value in os.environ.items() if key.startswith(RECORDED_ENV_PREFIXES)},
+        },
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "scenarios": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
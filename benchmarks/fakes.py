@@ -0,0 +1,170 @@
+"""
+ベンチマーク用の bigquery.Client / vertexai GenerativeModel の代替（プロセス内で完結し、遅延を注入できる）。
+
+FakeBigQueryClient はBigQuery標準SQLを SQLiteBackend で実行し、BigQueryBackend が使う範囲の
+QueryJob / LoadJob / insert_rows_json のインターフェースを再現します。遅延はSQLiteのロックの外で入れるため、
+同時実行時も実際のBigQueryと同様に待ち時間が重なります。
+"""
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+from src.core.sqlite_backend import SQLiteBackend
+from src.core.storage import QueryParameter
+
+
+class LatencyModel:
+    """1回あたりの固定遅延 + 行数に比例する遅延（± jitter の割合で揺らす）"""
+
+    def __init__(self, base_seconds: float = 0.0, per_row_seconds: float = 0.0, jitter: float = 0.0, seed: int = 0):
+        self.base_seconds = base_seconds
+        self.per_row_seconds = per_row_seconds
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self, rows: int = 0) -> float:
+        seconds = self.base_seconds + self.per_row_seconds * rows
+        if self.jitter and seconds:
+            with self._lock:
+                seconds *= self._random.uniform(1 - self.jitter, 1 + self.jitter)
+        return seconds
+
+    def sleep(self, rows: int = 0) -> float:
+        seconds = self.delay(rows)
+        if seconds > 0:
+            time.sleep(seconds)
+        return seconds
+
+
+class _RowIterator:
+    def __init__(self, rows: List[Dict[str, Any]], page_size: Optional[int]):
+        self._rows = rows
+        self._page_size = page_size or max(len(rows), 1)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self._rows)
+
+    @property
+    def pages(self) -> Iterator[List[Dict[str, Any]]]:
+        for start in range(0, len(self._rows), self._page_size):
+            yield self._rows[start:start + self._page_size]
+
+
+class FakeQueryJob:
+    """QueryJob のうち result() とジョブ統計のみを再現します。"""
+
+    def __init__(self, rows: List[Dict[str, Any]], num_dml_affected_rows: Optional[int], seconds: float,
+                 bytes_per_row: int):
+        self._rows = rows
+        self.num_dml_affected_rows = num_dml_affected_rows
+        # 実際の処理バイト数はスキャン量で決まるため、結果の行数からの概算
+        self.total_bytes_processed = len(rows) * bytes_per_row
+        self.slot_millis = int(seconds * 1000)
+        self.cache_hit = False
+
+    def result(self, page_size: Optional[int] = None) -> _RowIterator:
+        return _RowIterator(self._rows, page_size)
+
+
+class FakeLoadJob:
+    def __init__(self, output_rows: int):
+        self.output_rows = output_rows
+
+    def result(self) -> "FakeLoadJob":
+        return self
+
+
+# JSON型はクライアントがJSONテキストにエンコードし、サーバーが解釈する
+_API_VALUE_PARSERS = {"INT64": int, "FLOAT64": float, "BOOL": lambda v: v.lower() == "true", "JSON": json.loads}
+
+
+def _query_parameters(job_config) -> List[QueryParameter]:
+    # QueryJobConfig.query_parameters はAPI表現から型変換し直すため（DATE形式のTIMESTAMP等で失敗する）、
+    # API表現の文字列をそのまま SQLiteBackend に渡す
+    resource = getattr(job_config, "_properties", {}).get("query", {}).get("queryParameters", [])
+    params = []
+    for item in resource:
+        type_ = item["parameterType"]["type"]
+        value = item.get("parameterValue", {}).get("value")
+        if value is not None and type_ in _API_VALUE_PARSERS:
+            value = _API_VALUE_PARSERS[type_](value)
+        params.append(QueryParameter(item["name"], type_, value))
+    return params
+
+
+class FakeBigQueryClient:
+    """
+    bigquery.Client の代替。query / insert_rows_json / load_table_from_file を SQLiteBackend で実行します。
+    query_latency は1ジョブあたり（結果の行数に比例する分を含む）、insert_latency は挿入・ロード1回あたりの遅延。
+    """
+
+    def __init__(self, backend: SQLiteBackend, query_latency: Optional[LatencyModel] = None,
+                 insert_latency: Optional[LatencyModel] = None, bytes_per_row: int = 256):
+        self.backend = backend
+        self.query_latency = query_latency or LatencyModel()
+        self.insert_latency = insert_latency or LatencyModel()
+        self.bytes_per_row = bytes_per_row
+        self.jobs = 0
+        self._jobs_lock = threading.Lock()
+
+    def _count_job(self) -> None:
+        with self._jobs_lock:
+            self.jobs += 1
+
+    def query(self, sql: str, job_config=None) -> FakeQueryJob:
+        self._count_job()
+        result = self.backend._query(sql, _query_parameters(job_config))
+        seconds = self.query_latency.sleep(len(result.rows))
+        return FakeQueryJob(result.rows, result.num_dml_affected_rows, seconds, self.bytes_per_row)
+
+    def insert_rows_json(self, table_id: str, rows: List[Dict[str, Any]], row_ids=None) -> List[Dict[str, Any]]:
+        self._count_job()
+        self.insert_latency.sleep()
+        return self.backend._insert_rows(table_id, rows, row_ids)
+
+    def load_table_from_file(self, source, table_id: str, job_config=None) -> FakeLoadJob:
+        self._count_job()
+        self.insert_latency.sleep()
+        return FakeLoadJob(self.backend._load_ndjson(table_id, source))
+
+
+class _UsageMetadata(NamedTuple):
+    prompt_token_count: int
+    candidates_token_count: int
+
+
+class _Response(NamedTuple):
+    text: str
+    usage_metadata: Optional[_UsageMetadata]
+
+
+class FakeGenerativeModel:
+    """
+    vertexai.generative_models.GenerativeModel の代替。latency 秒後に固定のコメントを返します。
+    stream=True の場合は latency を断片数で按分して返します。トークン数は文字数からの概算。
+    """
+
+    COMMENT = "今週もよく頑張りましたね。疲れを感じたら早めに休み、できたことを大切にしていきましょう。"
+
+    def __init__(self, latency: Optional[LatencyModel] = None, chunk_chars: int = 8):
+        self.latency = latency or LatencyModel()
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self.calls += 1
+        usage = _UsageMetadata(len(prompt) // 2, len(self.COMMENT) // 2)
+        if not stream:
+            self.latency.sleep()
+            return _Response(self.COMMENT, usage)
+        return self._stream(usage)
+
+    def _stream(self, usage: _UsageMetadata) -> Iterator[_Response]:
+        chunks = [self.COMMENT[i:i + self.chunk_chars] for i in range(0, len(self.COMMENT), self.chunk_chars)]
+        total = self.latency.delay()
+        for i, chunk in enumerate(chunks):
+            time.sleep(total / len(chunks))
+            # 使用量は最後の応答にだけ付く
+            yield _Response(chunk, usage if i == len(chunks) - 1 else None)
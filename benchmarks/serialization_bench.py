@@ -0,0 +1,158 @@
+"""
+一覧応答のシリアライズのマイクロベンチマーク（ストレージ・HTTPを介さない）
+
+    python -m benchmarks.serialization_bench --rows 10000 --repeat 7 --output result.json
+
+バックエンドが返す形の行（日時は datetime）から応答の本文を作るまでを、次の2通りで計測します。
+    legacy: モデル → .dict() → 標準の json（Flask の DefaultJSONProvider、日時は werkzeug の http_date）
+    fast:   モデルをそのまま orjson でエンコード（src/core/json_provider.py）
+モデルの生成（build）は両方とも検証ありで、参考に検証なし（model_construct）の生成時間も出力します。
+段階毎（build / encode）と合計の時間、gzip 圧縮の時間とサイズをJSONで出力します。
+両方の本文をデコードした結果が一致することも確認します。
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from benchmarks.datasets import generate_activities
+from src.core.json_provider import dumps_bytes
+from src.models.activity import ActivityInDB
+from src.models.weekly_reflection import WeeklyReflectionInDB, WeeklyReflectionQuestion
+from src.services.weekly_reflection_service import WeeklyReflectionService
+
+
+def activity_rows(count: int, seed: int) -> List[Dict[str, Any]]:
+    """バックエンドが返す形（TIMESTAMP は datetime）の行動記録の行"""
+    rows = []
+    for row in generate_activities([str(uuid.UUID(int=1))], count, date(2025, 1, 6), max(count // 5, 1), seed=seed):
+        for key in ("start_time", "end_time", "created_at", "updated_at"):
+            row[key] = datetime.fromisoformat(row[key].replace("Z", "+00:00"))
+        rows.append(row)
+    return rows
+
+
+def reflection_rows(count: int) -> List[Dict[str, Any]]:
+    """バックエンドが返す形（questions は JSON 文字列）の週次振り返りの行"""
+    questions = json.dumps([{"text": f"設問{i}", "score": i % 5 + 1} for i in range(5)], ensure_ascii=False)
+    rows = []
+    for i in range(count):
+        created = datetime(2025, 1, 6) + timedelta(weeks=i)
+        rows.append({
+            "id": str(uuid.UUID(int=i + 1)), "user_id": str(uuid.UUID(int=1)),
+            "week_start_date": created.date(), "reflection_notes": "今週の振り返り " * 10, "title": f"第{i}週",
+            "questions": questions, "anxieties": "不安なこと", "good_things": "良かったこと",
+            "ai_diagnosis_result": "診断コメント " * 20, "weekly_total_load_points": 12.5,
+            "created_at": created, "updated_at": created,
+        })
+    return rows
+
+
+def _to_reflection(row: Dict[str, Any]) -> WeeklyReflectionInDB:
+    return WeeklyReflectionService._to_reflection(dict(row))
+
+
+def _construct_reflection(row: Dict[str, Any]) -> WeeklyReflectionInDB:
+    fields = dict(row, questions=[WeeklyReflectionQuestion.model_construct(**q) for q in json.loads(row["questions"])])
+    return WeeklyReflectionInDB.model_construct(**fields)
+
+
+def _timed(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"min_ms": round(min(samples), 2), "median_ms": round(statistics.median(samples), 2)}
+
+
+def bench_case(name: str, rows: List[Dict[str, Any]], build: Callable, construct: Callable,
+               repeat: int, gzip_level: int) -> Dict[str, Any]:
+    provider = DefaultJSONProvider(Flask(__name__))
+    models = [build(row) for row in rows]
+
+    def legacy_encode(items):
+        return provider.dumps([m.dict() for m in items]).encode("utf-8")
+
+    legacy_body = legacy_encode(models)
+    fast_body = dumps_bytes(models)
+    if json.loads(legacy_body) != json.loads(fast_body):
+        raise AssertionError(f"{name}: legacy and fast responses differ")
+
+    build_time = _timed(lambda: [build(row) for row in rows], repeat)
+    result = {
+        "name": name,
+        "rows": len(rows),
+        "build": build_time,
+        "build_without_validation": _timed(lambda: [construct(row) for row in rows], repeat),
+        "legacy": {
+            "encode": _timed(lambda: legacy_encode(models), repeat),
+            "total": _timed(lambda: legacy_encode([build(row) for row in rows]), repeat),
+            "bytes": len(legacy_body),
+        },
+        "fast": {
+            "encode": _timed(lambda: dumps_bytes(models), repeat),
+            "total": _timed(lambda: dumps_bytes([build(row) for row in rows]), repeat),
+            "bytes": len(fast_body),
+        },
+        "gzip": {
+            "level": gzip_level,
+            "compress": _timed(lambda: gzip.compress(fast_body, compresslevel=gzip_level, mtime=0), repeat),
+            "bytes": len(gzip.compress(fast_body, compresslevel=gzip_level, mtime=0)),
+        },
+    }
+    result["speedup"] = round(result["legacy"]["total"]["median_ms"] / result["fast"]["total"]["median_ms"], 2)
+    return result
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="一覧応答のシリアライズ時間を計測します")
+    parser.add_argument("--rows", type=int, default=10000, help="行動記録の行数")
+    parser.add_argument("--reflection-rows", type=int, default=1000, help="週次振り返りの行数")
+    parser.add_argument("--repeat", type=int, default=7, help="各計測の繰り返し回数")
+    parser.add_argument("--gzip-level", type=int, default=int(os.environ.get("RESPONSE_GZIP_LEVEL", "5")))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONの出力先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    cases = [
+        bench_case("activities", activity_rows(args.rows, args.seed), lambda row: ActivityInDB(**row),
+                   lambda row: ActivityInDB.model_construct(**row), args.repeat, args.gzip_level),
+        bench_case("weekly_reflections", reflection_rows(args.reflection_rows), _to_reflection,
+                   _construct_reflection, args.repeat, args.gzip_level),
+    ]
+    for case in cases:
+        legacy, fast = case["legacy"], case["fast"]
+        print(f"{case['name']:20} rows={case['rows']:<7} build={case['build']['median_ms']:>8}ms "
+              f"(no validation {case['build_without_validation']['median_ms']}ms) legacy={legacy['total']['median_ms']:>8}ms "
+              f"fast={fast['total']['median_ms']:>8}ms speedup={case['speedup']}x "
+              f"gzip={case['gzip']['compress']['median_ms']}ms {fast['bytes']}->{case['gzip']['bytes']}B",
+              file=sys.stderr)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "cases": cases,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
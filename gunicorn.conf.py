@@ -0,0 +1,112 @@
+"""
+本番用のgunicorn設定（gunicorn --config gunicorn.conf.py app:app）。
+
+リクエスト時間のほとんどはBigQuery・Vertex AIの応答待ちのため、ワーカー毎に複数スレッドの gthread を既定とし、
+ワーカー数・スレッド数の既定値はコンテナに割り当てられたCPU数とメモリ上限から決める（src/core/resources.py）。
+
+ワーカー間で共有されず、他のワーカーでの変更を見えなくする機能（行動記録の読み取りキャッシュ・:memory: のSQLite）が
+有効な場合、既定のワーカー数は1とし、2以上を指定した場合は起動しない。
+TTLで鮮度が保たれるキャッシュ（ユーザー情報のキャッシュ・データのバージョン）は対象外。
+
+*   GUNICORN_WORKER_CLASS: gthread（既定）| gevent | sync
+*   GUNICORN_WORKERS: ワーカー数（既定は min(CPU数, メモリ上限 / GUNICORN_WORKER_MEMORY_MB)）
+*   GUNICORN_WORKER_MEMORY_MB: 1ワーカーあたりの見込みメモリ（既定256）
+*   GUNICORN_THREADS: gthread のスレッド数（既定は CPU数 × 8 をワーカー数で分けた数、最低8）
+*   GUNICORN_WORKER_CONNECTIONS: gevent の同時接続数（既定200）
+*   GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT: 既定120秒 / 90秒（AI診断の応答待ちを考慮）
+*   GUNICORN_PRELOAD: マスターでアプリを読み込んでからforkする（既定true、gevent では false）
+*   GUNICORN_MAX_REQUESTS: 指定した件数を処理したワーカーを再起動する（既定0 = 無効）
+
+決定したワーカー数は WEB_CONCURRENCY に設定し、ワーカー内のプールの大きさの計算に使う（src/core/resources.py）。
+"""
+import logging
+import os
+import sys
+
+# 設定ファイルの読み込み時点ではアプリのディレクトリが sys.path に無いことがある
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.core.resources import default_threads, default_workers  # noqa: E402
+
+logger = logging.getLogger("gunicorn.error")
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def _env_bool(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return value.lower() in ("1", "true", "yes")
+
+
+def _per_process_features():
+    """
+    有効になっている、複数ワーカーでは正しく動かない機能（既定値は各 create_*_from_env と同じ）。
+    読み取りキャッシュは自ワーカーの書き込みだけを反映するため、他のワーカーで削除・更新された行を返し続ける。
+    """
+    features = []
+    if _env_int("ACTIVITY_CACHE_MAX_ROWS", 0) > 0:
+        features.append("ACTIVITY_CACHE_MAX_ROWS (activity range cache)")
+    if os.environ.get("STORAGE_BACKEND", "bigquery").lower() == "sqlite" and \
+            os.environ.get("SQLITE_DB_PATH", ":memory:") == ":memory:":
+        features.append("SQLITE_DB_PATH=:memory: (in-memory database)")
+    return features
+
+
+def _worker_class():
+    name = os.environ.get("GUNICORN_WORKER_CLASS", "gthread").lower()
+    if name == "gevent":
+        try:
+            import gevent  # noqa: F401
+        except ImportError:
+            logger.warning("gevent is not installed; falling back to gthread workers")
+            return "gthread"
+    return name
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+worker_class = _worker_class()
+if _per_process_features():
+    workers = _env_int("GUNICORN_WORKERS", 1)
+    if workers > 1:
+        # ワーカー毎に異なる内容を返す（他のワーカーでの変更が見えない）状態で動かさない
+        raise RuntimeError(
+            f"GUNICORN_WORKERS={workers} requires disabling per-process state: {', '.join(_per_process_features())}. "
+            "Set them to 0 (or use a file database), or run a single worker with threads."
+        )
+else:
+    workers = _env_int("GUNICORN_WORKERS", default_workers(_env_int("GUNICORN_WORKER_MEMORY_MB", 256) * 1024 * 1024))
+threads = _env_int("GUNICORN_THREADS", default_threads(workers)) if worker_class == "gthread" else 1
+# ワーカー内のプール（パスワードのハッシュ化等）がCPUをワーカー数で分け合えるよう、アプリの読み込み前に設定する
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_connections = _env_int("GUNICORN_WORKER_CONNECTIONS", 200)
+
+timeout = _env_int("GUNICORN_TIMEOUT", 120)
+graceful_timeout = _env_int("GUNICORN_GRACEFUL_TIMEOUT", 90)
+keepalive = _env_int("GUNICORN_KEEPALIVE", 5)
+
+# gevent はモンキーパッチ前に読み込んだモジュール（grpc等）と相性が悪いため、既定ではpreloadしない
+preload_app = _env_bool("GUNICORN_PRELOAD", worker_class != "gevent")
+max_requests = _env_int("GUNICORN_MAX_REQUESTS", 0)
+max_requests_jitter = _env_int("GUNICORN_MAX_REQUESTS_JITTER", max_requests // 10)
+
+accesslog = os.environ.get("GUNICORN_ACCESS_LOG", "-")
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+# コンテナでは /tmp がディスクのことがあるため、ハートビートはメモリ上に置く
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def when_ready(server):
+    server.log.info("gunicorn ready: worker_class=%s workers=%s threads=%s preload=%s",
+                    worker_class, workers, threads, preload_app)
+
+
+def post_worker_init(worker):
+    # 外部サービスへの接続はプロセス毎に持つため、fork後のワーカーで確立する
+    from app import warm_up
+    warm_up()
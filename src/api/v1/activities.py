@@ -1,26 +1,44 @@
-from flask import Blueprint, request, jsonify, session
+import io
+import logging
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from pydantic import ValidationError
 from src.models.activity import ActivityCreate, ActivityUpdate
 from src.services.activity_service import ActivityService
+from src.services.activity_import import IMPORT_FORMATS, read_records
+from src.services.data_export import ACTIVITY_EXPORT_COLUMNS, EXPORT_FORMATS, EXPORT_MIMETYPES, export_chunks
+from src.services.activity_cache import create_activity_cache_from_env
+from src.services.activity_write_buffer import create_write_buffer_from_env
+from src.services.daily_rollup_service import create_daily_rollup_service_from_env
+from src.services.data_version import create_data_versions_from_env
+from src.core.conditional import conditional_response
 from src.core.db import get_db_client
 
+logger = logging.getLogger(__name__)
+
 # これは一時的なものです。後で依存性注入のパターンにリファクタリングします。
 # TODO: テーブルIDを環境変数から取得するように修正
 TABLE_ID = "health-report-465810.health_data.activities"
 db_client = get_db_client()
-activity_service = ActivityService(db_client=db_client, table_id=TABLE_ID)
+activity_service = ActivityService(
+    db_client=db_client,
+    table_id=TABLE_ID,
+    write_buffer=create_write_buffer_from_env(db_client, TABLE_ID),
+    cache=create_activity_cache_from_env(),
+    rollups=create_daily_rollup_service_from_env(db_client),
+    versions=create_data_versions_from_env(TABLE_ID)
+)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 activities_bp = Blueprint('activities', __name__, url_prefix='/api/v1/activities')
 
 @activities_bp.route('', methods=['POST'])
 def create_activity_route():
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
-    print("=== POST /api/v1/activities 受信 ===")
-    print(request.json)
+    logger.debug("create_activity body: %s", request.json)
     try:
         activity_data = ActivityCreate(**request.json)
     except ValidationError as e:
@@ -30,28 +48,94 @@ def create_activity_route():
         return jsonify({"error": "Failed to create activity"}), 500
     return jsonify(new_activity.dict()), 201
 
+@activities_bp.route('/import', methods=['POST'])
+def import_activities_route():
+    """
+    NDJSONまたはCSVの行動記録を一括インポートする。
+    本文（またはmultipart/form-dataの file）を逐次読み込むため、アップロードの大きさによらずメモリ使用量は一定。
+    形式は ?format=ndjson|csv、省略時はContent-Typeから判定する。
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    upload = request.files.get('file')
+    mimetype = upload.mimetype if upload else request.mimetype
+    fmt = request.args.get('format') or ('csv' if mimetype in ('text/csv', 'application/csv') else 'ndjson')
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(IMPORT_FORMATS)}"}), 400
+    stream = io.TextIOWrapper(upload.stream if upload else request.stream, encoding='utf-8-sig', newline='')
+    try:
+        result = activity_service.import_activities(user_id=user_id, records=read_records(stream, fmt))
+    except UnicodeDecodeError:
+        return jsonify({"error": "upload must be UTF-8 encoded"}), 400
+    status = 200 if result.imported or not result.failed else 400
+    return jsonify(result.to_dict()), status
+
+@activities_bp.route('/export', methods=['GET'])
+def export_activities_route():
+    """
+    行動記録をNDJSONまたはCSVでストリーミング出力する（?format=ndjson|csv, start_date/end_date は一覧取得と同じ）。
+    結果は1ページずつ読み出して送信するため、履歴の長さによらずワーカーのメモリ使用量は一定。
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    pages = activity_service.iter_activity_pages(
+        user_id=user_id,
+        start_date=request.args.get('start_date'),
+        end_date=request.args.get('end_date')
+    )
+    return Response(
+        stream_with_context(export_chunks(pages, ACTIVITY_EXPORT_COLUMNS, fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=activities.{fmt}"}
+    )
+
 @activities_bp.route('', methods=['GET'])
 def get_activities_route():
-    print('=== [DEBUG] Activities API called ===')
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
-    print('=== [DEBUG] request.headers:', dict(request.headers))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
+    # データのバージョンが If-None-Match と一致する場合は、取得もシリアライズもせずに304を返す
+    return conditional_response(activity_service.data_version(user_id), lambda: _list_activities(user_id))
+
+def _list_activities(user_id):
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
+    # fields=id,start_time,... で返す列を絞り込む（一覧表示で activity_content 等を省く場合）
+    fields = [name.strip() for name in request.args['fields'].split(',') if name.strip()] if request.args.get('fields') else None
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    try:
+        if limit is not None or cursor is not None:
+            # limit / cursor 指定時は (start_time, id) のキーセットでページングする
+            limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+            items, next_cursor = activity_service.get_activity_page(
+                user_id=user_id, limit=limit, cursor=cursor,
+                start_date=start_date, end_date=end_date, fields=fields
+            )
+            return jsonify({"items": items, "next_cursor": next_cursor}), 200
+        if fields is not None:
+            return jsonify(activity_service.get_activities_by_user(
+                user_id=user_id, start_date=start_date, end_date=end_date, fields=fields
+            )), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     activities = activity_service.get_activities_by_user(
         user_id=user_id, 
         start_date=start_date, 
         end_date=end_date
     )
-    return jsonify([activity.dict() for activity in activities]), 200
+    # モデルは dict に変換せずに渡す（JSONプロバイダがフィールドを直接エンコードする）
+    return jsonify(activities), 200
 
 @activities_bp.route('/<activity_id>', methods=['GET'])
 def get_activity_route(activity_id):
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
@@ -62,8 +146,6 @@ def get_activity_route(activity_id):
 
 @activities_bp.route('/<activity_id>', methods=['PATCH'])
 def update_activity_route(activity_id):
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
@@ -78,8 +160,6 @@ def update_activity_route(activity_id):
 
 @activities_bp.route('/<activity_id>', methods=['DELETE'])
 def delete_activity_route(activity_id):
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
@@ -0,0 +1,57 @@
+import os
+from datetime import datetime, timedelta
+from flask import Blueprint, jsonify, request, session
+from src.api.v1.activities import activity_service
+from src.api.v1.weekly_reflections import service as reflection_service
+from src.core.executor import get_fanout_executor
+from src.core.table_layout import utc_day_range
+
+dashboard_bp = Blueprint('dashboard', __name__, url_prefix='/api/v1/dashboard')
+
+fanout = get_fanout_executor()
+
+# 処理毎のタイムアウト（秒）。DASHBOARD_PART_TIMEOUTS=activities=5,load_summary=8 のように個別に上書きできる
+DEFAULT_PART_TIMEOUT = float(os.environ.get("DASHBOARD_PART_TIMEOUT_SECONDS", "10"))
+PART_TIMEOUTS = {
+    name.strip(): float(seconds)
+    for name, _, seconds in (item.partition("=") for item in os.environ.get("DASHBOARD_PART_TIMEOUTS", "").split(","))
+    if name.strip() and seconds
+}
+
+
+@dashboard_bp.route('', methods=['GET'])
+def get_weekly_dashboard_route():
+    """
+    週表示に必要な行動記録・週次振り返り・週次負荷サマリーを1回のリクエストで返す（?week_start_date=YYYY-MM-DD）。
+    3つの取得は共有のスレッドプールで並列に行うため、応答時間は最も遅い取得で決まる。
+    失敗・タイムアウトした部分は null にして errors に理由を入れ、取得できた部分だけで応答する（すべて失敗した場合は503）。
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    week_start_date = request.args.get('week_start_date')
+    if not week_start_date:
+        return jsonify({"error": "week_start_date is required"}), 400
+    try:
+        week_start = datetime.strptime(week_start_date, '%Y-%m-%d').date()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # 一覧取得と同じ条件（週の初日0時以降に始まり、翌週の初日0時までに終わる行動記録）
+    start, end = utc_day_range(week_start, week_start + timedelta(days=6))
+
+    # 各処理はリクエスト・セッションを引き継がずに実行されるため（src/core/executor.py）、入力はここで解決した値だけを使う
+    def weekly_reflection():
+        reflections = reflection_service.get_weekly_reflections(user_id=user_id, week_start_date=week_start.isoformat())
+        return reflections[0] if reflections else None
+
+    results = fanout.run("dashboard", {
+        "activities": lambda: activity_service.get_activities_by_user(user_id=user_id, start_date=start, end_date=end),
+        "reflection": weekly_reflection,
+        "load_summary": lambda: reflection_service.get_weekly_load_summary(user_id=user_id, week_start_date=week_start),
+    }, timeouts=PART_TIMEOUTS, default_timeout=DEFAULT_PART_TIMEOUT)
+
+    body = {"week_start_date": week_start.isoformat()}
+    body.update({name: result.value for name, result in results.items()})
+    body["errors"] = {name: result.error for name, result in results.items() if result.error}
+    status = 503 if len(body["errors"]) == len(results) else 200
+    return jsonify(body), status
@@ -1,17 +1,28 @@
 from flask import Blueprint, request, jsonify, session
-from google.cloud import bigquery
 from src.services.user_service import UserService
-import bcrypt
+from src.services.user_cache import create_user_cache_from_env
+from src.core.db import get_db_client
+from src.auth.password_hasher import HasherBusyError, create_password_hasher_from_env
+import logging
 import uuid
 from datetime import datetime
 from functools import wraps
 
 bp = Blueprint('users', __name__)
+logger = logging.getLogger(__name__)
 
 # UserServiceインスタンス生成
-bq_client = bigquery.Client()
+db_client = get_db_client()
 table_id = 'health-report-465810.health_data.users'
-user_service = UserService(bq_client, table_id)
+user_service = UserService(db_client, table_id, cache=create_user_cache_from_env())
+# bcryptは専用のワーカープールで実行する（同時実行数・待ち時間に上限を設ける）
+password_hasher = create_password_hasher_from_env()
+
+
+def _busy_response(e: HasherBusyError):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = '1'
+    return response, 503
 
 def login_required(f):
     @wraps(f)
@@ -35,7 +46,10 @@ def register():
         return jsonify({'error': 'username already exists'}), 400
 
     # パスワードハッシュ化
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        password_hash = password_hasher.hash(password)
+    except HasherBusyError as e:
+        return _busy_response(e)
 
     user_id = str(uuid.uuid4())
     now = datetime.utcnow().isoformat()
@@ -62,25 +76,41 @@ def login():
         return jsonify({'error': 'invalid username or password'}), 401
 
     # パスワード照合
-    if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-        return jsonify({'error': 'invalid username or password'}), 401
+    try:
+        if not password_hasher.verify(password, user['password_hash']):
+            return jsonify({'error': 'invalid username or password'}), 401
+    except HasherBusyError as e:
+        return _busy_response(e)
+
+    # 古いコストで作られたハッシュは、平文のパスワードがある今のうちに作り直す（失敗してもログインは続ける）
+    if password_hasher.needs_rehash(user['password_hash']):
+        try:
+            user_service.update_password_hash(user['id'], password_hasher.hash(password))
+        except Exception:
+            logger.warning("Failed to upgrade password hash for user %s", user['id'], exc_info=True)
 
-    # セッションにuser_idを保存
+    # セッションにuser_idとusernameを保存（/session はセッションだけで応答する）
     session['user_id'] = user['id']
+    session['username'] = user['username']
     return jsonify({'message': 'login successful', 'user_id': user['id'], 'username': user['username']}), 200
 
 @bp.route('/logout', methods=['GET', 'POST'])
 def logout():
     session.pop('user_id', None)
+    session.pop('username', None)
     return jsonify({'message': 'logout successful'}), 200
 
 @bp.route('/session', methods=['GET'])
 def session_status():
     user_id = session.get('user_id')
     if user_id:
-        # ユーザー名も返す
-        user = user_service.get_user_by_username_or_id(user_id)
-        username = user['username'] if user else None
+        # ユーザー名も返す（usernameを保存する前に発行されたセッションのみ取得してセッションに保存する）
+        username = session.get('username')
+        if username is None:
+            user = user_service.get_user_by_id(user_id)
+            username = user['username'] if user else None
+            if username is not None:
+                session['username'] = username
         return jsonify({'logged_in': True, 'user_id': user_id, 'username': username}), 200
     else:
         return jsonify({'logged_in': False}), 200 
\ No newline at end of file
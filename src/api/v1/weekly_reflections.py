@@ -1,26 +1,41 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, request, jsonify, session, stream_with_context
 from src.services.weekly_reflection_service import WeeklyReflectionService
+from src.services.daily_rollup_service import create_daily_rollup_service_from_env
+from src.services.ai_model_client import create_model_client_from_env
+from src.services.ai_diagnosis_cache import create_diagnosis_cache_from_env
+from src.services.ai_diagnosis_queue import QueueFullError, create_diagnosis_queue_from_env
+from src.services.data_version import create_data_versions_from_env
+from src.services.data_export import EXPORT_FORMATS, EXPORT_MIMETYPES, REFLECTION_EXPORT_COLUMNS, export_chunks
 from src.models.weekly_reflection import WeeklyReflectionCreate
 from src.api.v1.users import login_required
-from google.cloud import bigquery
-from datetime import datetime, timedelta
+from src.api.v1.activities import activity_service
+from src.core.conditional import conditional_response
+from src.core.db import get_db_client
+from datetime import datetime
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 weekly_reflections_bp = Blueprint('weekly_reflections', __name__, url_prefix='/api/v1/weekly-reflections')
 
-# BigQueryクライアントとテーブルID（本番ではDIや設定ファイルで管理）
-db_client = bigquery.Client()
+# ストレージバックエンドとテーブルID（本番ではDIや設定ファイルで管理）
+db_client = get_db_client()
 table_id = 'health-report-465810.health_data.WeeklyReflections'  # 実際のBigQueryテーブルIDに修正
-service = WeeklyReflectionService(db_client, table_id)
-
-def get_week_dates(week_start_date):
-    # 週の開始日から7日分の日付リストを返す
-    start = datetime.strptime(week_start_date, '%Y-%m-%d')
-    return [(start + timedelta(days=i)).date() for i in range(7)]
+service = WeeklyReflectionService(
+    db_client,
+    table_id,
+    rollups=create_daily_rollup_service_from_env(db_client),
+    activity_service=activity_service,  # 負荷集計は行動記録の読み取りキャッシュを共有する
+    model_client=create_model_client_from_env(),
+    diagnosis_cache=create_diagnosis_cache_from_env(),
+    versions=create_data_versions_from_env(table_id)
+)
+# AI診断はバックグラウンドのワーカープールで実行し、HTTPワーカーを占有しない
+diagnosis_queue = create_diagnosis_queue_from_env(db_client, service.generate_ai_diagnosis)
 
 @weekly_reflections_bp.route('/ai-diagnosis', methods=['POST'])
 def ai_diagnosis_route():
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
@@ -33,25 +48,86 @@ def ai_diagnosis_route():
     except Exception as e:
         return jsonify({"error": str(e)}), 400
 
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@weekly_reflections_bp.route('/ai-diagnosis/stream', methods=['POST'])
+def ai_diagnosis_stream_route():
+    """
+    AI診断コメントをServer-Sent Eventsで逐次返す。
+    event: chunk    data: {"text": 断片}
+    event: complete data: {"ai_comment": 全文}（保存時はこの値を使う）
+    event: error    data: {"type": "generation_failed", "message": 詳細}
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    try:
+        req_json = request.get_json()
+        data = WeeklyReflectionCreate(**req_json)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    inputs = data.dict(include={"title", "questions", "anxieties", "good_things"})
+
+    def events():
+        chunks = []
+        try:
+            for chunk in service.stream_ai_diagnosis(inputs):
+                chunks.append(chunk)
+                yield _sse_event("chunk", {"text": chunk})
+        except Exception as e:
+            logger.exception("AI diagnosis stream failed")
+            yield _sse_event("error", {"type": "generation_failed", "message": str(e)})
+            return
+        yield _sse_event("complete", {"ai_comment": "".join(chunks).strip()})
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        # プロキシでバッファリングされないようにする
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@weekly_reflections_bp.route('/ai-diagnosis/jobs', methods=['POST'])
+def submit_ai_diagnosis_job_route():
+    """AI診断をジョブとして受け付け、すぐにジョブIDを返す（結果は GET /ai-diagnosis/jobs/<job_id> で取得）"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    try:
+        req_json = request.get_json()
+        data = WeeklyReflectionCreate(**req_json)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        job = diagnosis_queue.submit(user_id, data.dict(include={"title", "questions", "anxieties", "good_things"}))
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 503
+    return jsonify(job), 202
+
+@weekly_reflections_bp.route('/ai-diagnosis/jobs/<job_id>', methods=['GET'])
+def get_ai_diagnosis_job_route(job_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    job = diagnosis_queue.get(job_id, user_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job), 200
+
 @weekly_reflections_bp.route('', methods=['POST'])
 def upsert_weekly_reflection_route():
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
     try:
         req_json = request.get_json()
-        print('=== [DEBUG] Request JSON:', req_json)
+        logger.debug("upsert_weekly_reflection body: %s", req_json)
         data = WeeklyReflectionCreate(**req_json)
-        print('=== [DEBUG] Parsed data:', data.dict())
         saved = service.upsert_weekly_reflection(user_id=user_id, data=data)
         return jsonify({"message": "保存しました", "data": saved.dict()}), 201
     except Exception as e:
-        import traceback
-        print(f"=== [ERROR] Exception in upsert_weekly_reflection_route: {str(e)} ===")
-        print(f"=== [ERROR] Traceback: {traceback.format_exc()} ===")
-        
+        logger.exception("upsert_weekly_reflection failed")
         # BigQueryストリーミングバッファーエラーの検出
         error_message = str(e)
         if "streaming buffer" in error_message.lower():
@@ -63,27 +139,20 @@ def upsert_weekly_reflection_route():
 
 @weekly_reflections_bp.route('', methods=['GET'])
 def get_weekly_reflections_route():
-    print('=== [DEBUG] Weekly Reflections API called ===')
-    print('=== [DEBUG] session:', dict(session))
-    print('=== [DEBUG] session["user_id"]:', session.get('user_id'))
-    print('=== [DEBUG] request.headers:', dict(request.headers))
-    print('=== [DEBUG] request.args:', dict(request.args))
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({"error": "認証情報がありません"}), 401
+    # データのバージョンが If-None-Match と一致する場合は、取得もシリアライズもせずに304を返す
+    return conditional_response(service.data_version(user_id), lambda: _list_weekly_reflections(user_id))
+
+def _list_weekly_reflections(user_id):
     try:
-        # デバッグ用：現在のユーザーIDをログ出力
-        print(f"=== [DEBUG] Current user_id: {user_id} ===")
-        
         # クエリパラメータで週の開始日を指定可能（例: ?week_start_date=2024-07-01）
         week_start_date = request.args.get('week_start_date')
-        print(f"=== [DEBUG] week_start_date: {week_start_date} ===")
         reflections = service.get_weekly_reflections(user_id=user_id, week_start_date=week_start_date)
-        return jsonify([r.dict() for r in reflections]), 200
+        return jsonify(reflections), 200
     except Exception as e:
-        print(f"=== [ERROR] Exception in weekly reflections API: {str(e)} ===")
-        import traceback
-        traceback.print_exc()
+        logger.exception("get_weekly_reflections failed")
         return jsonify({"error": str(e)}), 400 
 
 @weekly_reflections_bp.route('/weekly-load-summary', methods=['GET'])
@@ -95,42 +164,43 @@ def get_weekly_load_summary():
     if not week_start_date:
         return jsonify({"error": "week_start_date is required"}), 400
 
-    # BigQueryクエリで週次合計と日別サマリーを取得
-    db_client = bigquery.Client()
-    activities_table_id = 'health-report-465810.health_data.activities'
-    week_dates = get_week_dates(week_start_date)
-    week_end_date = week_dates[-1]
-
-    # 日別サマリー
-    query = f"""
-    SELECT DATE(start_time) as date,
-           SUM(TIMESTAMP_DIFF(end_time, start_time, MINUTE)) as activity_minutes,
-           SUM(fatigue_level * (TIMESTAMP_DIFF(end_time, start_time, MINUTE) / 60.0)) as load_points
-    FROM `{activities_table_id}`
-    WHERE user_id = @user_id
-      AND DATE(start_time) BETWEEN @week_start_date AND @week_end_date
-      AND category_id IN ('business', 'study', 'private')
-    GROUP BY date
-    ORDER BY date
-    """
-    job_config = bigquery.QueryJobConfig(
-        query_parameters=[
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-            bigquery.ScalarQueryParameter("week_start_date", "DATE", week_start_date),
-            bigquery.ScalarQueryParameter("week_end_date", "DATE", str(week_end_date)),
-        ]
+    # 週次合計と日別サマリーを取得
+    week_start = datetime.strptime(week_start_date, '%Y-%m-%d').date()
+    return jsonify(service.get_weekly_load_summary(user_id=user_id, week_start_date=week_start))
+
+@weekly_reflections_bp.route('/load-trends', methods=['GET'])
+def get_load_trends():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    week_start_date = request.args.get('week_start_date')
+    if not week_start_date:
+        return jsonify({"error": "week_start_date is required"}), 400
+    try:
+        week_start = datetime.strptime(week_start_date, '%Y-%m-%d').date()
+        weeks = int(request.args.get('weeks', 4))
+        window = int(request.args.get('window', 7))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not 1 <= weeks <= 52 or not 1 <= window <= 28:
+        return jsonify({"error": "weeks must be 1-52 and window must be 1-28"}), 400
+
+    # 直近N週の週次合計・日別推移（移動合計）・カテゴリ別時間・ピーク日を1回の取得で計算
+    return jsonify(service.get_load_trends(user_id=user_id, week_start_date=week_start, weeks=weeks,
+                                           rolling_window=window))
+
+@weekly_reflections_bp.route('/export', methods=['GET'])
+def export_weekly_reflections_route():
+    """週次振り返りをNDJSONまたはCSVでストリーミング出力する（?format=ndjson|csv）"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "認証情報がありません"}), 401
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    pages = service.iter_reflection_pages(user_id=user_id)
+    return Response(
+        stream_with_context(export_chunks(pages, REFLECTION_EXPORT_COLUMNS, fmt)),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=weekly_reflections.{fmt}"}
     )
-    results = list(db_client.query(query, job_config=job_config).result())
-    daily = []
-    total_load_points = 0
-    for row in results:
-        daily.append({
-            "date": str(row["date"]),
-            "activity_minutes": int(row["activity_minutes"] or 0),
-            "load_points": float(row["load_points"] or 0)
-        })
-        total_load_points += float(row["load_points"] or 0)
-    return jsonify({
-        "total_load_points": total_load_points,
-        "daily": daily
-    }) 
\ No newline at end of file
@@ -0,0 +1,206 @@
+"""
+パスワードのハッシュ化・照合（bcrypt）を専用のワーカープールで実行します。
+
+bcrypt は1回あたり数百ミリ秒のCPUを使うため、リクエストのスレッドで直接実行すると
+ログインの集中（クレデンシャルスタッフィング等）で他のルートまで処理できなくなります。
+同時実行数を max_workers に制限し、実行枠を queue_timeout 秒以上待つ・待ちが max_pending 件を超える場合は
+HasherBusyError で拒否します（ルートは503を返す）。
+
+プールはgunicornのワーカー毎に作られるため、既定の並列数と待ち件数はコンテナのCPU数・待ち件数をワーカー数で割った値にします。
+既定の待ち時間は、実測した1回あたりの処理時間から「待ちが上限いっぱいのときに順番が回ってくるまでの時間」として求めるため、
+拒否（503）は待ち件数が上限を超えた場合、つまり実際に処理能力を超えた場合にだけ起きます。
+"""
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+import bcrypt
+from src.core.metrics import REGISTRY
+from src.core.resources import cpus_per_worker, web_concurrency
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = REGISTRY.gauge("password_hasher_queue_depth", "実行待ち・実行中のパスワードのハッシュ化・照合の件数")
+WAIT_SECONDS = REGISTRY.histogram(
+    "password_hasher_wait_seconds", "実行枠の待ち時間（秒）",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5),
+)
+RUN_SECONDS = REGISTRY.histogram(
+    "password_hasher_seconds", "ハッシュ化・照合の実行時間（待ち時間を含まない、秒）", ("operation",),
+    buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 1, 2),
+)
+REJECTED = REGISTRY.counter("password_hasher_rejected_total", "混雑により拒否した件数", ("operation",))
+
+BUSY_MESSAGE = "ログイン処理が混雑しています。しばらくしてから再度お試しください。"
+# コンテナ全体での実行待ちの上限（ワーカー数で割ってワーカー毎の max_pending にする）
+DEFAULT_MAX_PENDING = 32
+# 実行枠の待ち時間の下限（秒）と、実測前に見込む cost 12 の1回あたりの処理時間（秒）
+MIN_QUEUE_TIMEOUT = 5.0
+ESTIMATED_SECONDS_AT_COST_12 = 0.3
+# 実測した処理時間の指数移動平均の重み
+SMOOTHING = 0.2
+_ROUNDS_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class HasherBusyError(Exception):
+    """パスワード処理の実行枠が空かない"""
+
+
+def hash_rounds(password_hash: str) -> Optional[int]:
+    """bcryptハッシュのコスト（$2b$12$... の 12）。bcrypt形式でない場合は None。"""
+    match = _ROUNDS_RE.match(password_hash)
+    return int(match.group(1)) if match else None
+
+
+# ワーカープロセスで実行する関数（pickleできるようモジュールのトップレベルに置く）
+def _hashpw(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def _checkpw(password: bytes, password_hash: bytes) -> bool:
+    return bcrypt.checkpw(password, password_hash)
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+class PasswordHasher:
+    """
+    bcrypt のハッシュ化・照合を最大 max_workers 並列で実行します。
+    use_processes=True の場合はプロセスプール（forkserver、無ければ spawn で起動）、False の場合はスレッドプールを使います。
+    プールはプロセス毎（gunicornのワーカー毎）に初回の利用時に生成します。
+    queue_timeout が None の場合は、実測した処理時間から実行枠の待ち時間を決めます（queue_timeout_seconds）。
+    """
+
+    def __init__(self, rounds: int = 12, max_workers: int = 2, max_pending: int = 32,
+                 queue_timeout: Optional[float] = None, use_processes: bool = True):
+        self.rounds = rounds
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self.use_processes = use_processes
+        self._hash_seconds = ESTIMATED_SECONDS_AT_COST_12 * 2 ** (rounds - 12)
+        self._slots = threading.BoundedSemaphore(max_workers)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._executor: Optional[Executor] = None
+        self._owner_pid: Optional[int] = None
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                # fork後は親のプール（ワーカープロセス・管理スレッド）を使えないため作り直す
+                self._slots = threading.BoundedSemaphore(self.max_workers)
+                self._pending = 0
+                self._executor = None
+                self._owner_pid = os.getpid()
+            if self._executor is None:
+                if self.use_processes:
+                    # マルチスレッドのワーカーからの fork を避ける
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+                    self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hasher")
+            return self._executor
+
+    @property
+    def hash_seconds(self) -> float:
+        """1回あたりの処理時間（実測の指数移動平均、実測前は cost からの見込み）"""
+        return self._hash_seconds
+
+    def _observe(self, seconds: float) -> None:
+        with self._lock:
+            self._hash_seconds += SMOOTHING * (seconds - self._hash_seconds)
+
+    def queue_timeout_seconds(self) -> float:
+        """
+        実行枠を待つ時間の上限。待ちが max_pending 件あるときに順番が回ってくるまでの時間
+        （max_pending / max_workers + 1 回分の処理時間）とし、MIN_QUEUE_TIMEOUT 秒を下回らないようにします。
+        """
+        if self.queue_timeout is not None:
+            return self.queue_timeout
+        rounds = self.max_pending / self.max_workers + 1
+        return max(MIN_QUEUE_TIMEOUT, rounds * self._hash_seconds)
+
+    def _run(self, operation: str, fn: Callable[..., Any], *args) -> Any:
+        executor = self._get_executor()
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_pending:
+                REJECTED.inc(operation=operation)
+                raise HasherBusyError(BUSY_MESSAGE)
+            self._pending += 1
+            QUEUE_DEPTH.set(self._pending)
+        try:
+            waited = time.perf_counter()
+            if not self._slots.acquire(timeout=self.queue_timeout_seconds()):
+                REJECTED.inc(operation=operation)
+                raise HasherBusyError(BUSY_MESSAGE)
+            WAIT_SECONDS.observe(time.perf_counter() - waited)
+            try:
+                started = time.perf_counter()
+                result = executor.submit(fn, *args).result()
+                elapsed = time.perf_counter() - started
+                RUN_SECONDS.observe(elapsed, operation=operation)
+                self._observe(elapsed)
+                return result
+            except BrokenProcessPool:
+                # ワーカープロセスが異常終了した場合は、次回の呼び出しでプールを作り直す
+                logger.exception("Password hasher pool is broken; recreating")
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+                raise
+            finally:
+                self._slots.release()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                QUEUE_DEPTH.set(self._pending)
+
+    def hash(self, password: str) -> str:
+        return self._run("hash", _hashpw, password.encode("utf-8"), self.rounds).decode("utf-8")
+
+    def verify(self, password: str, password_hash: str) -> bool:
+        return self._run("verify", _checkpw, password.encode("utf-8"), password_hash.encode("utf-8"))
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """現在の設定より低いコストで作られたハッシュか（ログイン時に作り直す）"""
+        rounds = hash_rounds(password_hash)
+        return rounds is not None and rounds < self.rounds
+
+    def warm_up(self) -> None:
+        """
+        ワーカーを起動しておきます（プロセスプールの起動とbcryptのインポートを最初のログインで待たないため）。
+        あわせて1回ハッシュ化して処理時間を測り、実行枠の待ち時間の計算に使います。
+        """
+        executor = self._get_executor()
+        for future in [executor.submit(_ping) for _ in range(self.max_workers)]:
+            future.result()
+        started = time.perf_counter()
+        executor.submit(_hashpw, b"warm-up", self.rounds).result()
+        with self._lock:
+            self._hash_seconds = time.perf_counter() - started
+        logger.info("Password hasher: workers=%d max_pending=%d hash_seconds=%.3f queue_timeout=%.1f",
+                    self.max_workers, self.max_pending, self._hash_seconds, self.queue_timeout_seconds())
+
+
+def create_password_hasher_from_env() -> PasswordHasher:
+    """
+    既定の並列数は1ワーカーあたりのCPU数（CPU数 / gunicornのワーカー数）、待ち件数は DEFAULT_MAX_PENDING をワーカー数で割った値。
+    PASSWORD_HASHER_QUEUE_TIMEOUT_SECONDS を指定しない場合、待ち時間は実測した処理時間から決めます。
+    """
+    queue_timeout = os.environ.get("PASSWORD_HASHER_QUEUE_TIMEOUT_SECONDS")
+    return PasswordHasher(
+        rounds=int(os.environ.get("BCRYPT_ROUNDS", "12")),
+        max_workers=int(os.environ.get("PASSWORD_HASHER_WORKERS") or cpus_per_worker()),
+        max_pending=int(os.environ.get("PASSWORD_HASHER_MAX_PENDING") or max(1, DEFAULT_MAX_PENDING // web_concurrency())),
+        queue_timeout=float(queue_timeout) if queue_timeout else None,
+        use_processes=os.environ.get("PASSWORD_HASHER_EXECUTOR", "process").lower() != "thread",
+    )
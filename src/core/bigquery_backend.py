@@ -0,0 +1,52 @@
+from google.cloud import bigquery
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence
+from src.core.storage import QueryParameter, QueryResult, StorageBackend
+
+
+class BigQueryBackend(StorageBackend):
+    """BigQueryクライアントをラップするストレージバックエンド"""
+
+    def __init__(self, client: Optional[bigquery.Client] = None):
+        # 未指定の場合は、プロセス共通のクライアントを初回のクエリ時に取得する
+        self._client = client
+
+    @property
+    def client(self) -> bigquery.Client:
+        if self._client is not None:
+            return self._client
+        from src.core.clients import get_client_registry
+        return get_client_registry().bigquery_client()
+
+    @staticmethod
+    def _to_bq_params(params: Optional[Sequence[QueryParameter]]) -> List[bigquery.ScalarQueryParameter]:
+        return [bigquery.ScalarQueryParameter(p.name, p.type_, p.value) for p in params or []]
+
+    def _query(self, sql: str, params: Optional[Sequence[QueryParameter]]) -> QueryResult:
+        job_config = bigquery.QueryJobConfig(query_parameters=self._to_bq_params(params))
+        query_job = self.client.query(sql, job_config=job_config)
+        rows = [dict(row.items()) for row in query_job.result()]
+        return QueryResult(
+            rows,
+            num_dml_affected_rows=query_job.num_dml_affected_rows,
+            total_bytes_processed=query_job.total_bytes_processed,
+            slot_millis=query_job.slot_millis,
+            cache_hit=query_job.cache_hit,
+        )
+
+    def _iter_query_pages(self, sql: str, params: Optional[Sequence[QueryParameter]],
+                          page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        job_config = bigquery.QueryJobConfig(query_parameters=self._to_bq_params(params))
+        row_iterator = self.client.query(sql, job_config=job_config).result(page_size=page_size)
+        return ([dict(row.items()) for row in page] for page in row_iterator.pages)
+
+    def _insert_rows(self, table_id: str, rows: List[Dict[str, Any]], row_ids: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        return self.client.insert_rows_json(table_id, rows, row_ids=row_ids)
+
+    def _load_ndjson(self, table_id: str, source: BinaryIO) -> int:
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        load_job = self.client.load_table_from_file(source, table_id, job_config=job_config)
+        load_job.result()
+        return load_job.output_rows or 0
@@ -0,0 +1,112 @@
+"""
+プロセス共通の外部サービスクライアント（BigQuery / Vertex AI）のレジストリ。
+クライアントは初回利用時に1度だけ生成し、全Blueprint・サービスで共有します。
+fork後（gunicornのワーカー等）はHTTPコネクションを親と共有しないよう、プロセス毎に作り直します。
+"""
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+GCP_PROJECT_ID = os.environ.get("GCP_PROJECT_ID", "health-report-465810")
+GCP_LOCATION = os.environ.get("GCP_LOCATION", "us-central1")
+
+
+class ClientRegistry:
+    def __init__(self, project_id: str = GCP_PROJECT_ID, location: str = GCP_LOCATION,
+                 http_pool_size: Optional[int] = None):
+        self.project_id = project_id
+        self.location = location
+        # BigQuery APIへのHTTPコネクションプールの大きさ（同時にクエリを発行するスレッド数以上にする）
+        self.http_pool_size = http_pool_size or int(os.environ.get("GCP_HTTP_POOL_SIZE", "20"))
+        self._lock = threading.Lock()
+        self._owner_pid: Optional[int] = None
+        self._bigquery = None
+        self._vertexai_initialized = False
+        self.init_seconds: Dict[str, float] = {}
+
+    def _check_pid_locked(self) -> None:
+        if self._owner_pid != os.getpid():
+            self._bigquery = None
+            self._vertexai_initialized = False
+            self._owner_pid = os.getpid()
+
+    def bigquery_client(self):
+        """共有の bigquery.Client（HTTPコネクションプールの大きさは GCP_HTTP_POOL_SIZE）"""
+        with self._lock:
+            self._check_pid_locked()
+            if self._bigquery is None:
+                started = time.perf_counter()
+                self._bigquery = self._create_bigquery_client()
+                self.init_seconds["bigquery"] = time.perf_counter() - started
+            return self._bigquery
+
+    def _create_bigquery_client(self):
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from google.cloud import bigquery
+        from requests.adapters import HTTPAdapter
+
+        credentials, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+        session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_connections=self.http_pool_size, pool_maxsize=self.http_pool_size)
+        session.mount("https://", adapter)
+        # TODO: 認証情報を環境変数から読み込む
+        # Cloud Run環境では、サービスアカウントが自動的に認証情報を提供するため、
+        # 明示的な認証情報の設定は不要な場合が多いですが、プロジェクトIDは明示的に指定します。
+        return bigquery.Client(project=self.project_id, credentials=credentials, _http=session)
+
+    def ensure_vertexai(self) -> None:
+        """vertexai.init をプロセス内で1度だけ実行します。"""
+        with self._lock:
+            self._check_pid_locked()
+            if self._vertexai_initialized:
+                return
+            started = time.perf_counter()
+            import vertexai
+            vertexai.init(project=self.project_id, location=self.location)
+            self._vertexai_initialized = True
+            self.init_seconds["vertexai"] = time.perf_counter() - started
+
+    def warm_up(self) -> Dict[str, Any]:
+        """
+        トラフィックを受ける前に、認証トークンの取得とコネクションの確立を済ませます。
+        失敗しても起動は止めず、結果を返します。
+        """
+        from src.core.db import get_db_client
+        from src.core.storage import StorageBackend
+        results: Dict[str, Any] = {}
+        started = time.perf_counter()
+        try:
+            backend: StorageBackend = get_db_client()
+            backend.query("SELECT 1 AS ok")
+            results["storage"] = "ok"
+        except Exception as e:
+            logger.warning("Storage warm-up failed: %s", e)
+            results["storage"] = f"failed: {e}"
+        if os.environ.get("AI_MODEL_CLIENT", "vertex").lower() != "stub":
+            try:
+                self.ensure_vertexai()
+                results["vertexai"] = "ok"
+            except Exception as e:
+                logger.warning("Vertex AI warm-up failed: %s", e)
+                results["vertexai"] = f"failed: {e}"
+        results["seconds"] = round(time.perf_counter() - started, 3)
+        logger.info("Warm-up finished: %s", results)
+        return results
+
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_client_registry() -> ClientRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ClientRegistry()
+    return _registry
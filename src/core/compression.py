@@ -0,0 +1,46 @@
+"""
+大きな応答の gzip 圧縮。
+
+Accept-Encoding に gzip を含むリクエストで、min_bytes 以上の JSON・テキストの応答を圧縮します。
+ストリーミング（エクスポート・SSE）と send_file の応答、既に Content-Encoding を持つ応答は圧縮しません。
+"""
+import gzip
+import os
+from flask import Flask, request
+from src.core.metrics import REGISTRY
+
+COMPRESSED_RESPONSES = REGISTRY.counter("http_response_gzip_total", "gzip 圧縮した応答の件数", ("endpoint",))
+COMPRESSED_BYTES = REGISTRY.counter(
+    "http_response_gzip_bytes_total", "gzip 圧縮した応答の圧縮前・後のバイト数", ("endpoint", "stage")
+)
+
+COMPRESSIBLE_MIMETYPES = frozenset({"application/json", "application/x-ndjson", "text/csv", "text/plain", "text/html"})
+
+
+def init_app(app: Flask) -> None:
+    """RESPONSE_GZIP_MIN_BYTES（既定1024、0で無効）・RESPONSE_GZIP_LEVEL（既定5）"""
+    min_bytes = int(os.environ.get("RESPONSE_GZIP_MIN_BYTES", "1024"))
+    level = int(os.environ.get("RESPONSE_GZIP_LEVEL", "5"))
+    if min_bytes <= 0:
+        return
+
+    @app.after_request
+    def _gzip_response(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code < 200
+                or response.status_code in (204, 304) or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+            return response
+        response.vary.add("Accept-Encoding")
+        if request.accept_encodings.quality("gzip") <= 0:
+            return response
+        body = response.get_data()
+        if len(body) < min_bytes:
+            return response
+        compressed = gzip.compress(body, compresslevel=level, mtime=0)
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = "gzip"
+        endpoint = request.endpoint or "unknown"
+        COMPRESSED_RESPONSES.inc(endpoint=endpoint)
+        COMPRESSED_BYTES.inc(len(body), endpoint=endpoint, stage="original")
+        COMPRESSED_BYTES.inc(len(compressed), endpoint=endpoint, stage="compressed")
+        return response
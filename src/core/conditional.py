@@ -0,0 +1,41 @@
+"""
+ユーザー毎のデータバージョン（src/services/data_version.py）による条件付きGET。
+
+    return conditional_response(service.data_version(user_id), lambda: jsonify(...))
+
+If-None-Match が現在のバージョンと一致すれば、build を呼ばずに（取得もシリアライズもせずに）304を返します。
+200の応答には ETag（弱い比較）・Last-Modified と、毎回再検証させる Cache-Control を付けます。
+Last-Modified はバージョンを作ったプロセスの時刻で、他のプロセスでの変更と前後関係が保証されないため、
+If-Modified-Since だけの要求には304を返しません。
+"""
+from typing import Callable, Optional
+from flask import Response, make_response, request
+from src.core.metrics import REGISTRY
+from src.services.data_version import DataVersion
+
+CONDITIONAL_REQUESTS = REGISTRY.counter(
+    "conditional_get_requests_total", "データバージョンで判定したGETの件数", ("endpoint", "result")
+)
+
+
+def _not_modified(version: DataVersion) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(version.etag)
+    return False
+
+
+def conditional_response(version: Optional[DataVersion], build: Callable[[], object]) -> Response:
+    if version is None:
+        return make_response(build())
+    if _not_modified(version):
+        response = Response(status=304)
+        CONDITIONAL_REQUESTS.inc(endpoint=request.endpoint or "", result="not_modified")
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+        CONDITIONAL_REQUESTS.inc(endpoint=request.endpoint or "", result="modified")
+    response.set_etag(version.etag, weak=True)
+    response.last_modified = version.last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -1,12 +1,30 @@
 import os
-import os
-from google.cloud import bigquery
-
-def get_db_client() -> bigquery.Client:
-    """BigQueryクライアントを取得します。"""
-    # TODO: プロジェクトIDや認証情報を環境変数から読み込む
-    # TODO: プロジェクトIDや認証情報を環境変数から読み込む
-    # Cloud Run環境では、サービスアカウントが自動的に認証情報を提供するため、
-    # 明示的な認証情報の設定は不要な場合が多いですが、プロジェクトIDは明示的に指定します。
-    project_id = os.environ.get("GCP_PROJECT_ID", "health-report-465810")
-    return bigquery.Client(project=project_id)
+import threading
+from src.core.storage import StorageBackend
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend() -> StorageBackend:
+    """環境変数 STORAGE_BACKEND に応じてストレージバックエンドを生成します。"""
+    backend_name = os.environ.get("STORAGE_BACKEND", "bigquery").lower()
+    if backend_name == "sqlite":
+        from src.core.sqlite_backend import SQLiteBackend
+        return SQLiteBackend(os.environ.get("SQLITE_DB_PATH", ":memory:"))
+    if backend_name != "bigquery":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend_name}")
+
+    from src.core.bigquery_backend import BigQueryBackend
+    # bigquery.Client はプロセス共通のレジストリ（src/core/clients.py）で初回のクエリ時に生成する
+    return BigQueryBackend()
+
+
+def get_db_client() -> StorageBackend:
+    """プロセス共通のストレージバックエンドを取得します（STORAGE_BACKEND=bigquery|sqlite）。"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend()
+    return _backend
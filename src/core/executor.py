@@ -0,0 +1,130 @@
+"""
+1つのリクエスト内の独立した処理（ストレージのクエリ等）を、プロセスで共有するスレッドプールで並列に実行します。
+
+    results = get_fanout_executor().run("dashboard", {"activities": lambda: ..., "summary": lambda: ...},
+                                        timeouts={"summary": 5.0}, default_timeout=10.0)
+
+各処理は新しいコンテキストで実行し、propagate_context_var で登録された contextvars（ストレージ呼び出しの記録・
+ログのサンプリング等）だけを呼び出し元の値で引き継ぎます。Flaskのリクエスト・セッションは引き継がないため、
+処理の入力（ユーザーID・期間等）は投入前に解決して渡します（タイムアウトした処理が応答後にリクエストに触れないように）。
+タイムアウトした処理は結果を待たずに打ち切りますが、実行中のスレッドは止められないため処理の完了までワーカーを占有します
+（プールが埋まった場合、後続の処理は待ちの間にタイムアウトし、部分的な結果になる）。
+"""
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TypeVar
+from src.core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PART_SECONDS = REGISTRY.histogram("fanout_part_duration_seconds", "並列実行した処理1つの所要時間（秒）", ("fanout", "part"))
+PART_FAILURES = REGISTRY.counter("fanout_part_failures_total", "並列実行した処理の失敗件数", ("fanout", "part", "reason"))
+
+TIMEOUT = "timeout"
+FAILED = "failed"
+
+T = TypeVar("T")
+
+# 並列実行する処理に引き継ぐ contextvars
+_propagated: List[contextvars.ContextVar] = []
+_UNSET = object()
+
+
+def propagate_context_var(var: "contextvars.ContextVar[T]") -> "contextvars.ContextVar[T]":
+    """並列実行する処理に、呼び出し元での値を引き継ぐ contextvar として登録します（登録した var を返す）。"""
+    _propagated.append(var)
+    return var
+
+
+def _part_context() -> contextvars.Context:
+    """登録された contextvars だけを現在の値で持つ新しいコンテキスト"""
+    context = contextvars.Context()
+    for var in _propagated:
+        value = var.get(_UNSET)
+        if value is not _UNSET:
+            context.run(var.set, value)
+    return context
+
+
+class PartResult(NamedTuple):
+    """処理1つの結果。失敗した場合は value が None で、error に TIMEOUT または FAILED が入る。"""
+    value: Any
+    error: Optional[str]
+    seconds: float
+
+
+class FanOutExecutor:
+    def __init__(self, max_workers: int = 16):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._owner_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            # fork後（gunicornのワーカー等）は親のスレッドが引き継がれないため、プロセス毎に生成する
+            if self._owner_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fanout")
+                self._owner_pid = os.getpid()
+            return self._executor
+
+    def run(self, fanout: str, parts: Dict[str, Callable[[], Any]], timeouts: Optional[Dict[str, float]] = None,
+            default_timeout: float = 10.0) -> Dict[str, PartResult]:
+        """
+        parts を並列に実行し、名前毎の結果を返します。処理毎の期限は開始時点から timeouts（無ければ default_timeout）秒で、
+        全体の所要時間は最も遅い処理（または最も長い期限）で決まります。例外は記録して FAILED にします。
+        """
+        executor = self._get_executor()
+        timeouts = timeouts or {}
+        started = time.perf_counter()
+        futures: Dict[str, Future] = {}
+        finished_at: Dict[str, float] = {}
+
+        def timed(name: str, fn: Callable[[], Any]) -> Any:
+            try:
+                return fn()
+            finally:
+                finished_at[name] = time.perf_counter()
+
+        for name, fn in parts.items():
+            futures[name] = executor.submit(_part_context().run, timed, name, fn)
+
+        results: Dict[str, PartResult] = {}
+        for name, future in futures.items():
+            deadline = started + timeouts.get(name, default_timeout)
+            try:
+                value = future.result(timeout=max(deadline - time.perf_counter(), 0))
+            except FutureTimeoutError:
+                # 実行待ちであれば取り消す（実行中の場合は完了まで続く）
+                future.cancel()
+                PART_FAILURES.inc(fanout=fanout, part=name, reason=TIMEOUT)
+                logger.warning("%s part %s timed out", fanout, name)
+                results[name] = PartResult(None, TIMEOUT, time.perf_counter() - started)
+                continue
+            except Exception:
+                PART_FAILURES.inc(fanout=fanout, part=name, reason=FAILED)
+                logger.exception("%s part %s failed", fanout, name)
+                results[name] = PartResult(None, FAILED, finished_at.get(name, time.perf_counter()) - started)
+                continue
+            seconds = finished_at.get(name, time.perf_counter()) - started
+            PART_SECONDS.observe(seconds, fanout=fanout, part=name)
+            results[name] = PartResult(value, None, seconds)
+        return results
+
+
+_shared: Optional[FanOutExecutor] = None
+_shared_lock = threading.Lock()
+
+
+def get_fanout_executor() -> FanOutExecutor:
+    """プロセスで共有するプール（FANOUT_MAX_WORKERS、既定16）"""
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                _shared = FanOutExecutor(max_workers=int(os.environ.get("FANOUT_MAX_WORKERS", "16")))
+    return _shared
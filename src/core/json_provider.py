@@ -0,0 +1,86 @@
+"""
+orjson による Flask の JSON プロバイダ（jsonify・request.json 等）。
+
+標準の json モジュールより高速に、Pydantic モデルを dict に変換せずにそのままエンコードします。
+日時・日付は従来の応答と同じ HTTP-date 形式（"Mon, 01 Jan 2024 00:00:00 GMT"）にします
+（フロントエンドが解釈している形式のため、orjson 標準の ISO8601 にはしない）。
+一覧では日時の変換が件数×列数だけ呼ばれるため、werkzeug の http_date ではなく表引きで組み立てます。
+"""
+import dataclasses
+import decimal
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, Dict
+import orjson
+from flask import Flask, Response
+from flask.json.provider import JSONProvider
+from pydantic import BaseModel
+from werkzeug.http import http_date
+
+# 日時は default に渡して HTTP-date にする。dict の int 等のキーは文字列にする（標準の json と同じ）
+_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+_TWO_DIGITS = tuple("%02d" % i for i in range(60))
+# 日付（通日）→ "Mon, 01 Jan 2024 "
+_DATE_PREFIXES: Dict[int, str] = {}
+_MAX_DATE_PREFIXES = 4096
+
+
+def format_http_date(value: date) -> str:
+    """werkzeug.http.http_date と同じ文字列（naive な日時はUTCとみなす、日付はUTCの0時）"""
+    if isinstance(value, datetime):
+        if value.tzinfo is not None and value.tzinfo is not timezone.utc and value.utcoffset():
+            value = value.astimezone(timezone.utc)
+        clock = _TWO_DIGITS[value.hour] + ":" + _TWO_DIGITS[value.minute] + ":" + _TWO_DIGITS[value.second]
+    else:
+        clock = "00:00:00"
+    ordinal = value.toordinal()
+    prefix = _DATE_PREFIXES.get(ordinal)
+    if prefix is None:
+        if len(_DATE_PREFIXES) >= _MAX_DATE_PREFIXES:
+            _DATE_PREFIXES.clear()
+        prefix = _DATE_PREFIXES[ordinal] = http_date(date.fromordinal(ordinal))[:17]
+    return prefix + clock + " GMT"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, date):
+        return format_http_date(value)
+    if isinstance(value, BaseModel):
+        # フィールドの値をそのまま渡す（入れ子のモデル・日時はここで再帰的に変換される）。
+        # Pydantic v2 の __dict__ はフィールドの値だけを持つ（dict(value) はジェネレータ経由で遅い。
+        # extra="allow" のモデルやシリアライザを定義したモデルは、応答の前に model_dump() すること）
+        return value.__dict__
+    if isinstance(value, (decimal.Decimal, uuid.UUID)):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if hasattr(value, "__html__"):
+        return str(value.__html__())
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """obj を UTF-8 の JSON にします（日時は HTTP-date）。"""
+    return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask の DefaultJSONProvider と同じ型（日時・Decimal・UUID・dataclass）に加え、Pydantic モデルを扱います。
+    応答は文字列を経由せずに bytes のまま返します。キーの並べ替え・整形（indent）は行いません。
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype="application/json")
+
+
+def init_app(app: Flask) -> None:
+    app.json = OrjsonProvider(app)
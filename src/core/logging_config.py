@@ -0,0 +1,216 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+from flask import Flask, has_request_context, request, session
+from src.core.executor import propagate_context_var
+from src.core.metrics import REGISTRY
+
+DROPPED_RECORDS = REGISTRY.counter("log_records_dropped_total", "出力キューが満杯で破棄したログの件数")
+
+# ログに出さないヘッダ（値を伏せる）
+REDACTED_HEADERS = frozenset({"authorization", "cookie", "set-cookie", "proxy-authorization", "x-csrf-token"})
+
+# LogRecord の標準属性（これ以外の属性は extra で渡された構造化フィールドとして出力する）
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# 現在のリクエストのDEBUGログを出力するか（リクエスト単位でサンプリングし、1リクエストのトレースは揃えて残す）
+_debug_sampled: contextvars.ContextVar[Optional[bool]] = propagate_context_var(
+    contextvars.ContextVar("debug_log_sampled", default=None))
+# リクエスト開始時の method / path / user_id（リクエストを引き継がないスレッドプールの処理のログに付与する）
+_request_fields: contextvars.ContextVar[Optional[Dict[str, Any]]] = propagate_context_var(
+    contextvars.ContextVar("request_log_fields", default=None))
+
+
+class Lazy:
+    """
+    ログ出力時にだけ評価される値。DEBUGが無効な場合や、サンプリングで破棄された場合は評価されない。
+        logger.debug("headers: %s", Lazy(lambda: redact_headers(request.headers)))
+    """
+
+    __slots__ = ("_fn",)
+
+    def __init__(self, fn: Callable[[], Any]):
+        self._fn = fn
+
+    def __str__(self) -> str:
+        return str(self._fn())
+
+    __repr__ = __str__
+
+
+def redact_headers(headers) -> Dict[str, str]:
+    return {key: ("[REDACTED]" if key.lower() in REDACTED_HEADERS else value) for key, value in headers.items()}
+
+
+class JsonFormatter(logging.Formatter):
+    """1レコード1行のJSON。extra で渡した項目とリクエスト情報（method, path, user_id）を含めます。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            # Cloud Logging がログレベルとして解釈するキー
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    リクエスト中のレコードに method / path / user_id を付与します。
+    リクエストから委譲された処理（src/core/executor.py）では、リクエスト開始時に記録した値を付与します。
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if has_request_context():
+            record.method = request.method
+            record.path = request.path
+            record.user_id = session.get("user_id")
+        else:
+            for key, value in (_request_fields.get() or {}).items():
+                setattr(record, key, value)
+        return True
+
+
+class DebugSamplingFilter(logging.Filter):
+    """
+    DEBUG以下のレコードを sample_rate の割合だけ残します（INFO以上は常に残す）。
+    リクエスト中はリクエスト単位で判定し、リクエスト外ではレコード単位で判定します。
+    """
+
+    def __init__(self, sample_rate: float):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.sample_rate >= 1.0:
+            return True
+        sampled = _debug_sampled.get()
+        if sampled is None:
+            sampled = random.random() < self.sample_rate
+        return sampled
+
+
+class BackgroundQueueHandler(logging.handlers.QueueHandler):
+    """
+    レコードを呼び出し元のスレッドで整形してキューに入れ、出力はバックグラウンドのスレッド（QueueListener）で行います。
+    キューが満杯の場合は待たずに破棄します。fork後（gunicornのワーカー等）はプロセス毎にキューと出力スレッドを作り直します。
+    """
+
+    def __init__(self, target: logging.Handler, max_queue_size: int = 10000):
+        super().__init__(queue.Queue(max_queue_size))
+        self.target = target
+        self.max_queue_size = max_queue_size
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._owner_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self) -> None:
+        if self._owner_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._owner_pid == os.getpid():
+                return
+            # 親プロセスのキューと出力スレッドは引き継がれないため作り直す
+            self.queue = queue.Queue(self.max_queue_size)
+            self._listener = logging.handlers.QueueListener(self.queue, self.target, respect_handler_level=True)
+            self._listener.start()
+            self._owner_pid = os.getpid()
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DROPPED_RECORDS.inc()
+
+    def stop(self) -> None:
+        """キューに残ったレコードを出力してから出力スレッドを止めます。"""
+        with self._start_lock:
+            if self._listener is not None and self._owner_pid == os.getpid():
+                self._listener.stop()
+            self._listener = None
+            self._owner_pid = None
+
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """"src.services=DEBUG,werkzeug=WARNING" 形式のモジュール毎のログレベル"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_handler: Optional[BackgroundQueueHandler] = None
+
+
+def configure_logging() -> None:
+    """
+    環境変数からルートロガーを設定します（複数回呼んでも1度だけ設定する）。
+
+    *   LOG_LEVEL: ルートのログレベル（既定 INFO）
+    *   LOG_LEVELS: モジュール毎のログレベル（例: src.services.activity_service=DEBUG,werkzeug=WARNING）
+    *   LOG_FORMAT: json（既定）| text
+    *   LOG_DEBUG_SAMPLE_RATE: DEBUGログを残すリクエストの割合（既定 1.0）
+    *   LOG_QUEUE_SIZE: 出力待ちのレコード数の上限（既定 10000、超えた分は破棄）
+    """
+    global _handler
+    if _handler is not None:
+        return
+
+    stream = logging.StreamHandler(sys.stdout)
+    if os.environ.get("LOG_FORMAT", "json").lower() == "text":
+        formatter: logging.Formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+    else:
+        formatter = JsonFormatter()
+
+    _handler = BackgroundQueueHandler(stream, max_queue_size=int(os.environ.get("LOG_QUEUE_SIZE", "10000")))
+    # 整形（Lazy の評価・リクエスト情報の付与を含む）は呼び出し元のスレッドで行い、出力スレッドはそのまま書き出す
+    _handler.setFormatter(formatter)
+    _handler.addFilter(DebugSamplingFilter(float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    _handler.addFilter(RequestContextFilter())
+    stream.setFormatter(logging.Formatter("%(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+    for name, level in _parse_levels(os.environ.get("LOG_LEVELS", "")).items():
+        logging.getLogger(name).setLevel(level)
+    atexit.register(_handler.stop)
+
+
+def init_app(app: Flask) -> None:
+    """リクエスト毎にDEBUGログのサンプリングを判定し、DEBUG有効時はリクエストの概要を出力します。"""
+    sample_rate = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+    logger = logging.getLogger("src.request")
+
+    @app.before_request
+    def _start_request_logging():
+        _debug_sampled.set(sample_rate >= 1.0 or random.random() < sample_rate)
+        _request_fields.set({"method": request.method, "path": request.path, "user_id": session.get("user_id")})
+        logger.debug(
+            "%s %s args=%s headers=%s", request.method, request.path,
+            Lazy(lambda: request.args.to_dict()), Lazy(lambda: redact_headers(request.headers)),
+        )
+
+    @app.teardown_request
+    def _reset_request_logging(exc):
+        _debug_sampled.set(None)
+        _request_fields.set(None)
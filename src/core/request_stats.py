@@ -0,0 +1,191 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from flask import Flask, Response, request
+from src.core.executor import propagate_context_var
+from src.core.metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "リクエストの処理時間（秒、ストリーミングの場合はヘッダ送出まで）",
+    ("endpoint", "method", "status"),
+)
+JOBS_PER_REQUEST = REGISTRY.histogram(
+    "http_request_storage_jobs", "1リクエストあたりのストレージ呼び出し（クエリジョブ・挿入）回数",
+    ("endpoint",), buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21),
+)
+STORAGE_JOB_SECONDS = REGISTRY.histogram("storage_job_duration_seconds", "ストレージ呼び出し1回の所要時間（秒）", ("operation",))
+STORAGE_JOBS = REGISTRY.counter("storage_jobs_total", "ストレージ呼び出しの回数", ("operation", "cache_hit"))
+BYTES_PROCESSED = REGISTRY.counter("bigquery_bytes_processed_total", "クエリジョブが処理したバイト数")
+SLOT_MILLIS = REGISTRY.counter("bigquery_slot_milliseconds_total", "クエリジョブが消費したスロット時間（ミリ秒）")
+AI_CALL_SECONDS = REGISTRY.histogram(
+    "ai_model_request_duration_seconds", "生成モデル呼び出し1回の所要時間（秒、ストリーミングは最後の断片まで）",
+    ("model", "mode", "status"), buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+AI_TOKENS = REGISTRY.counter("ai_model_tokens_total", "生成モデルの入出力トークン数", ("model", "kind"))
+
+# Server-Timing に個別に載せるストレージ呼び出しの上限（超えた分は合計にのみ含める）
+MAX_SERVER_TIMING_JOBS = 20
+
+
+class StorageJob:
+    """ストレージ呼び出し1回分の計測値。統計が取れない項目（SQLite・挿入等）は None。"""
+
+    __slots__ = ("operation", "seconds", "bytes_processed", "slot_millis", "cache_hit")
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.seconds = 0.0
+        self.bytes_processed: Optional[int] = None
+        self.slot_millis: Optional[int] = None
+        self.cache_hit: Optional[bool] = None
+
+
+class AICall:
+    """生成モデル呼び出し1回分の計測値。トークン数はクライアントが応答から設定します。"""
+
+    __slots__ = ("model", "mode", "seconds", "prompt_tokens", "output_tokens")
+
+    def __init__(self, model: str, mode: str):
+        self.model = model
+        self.mode = mode
+        self.seconds = 0.0
+        self.prompt_tokens: Optional[int] = None
+        self.output_tokens: Optional[int] = None
+
+
+class RequestStats:
+    """1リクエスト中のストレージ呼び出しと生成モデル呼び出しの記録"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.jobs: List[StorageJob] = []
+        self.ai_calls: List[AICall] = []
+
+
+# リクエスト毎の記録。スレッドプールへ処理を委譲する場合も同じ記録を共有する（src/core/executor.py）
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = propagate_context_var(
+    contextvars.ContextVar("request_stats", default=None))
+
+
+@contextmanager
+def storage_job(operation: str) -> Iterator[StorageJob]:
+    """ストレージ呼び出しの所要時間を計測し、メトリクスと現在のリクエストに記録します。"""
+    job = StorageJob(operation)
+    started = time.perf_counter()
+    try:
+        yield job
+    finally:
+        job.seconds = time.perf_counter() - started
+        STORAGE_JOB_SECONDS.observe(job.seconds, operation=operation)
+        cache_hit = "" if job.cache_hit is None else str(job.cache_hit).lower()
+        STORAGE_JOBS.inc(operation=operation, cache_hit=cache_hit)
+        if job.bytes_processed:
+            BYTES_PROCESSED.inc(job.bytes_processed)
+        if job.slot_millis:
+            SLOT_MILLIS.inc(job.slot_millis)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.jobs.append(job)
+
+
+@contextmanager
+def ai_call(model: str, mode: str) -> Iterator[AICall]:
+    """生成モデル呼び出しの所要時間・トークン数を計測し、メトリクスと現在のリクエストに記録します。"""
+    call = AICall(model, mode)
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield call
+        status = "ok"
+    finally:
+        call.seconds = time.perf_counter() - started
+        AI_CALL_SECONDS.observe(call.seconds, model=model, mode=mode, status=status)
+        if call.prompt_tokens:
+            AI_TOKENS.inc(call.prompt_tokens, model=model, kind="prompt")
+        if call.output_tokens:
+            AI_TOKENS.inc(call.output_tokens, model=model, kind="output")
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.ai_calls.append(call)
+
+
+def current_job_count() -> int:
+    stats = _request_stats.get()
+    return len(stats.jobs) if stats is not None else 0
+
+
+def _format_bytes(value: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def server_timing(stats: RequestStats) -> str:
+    """
+    Server-Timing ヘッダの値を組み立てます。
+    app（全体）、storage（ストレージ呼び出しの合計）、storage-N（呼び出し毎）、ai（生成モデル呼び出しの合計）。
+    """
+    entries = [f"app;dur={(time.perf_counter() - stats.started) * 1000:.1f}"]
+    jobs = list(stats.jobs)
+    if jobs:
+        noun = "job" if len(jobs) == 1 else "jobs"
+        entries.append(f'storage;dur={sum(j.seconds for j in jobs) * 1000:.1f};desc="{len(jobs)} {noun}"')
+        for i, job in enumerate(jobs[:MAX_SERVER_TIMING_JOBS], start=1):
+            desc = [job.operation]
+            if job.bytes_processed is not None:
+                desc.append(_format_bytes(job.bytes_processed))
+            if job.slot_millis is not None:
+                desc.append(f"{job.slot_millis} slot-ms")
+            if job.cache_hit:
+                desc.append("cached")
+            entries.append(f'storage-{i};dur={job.seconds * 1000:.1f};desc="{", ".join(desc)}"')
+    calls = list(stats.ai_calls)
+    if calls:
+        desc = [f"{len(calls)} call" if len(calls) == 1 else f"{len(calls)} calls"]
+        if any(c.prompt_tokens is not None or c.output_tokens is not None for c in calls):
+            tokens = sum((c.prompt_tokens or 0) + (c.output_tokens or 0) for c in calls)
+            desc.append(f"{tokens} tokens")
+        entries.append(f'ai;dur={sum(c.seconds for c in calls) * 1000:.1f};desc="{", ".join(desc)}"')
+    return ", ".join(entries)
+
+
+def init_app(app: Flask) -> None:
+    """
+    リクエスト毎の処理時間・ストレージ呼び出し・生成モデル呼び出しを計測し、
+    Server-Timing / X-Storage-Jobs ヘッダとエンドポイント別のメトリクスに記録します。
+    /metrics でPrometheus形式のメトリクスを公開します（METRICS_AUTH_TOKEN 指定時は Bearer 認証）。
+    """
+    server_timing_enabled = os.environ.get("SERVER_TIMING_ENABLED", "1").lower() in ("1", "true", "yes")
+    metrics_token = os.environ.get("METRICS_AUTH_TOKEN")
+
+    @app.before_request
+    def _start_request_stats():
+        _request_stats.set(RequestStats())
+
+    @app.after_request
+    def _record_request_stats(response):
+        stats = _request_stats.get()
+        if stats is None:
+            return response
+        endpoint = request.endpoint or "unknown"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - stats.started, endpoint=endpoint,
+                                     method=request.method, status=str(response.status_code))
+        JOBS_PER_REQUEST.observe(len(stats.jobs), endpoint=endpoint)
+        response.headers["X-Storage-Jobs"] = str(len(stats.jobs))
+        if server_timing_enabled:
+            response.headers["Server-Timing"] = server_timing(stats)
+        return response
+
+    @app.teardown_request
+    def _reset_request_stats(exc):
+        _request_stats.set(None)
+
+    @app.route("/metrics")
+    def metrics():
+        # メトリクスはワーカープロセス毎に集計する（gunicornの複数ワーカーでは各ワーカーの値になる）
+        if metrics_token and request.headers.get("Authorization") != f"Bearer {metrics_token}":
+            return "", 401
+        return Response(REGISTRY.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
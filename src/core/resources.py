@@ -0,0 +1,66 @@
+"""
+コンテナに割り当てられた資源（CPU数・メモリ上限）と、それを分け合うgunicornのワーカー数。
+
+gunicorn.conf.py がワーカー数・スレッド数の既定値の決定に、各ワーカー内のプール（パスワードのハッシュ化等）が
+1ワーカーあたりの取り分の計算に使用します。ワーカー数は gunicorn.conf.py が WEB_CONCURRENCY に設定します。
+"""
+import math
+import os
+from typing import Optional
+
+# I/O待ち（BigQuery・Vertex AI）が主のため、CPU1つあたりに割り当てるgthreadのスレッド数
+THREADS_PER_CPU = 8
+
+
+def available_cpus() -> int:
+    """cgroupのCPUクォータ（Cloud Run / コンテナ）を考慮した利用可能なCPU数"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """cgroupのメモリ上限。取得できない・無制限の場合は None"""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 の無制限は非常に大きな値になる
+        if value != "max" and int(value) < 1 << 50:
+            return int(value)
+    return None
+
+
+def default_workers(worker_memory_bytes: int) -> int:
+    """CPU1つにつき1ワーカー。メモリ上限がある場合は1ワーカーあたり worker_memory_bytes に収まる数まで"""
+    workers = available_cpus()
+    memory = memory_limit_bytes()
+    if memory is not None:
+        workers = min(workers, memory // worker_memory_bytes)
+    return max(1, workers)
+
+
+def default_threads(workers: int) -> int:
+    """コンテナ全体で CPU数 × THREADS_PER_CPU のスレッドになるよう、ワーカー数で分けたスレッド数"""
+    return max(THREADS_PER_CPU, THREADS_PER_CPU * available_cpus() // max(1, workers))
+
+
+def web_concurrency() -> int:
+    """同じコンテナで動くgunicornのワーカー数（gunicorn以外で起動した場合は1）"""
+    value = os.environ.get("WEB_CONCURRENCY")
+    return max(1, int(value)) if value else 1
+
+
+def cpus_per_worker() -> int:
+    """1ワーカーあたりのCPU数（最低1）"""
+    return max(1, available_cpus() // web_concurrency())
@@ -0,0 +1,364 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from datetime import date, datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence
+from src.core.storage import QueryParameter, QueryResult, StorageBackend
+from src.core.table_layout import load_layouts
+
+# Table_JSON/ 配下のスキーマ定義からテーブルを作成する
+SCHEMA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Table_JSON'))
+# バッチロード時に一度にexecutemanyする行数
+_LOAD_CHUNK_ROWS = 1000
+
+_SQLITE_TYPES = {
+    "STRING": "TEXT",
+    "INTEGER": "INTEGER",
+    "INT64": "INTEGER",
+    "FLOAT": "REAL",
+    "FLOAT64": "REAL",
+    "NUMERIC": "REAL",
+    "BOOLEAN": "INTEGER",
+    "BOOL": "INTEGER",
+    "TIMESTAMP": "TEXT",
+    "DATE": "TEXT",
+    "JSON": "TEXT",
+}
+
+_TIMESTAMP_DIFF_UNITS = {
+    "MICROSECOND": 1,
+    "MILLISECOND": 1000,
+    "SECOND": 1000000,
+    "MINUTE": 60 * 1000000,
+    "HOUR": 3600 * 1000000,
+    "DAY": 86400 * 1000000,
+}
+
+_TABLE_REF_RE = re.compile(r"`([^`]+)`")
+_NAMED_PARAM_RE = re.compile(r":(\w+)")
+_MERGE_RE = re.compile(
+    r'^\s*MERGE\s+(?:INTO\s+)?(?P<target>"[^"]+")\s+(?:AS\s+)?(?P<target_alias>\w+)\s+'
+    r'USING\s+\((?P<source>.*)\)\s+(?:AS\s+)?(?P<source_alias>\w+)\s+'
+    r'ON\s+(?P<on>.*?)\s+(?P<clauses>WHEN\s+.*)$',
+    re.IGNORECASE | re.DOTALL,
+)
+_MERGE_WHEN_RE = re.compile(r'WHEN\s+(NOT\s+MATCHED|MATCHED)\s+THEN\s+', re.IGNORECASE)
+_PARAM_RE = re.compile(r"@(\w+)")
+_TEMP_TABLE_RE = re.compile(r"CREATE\s+TEMP(?:ORARY)?\s+TABLE\s+(\w+)", re.IGNORECASE)
+_CURRENT_TIMESTAMP_RE = re.compile(r"\bCURRENT_TIMESTAMP\(\)", re.IGNORECASE)
+_TIMESTAMP_DIFF_RE = re.compile(
+    r"\bTIMESTAMP_DIFF\(([^()]+?),\s*(" + "|".join(_TIMESTAMP_DIFF_UNITS) + r")\s*\)",
+    re.IGNORECASE,
+)
+
+
+def split_statements(sql: str) -> List[str]:
+    """`;` 区切りのスクリプトをステートメントに分割します（文字列リテラル内の `;` は無視）。"""
+    statements = []
+    current = []
+    quote = None
+    for ch in sql:
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in ("'", '"', '`'):
+            quote = ch
+        elif ch == ';':
+            statements.append(''.join(current))
+            current = []
+            continue
+        current.append(ch)
+    statements.append(''.join(current))
+    return [s for s in statements if s.strip()]
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<=[a-z0-9])(?=[A-Z])", "_", name).lower()
+
+
+def table_name_for(table_id: str) -> str:
+    """`project.dataset.Table` 形式のテーブルIDをSQLiteのテーブル名に変換します。"""
+    return _snake_case(table_id.split('.')[-1])
+
+
+def to_timestamp_text(value: Any) -> Optional[str]:
+    """TIMESTAMP値を比較可能な正規化文字列（UTC, マイクロ秒まで）に変換します。"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        dt = value
+    elif isinstance(value, date):
+        dt = datetime(value.year, value.month, value.day)
+    else:
+        text = str(value).strip()
+        if text.endswith('Z'):
+            text = text[:-1] + '+00:00'
+        dt = datetime.fromisoformat(text)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f+00:00')
+
+
+def _parse_timestamp(text: Optional[str]) -> Optional[datetime]:
+    if text is None:
+        return None
+    return datetime.fromisoformat(to_timestamp_text(text))
+
+
+def _bq_timestamp_diff(end: Optional[str], start: Optional[str], unit: str) -> Optional[int]:
+    if end is None or start is None:
+        return None
+    delta = _parse_timestamp(end) - _parse_timestamp(start)
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    quotient = abs(micros) // _TIMESTAMP_DIFF_UNITS[unit.upper()]
+    return quotient if micros >= 0 else -quotient
+
+
+def _bq_current_timestamp() -> str:
+    return to_timestamp_text(datetime.now(timezone.utc))
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    SQLiteによる組み込みストレージバックエンド。
+    サービス層が発行するBigQuery標準SQLを最小限の方言変換で実行します。
+    ローカル開発・ベンチマーク・負荷試験用途を想定しています。
+    """
+
+    def __init__(self, path: str = ":memory:", schema_dir: str = SCHEMA_DIR):
+        self.path = path
+        # 単一コネクションをロックで直列化する（:memory: でも全スレッドで同じDBを共有するため）
+        self._lock = threading.RLock()
+        self._connection = self._connect()
+        self._owner_pid = os.getpid()
+        self._table_schemas: Dict[str, Dict[str, str]] = {}
+        self._column_types: Dict[str, str] = {}
+        self._create_tables(schema_dir)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.create_function("bq_current_timestamp", 0, _bq_current_timestamp)
+        conn.create_function("GENERATE_UUID", 0, lambda: str(uuid.uuid4()))
+        conn.create_function("TIMESTAMP_DIFF", 3, _bq_timestamp_diff)
+        if self.path != ":memory:":
+            conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # fork後（gunicornのpreload等）はファイルDBへのコネクションを親と共有しないよう開き直す。
+        # :memory: の場合は各ワーカーが親の時点のDBの複製を個別に持つ。
+        if self._owner_pid != os.getpid():
+            with self._lock:
+                if self._owner_pid != os.getpid():
+                    if self.path != ":memory:":
+                        self._connection = self._connect()
+                    self._owner_pid = os.getpid()
+        return self._connection
+
+    def _create_tables(self, schema_dir: str) -> None:
+        layouts = load_layouts(schema_dir)
+        with self._lock:
+            for filename in sorted(os.listdir(schema_dir)):
+                if not filename.endswith('_schema.json'):
+                    continue
+                table = filename[:-len('_schema.json')]
+                with open(os.path.join(schema_dir, filename), encoding='utf-8') as f:
+                    fields = json.load(f)
+                columns = {field["name"]: field["type"].upper() for field in fields}
+                self._table_schemas[table] = columns
+                for name, type_ in columns.items():
+                    self._column_types.setdefault(name, type_)
+                column_defs = ", ".join(f'"{name}" {_SQLITE_TYPES.get(type_, "TEXT")}' for name, type_ in columns.items())
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({column_defs})')
+                if "user_id" in columns:
+                    self._conn.execute(f'CREATE INDEX IF NOT EXISTS "idx_{table}_user_id" ON "{table}" (user_id)')
+                layout = layouts.get(table)
+                if layout is not None:
+                    # BigQueryのクラスタリング列 + パーティション列の順の複合インデックスで同じ絞り込みを再現する
+                    index_columns = list(layout.clustering_fields)
+                    if layout.partition_field and layout.partition_field not in index_columns:
+                        index_columns.append(layout.partition_field)
+                    self._conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS "idx_{table}_layout" ON "{table}" ({", ".join(index_columns)})'
+                    )
+            self._conn.commit()
+
+    def translate(self, sql: str) -> str:
+        """BigQuery標準SQLをSQLiteで実行可能な形に変換します。"""
+        sql = _TABLE_REF_RE.sub(lambda m: f'"{table_name_for(m.group(1))}"', sql)
+        sql = _CURRENT_TIMESTAMP_RE.sub("bq_current_timestamp()", sql)
+        sql = _TIMESTAMP_DIFF_RE.sub(lambda m: f"TIMESTAMP_DIFF({m.group(1)}, '{m.group(2).upper()}')", sql)
+        return _PARAM_RE.sub(r":\1", sql)
+
+    @staticmethod
+    def _to_sqlite_value(type_: str, value: Any) -> Any:
+        if value is None:
+            return None
+        type_ = type_.upper()
+        if type_ == "TIMESTAMP":
+            return to_timestamp_text(value)
+        if type_ == "DATE":
+            return value.isoformat() if isinstance(value, date) else str(value)[:10]
+        if type_ in ("BOOL", "BOOLEAN"):
+            return int(bool(value))
+        if type_ == "JSON" and not isinstance(value, str):
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+    def _from_sqlite_row(self, row: sqlite3.Row) -> Dict[str, Any]:
+        result = {}
+        for key in row.keys():
+            value = row[key]
+            type_ = self._column_types.get(key)
+            if value is not None and type_ == "TIMESTAMP":
+                value = _parse_timestamp(value)
+            elif value is not None and type_ == "DATE":
+                value = date.fromisoformat(value[:10])
+            result[key] = value
+        return result
+
+    def _execute(self, sql: str, bound: Dict[str, Any]) -> sqlite3.Cursor:
+        # sqlite3は名前付きパラメータの過不足を許さないため、ステートメントで使う分だけ渡す
+        used = {name: bound.get(name) for name in _NAMED_PARAM_RE.findall(sql)}
+        return self._conn.execute(sql, used)
+
+    def _execute_merge(self, sql: str, bound: Dict[str, Any]) -> int:
+        """
+        MERGE文をソース行毎の UPDATE / INSERT に展開して実行し、影響行数を返します。
+        対応するのは `MERGE target USING (SELECT ...) source ON ... WHEN [NOT] MATCHED THEN ...` の形式のみ。
+        """
+        match = _MERGE_RE.match(sql)
+        if not match:
+            raise ValueError("Unsupported MERGE statement for SQLite backend")
+        target, target_alias = match.group("target"), match.group("target_alias")
+        source_ref = re.compile(r"\b" + re.escape(match.group("source_alias")) + r"\.(\w+)")
+        to_param = lambda text: source_ref.sub(r":__merge_source_\1", text)
+        on = to_param(match.group("on"))
+        update_sql = insert_sql = None
+        parts = _MERGE_WHEN_RE.split(match.group("clauses"))
+        for kind, body in zip(parts[1::2], parts[2::2]):
+            body = to_param(body.strip())
+            if kind.upper() == "MATCHED":
+                assignments = re.sub(r"^UPDATE\s+SET\s+", "", body, flags=re.IGNORECASE)
+                update_sql = f"UPDATE {target} AS {target_alias} SET {assignments} WHERE {on}"
+            else:
+                insert_sql = re.sub(r"^INSERT\s*", f"INSERT INTO {target} ", body, flags=re.IGNORECASE)
+
+        affected = 0
+        for source_row in self._execute(match.group("source"), bound).fetchall():
+            row_bound = dict(bound)
+            row_bound.update({f"__merge_source_{key}": source_row[key] for key in source_row.keys()})
+            if update_sql is not None:
+                matched = self._execute(update_sql, row_bound).rowcount
+                affected += matched
+            else:
+                matched = self._execute(f"SELECT COUNT(*) FROM {target} AS {target_alias} WHERE {on}", row_bound).fetchone()[0]
+            if not matched and insert_sql is not None:
+                affected += self._execute(insert_sql, row_bound).rowcount
+        return affected
+
+    def _query(self, sql: str, params: Optional[Sequence[QueryParameter]]) -> QueryResult:
+        bound = {p.name: self._to_sqlite_value(p.type_, p.value) for p in params or []}
+        statements = split_statements(sql)
+        with self._lock:
+            try:
+                for statement in statements:
+                    translated = self.translate(statement)
+                    if translated.lstrip()[:5].upper() == "MERGE":
+                        rows, affected = [], self._execute_merge(translated, bound)
+                        continue
+                    cursor = self._execute(translated, bound)
+                    rows = [self._from_sqlite_row(row) for row in cursor.fetchall()]
+                    affected = cursor.rowcount if cursor.description is None else None
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            finally:
+                # BigQueryのスクリプトと同様、一時テーブルはスクリプトの終了とともに破棄する
+                for name in _TEMP_TABLE_RE.findall(sql):
+                    self._conn.execute(f"DROP TABLE IF EXISTS temp.{name}")
+        # スクリプトの場合、BigQueryと同様に親ジョブのDML件数は返さない
+        return QueryResult(rows, num_dml_affected_rows=affected if len(statements) == 1 else None)
+
+    def _iter_query_pages(self, sql: str, params: Optional[Sequence[QueryParameter]],
+                          page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        bound = {p.name: self._to_sqlite_value(p.type_, p.value) for p in params or []}
+        with self._lock:
+            cursor = self._execute(self.translate(sql), bound)
+
+        def pages():
+            try:
+                while True:
+                    # ページ間では接続のロックを解放し、他のリクエストを待たせない
+                    with self._lock:
+                        rows = [self._from_sqlite_row(row) for row in cursor.fetchmany(page_size)]
+                    if not rows:
+                        return
+                    yield rows
+            finally:
+                cursor.close()
+        return pages()
+
+    def _insert_rows(self, table_id: str, rows: List[Dict[str, Any]], row_ids: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        table = table_name_for(table_id)
+        columns = self._table_schemas.get(table)
+        if columns is None:
+            return [{"index": 0, "errors": [{"reason": "notFound", "message": f"Table {table_id} not found"}]}]
+        errors = []
+        values = []
+        for index, row in enumerate(rows):
+            unknown = [key for key in row if key not in columns]
+            if unknown:
+                errors.append({"index": index, "errors": [{"reason": "invalid", "message": f"no such field: {', '.join(unknown)}"}]})
+                continue
+            values.append([self._to_sqlite_value(columns[name], row.get(name)) for name in columns])
+        # insert_rows_jsonと同様、1件でもエラーがあればリクエスト全体を失敗として扱う
+        if errors:
+            return errors
+        with self._lock:
+            self._conn.executemany(self._insert_sql(table, columns), values)
+            self._conn.commit()
+        return []
+
+    @staticmethod
+    def _insert_sql(table: str, columns: Dict[str, str]) -> str:
+        placeholders = ", ".join("?" for _ in columns)
+        column_list = ", ".join(f'"{name}"' for name in columns)
+        return f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})'
+
+    def _load_ndjson(self, table_id: str, source: BinaryIO) -> int:
+        table = table_name_for(table_id)
+        columns = self._table_schemas.get(table)
+        if columns is None:
+            raise ValueError(f"Table {table_id} not found")
+        sql = self._insert_sql(table, columns)
+        loaded = 0
+        with self._lock:
+            try:
+                # ロードジョブと同様に全体を1トランザクションで追記し、読み込みは一定行数ずつ行う
+                values = []
+                for line_number, line in enumerate(source, start=1):
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    unknown = [key for key in row if key not in columns]
+                    if unknown:
+                        raise ValueError(f"line {line_number}: no such field: {', '.join(unknown)}")
+                    values.append([self._to_sqlite_value(columns[name], row.get(name)) for name in columns])
+                    if len(values) >= _LOAD_CHUNK_ROWS:
+                        self._conn.executemany(sql, values)
+                        loaded += len(values)
+                        values = []
+                self._conn.executemany(sql, values)
+                loaded += len(values)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return loaded
@@ -0,0 +1,121 @@
+"""
+起動時間の内訳（モジュール毎のインポート時間と初期化処理の時間）を計測します。
+STARTUP_PROFILE=1 のとき、app.py の先頭で install() したインポートフックがモジュール毎の時間を記録し、
+初期化完了時に report() の内容をログに出力します。
+"""
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_started_at = time.perf_counter()
+_phases: Dict[str, float] = {}
+# モジュール名 -> (子モジュールを含む時間, 子モジュールを除く時間)
+_imports: Dict[str, List[float]] = {}
+_state = threading.local()
+_installed = False
+
+
+def enabled() -> bool:
+    return os.environ.get("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+
+class _TimingLoader(importlib.abc.Loader):
+    def __init__(self, loader):
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = getattr(_state, "stack", None)
+        if stack is None:
+            stack = _state.stack = []
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            _imports[module.__name__] = [elapsed, elapsed - children]
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimingLoader(spec.loader)
+                return spec
+        return None
+
+
+def install() -> None:
+    """インポート時間の記録を開始します（STARTUP_PROFILE が無効な場合は何もしない）。"""
+    global _installed
+    if _installed or not enabled():
+        return
+    sys.meta_path.insert(0, _TimingFinder())
+    _installed = True
+
+
+def uninstall() -> None:
+    global _installed
+    sys.meta_path[:] = [finder for finder in sys.meta_path if not isinstance(finder, _TimingFinder)]
+    _installed = False
+
+
+@contextmanager
+def phase(name: str):
+    """初期化処理の一区間の時間を記録します。"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = _phases.get(name, 0.0) + time.perf_counter() - started
+
+
+def report(top: int = 15, packages: Optional[List[str]] = None) -> Dict[str, object]:
+    """
+    起動開始からの経過時間、初期化区間毎の時間、インポート時間の大きいトップレベルパッケージと
+    このアプリのモジュール（src.*）を返します。
+    """
+    by_package: Dict[str, float] = {}
+    for name, (inclusive, own) in _imports.items():
+        root = name.split(".")[0]
+        by_package[root] = by_package.get(root, 0.0) + own
+    app_modules = {name: times[0] for name, times in _imports.items() if name.startswith("src.")}
+    return {
+        "total_seconds": round(time.perf_counter() - _started_at, 3),
+        "phases": {name: round(seconds, 3) for name, seconds in _phases.items()},
+        "import_seconds_by_package": {
+            name: round(seconds, 3)
+            for name, seconds in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        },
+        "import_seconds_by_app_module": {
+            name: round(seconds, 3)
+            for name, seconds in sorted(app_modules.items(), key=lambda item: -item[1])[:top]
+        },
+    }
+
+
+def log_report() -> None:
+    if not enabled():
+        return
+    uninstall()
+    logger.info("Startup profile: %s", report())
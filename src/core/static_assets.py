@@ -0,0 +1,213 @@
+"""
+フロントエンドのビルド成果物（static/frontend/build）の配信。
+
+*   起動時（またはイメージのビルド時に python -m src.tools.precompress_static）に、圧縮の効くファイルの
+    gzip（.gz）・brotli（.br）版を隣に作っておき、Accept-Encoding に応じて圧縮済みのファイルをそのまま返す。
+*   ファイル名にハッシュを含むアセット（main.3f2a1b9c.js 等）は内容が変わらないため、1年間の immutable でキャッシュさせる。
+    それ以外（manifest.json 等）は毎回再検証させる。
+*   SPAのシェル（index.html）はメモリ上に（圧縮版も含めて）保持し、内容のハッシュを ETag にして返す。
+
+brotli モジュールが無い環境では .br を作らず、gzip だけで配信します。
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+from flask import Flask, Response, abort, request, send_file
+from werkzeug.security import safe_join
+from src.core.metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # brotli は任意（無い場合は gzip のみ）
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_RESPONSES = REGISTRY.counter(
+    "static_responses_total", "静的ファイル・SPAシェルの応答件数", ("kind", "encoding")
+)
+
+# 圧縮版を作る拡張子（画像・フォントは既に圧縮されているため対象外）
+COMPRESSIBLE_EXTENSIONS = frozenset({".js", ".css", ".html", ".json", ".map", ".svg", ".txt", ".xml", ".ico", ".webmanifest"})
+# 優先する順（同じ品質値の場合は brotli を選ぶ）
+ENCODING_SUFFIXES = (("br", ".br"), ("gzip", ".gz"))
+
+# create-react-app 等のビルドが付けるハッシュ（main.3f2a1b9c.js / 787.2e3f4a5b.chunk.js / logo.6ce24c58...svg）
+_HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{8,}\.")
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def is_hashed_asset(filename: str) -> bool:
+    return bool(_HASHED_NAME_RE.search(os.path.basename(filename)))
+
+
+def _compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return tuple(encoding for encoding, _ in ENCODING_SUFFIXES if encoding != "br" or brotli is not None)
+
+
+def _iter_compressible(build_dir: str, min_bytes: int) -> Iterator[str]:
+    for root, _dirs, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS and os.path.getsize(path) >= min_bytes:
+                yield path
+
+
+def precompress(build_dir: str, min_bytes: int = 1024) -> int:
+    """
+    build_dir 以下の圧縮の効くファイルの .gz / .br を作ります（元より新しいものが既にあれば作らない）。
+    作成したファイル数を返します。書き込みは一時ファイルからの置き換えのため、複数プロセスで同時に実行しても壊れません。
+    """
+    if not os.path.isdir(build_dir):
+        return 0
+    created = 0
+    for path in list(_iter_compressible(build_dir, min_bytes)):
+        source_mtime = os.path.getmtime(path)
+        data = None
+        for encoding, suffix in ENCODING_SUFFIXES:
+            if encoding not in available_encodings():
+                continue
+            target = path + suffix
+            if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            compressed = _compress(data, encoding)
+            if len(compressed) >= len(data):
+                continue
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".precompress-")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(compressed)
+                os.replace(tmp_path, target)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            created += 1
+    return created
+
+
+def negotiate(encodings: Tuple[str, ...]) -> Optional[str]:
+    """Accept-Encoding で受け付けられる encodings のうち、品質値が最も高いもの（同じ場合は先のもの）"""
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = request.accept_encodings.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class SpaShell(NamedTuple):
+    """メモリ上のSPAシェル。bodies はエンコーディング（非圧縮は None）→ 本文。"""
+    etag: str
+    bodies: Dict[Optional[str], bytes]
+
+
+def load_shell(path: str) -> SpaShell:
+    with open(path, "rb") as f:
+        data = f.read()
+    bodies: Dict[Optional[str], bytes] = {None: data}
+    for encoding in available_encodings():
+        bodies[encoding] = _compress(data, encoding)
+    return SpaShell(hashlib.sha256(data).hexdigest()[:20], bodies)
+
+
+class StaticAssets:
+    """ビルド成果物のディレクトリ（build_dir）と、その static/ 以下を /static で配信します。"""
+
+    def __init__(self, build_dir: str, shell_name: str = "index.html"):
+        self.build_dir = build_dir
+        self.shell_name = shell_name
+        self._shell: Optional[SpaShell] = None
+        self._shell_mtime: Optional[float] = None
+
+    def send(self, directory: str, filename: str, kind: str = "asset") -> Response:
+        """directory 内の filename を、受け付けられる圧縮済みのファイルがあればそれで返します。"""
+        path = safe_join(directory, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        candidates = tuple(encoding for encoding, suffix in ENCODING_SUFFIXES if os.path.isfile(path + suffix))
+        encoding = negotiate(candidates) if candidates else None
+        served = path + dict(ENCODING_SUFFIXES)[encoding] if encoding else path
+        # 圧縮版は別の ETag になる（ファイル毎に send_file が付ける）ため、表現毎に正しく再検証される
+        response = send_file(served, mimetype=mimetype, conditional=True, max_age=None)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if candidates:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL if is_hashed_asset(filename) else REVALIDATE_CACHE_CONTROL
+        STATIC_RESPONSES.inc(kind=kind, encoding=encoding or "identity")
+        return response
+
+    def send_static(self, filename: str) -> Response:
+        return self.send(os.path.join(self.build_dir, "static"), filename)
+
+    def has_root_file(self, filename: str) -> bool:
+        """build_dir 直下のファイル（manifest.json, favicon.ico 等）か"""
+        if not filename or "/" in filename or filename == self.shell_name:
+            return False
+        return os.path.isfile(os.path.join(self.build_dir, filename))
+
+    def send_root_file(self, filename: str) -> Response:
+        return self.send(self.build_dir, filename, kind="root")
+
+    def shell(self) -> SpaShell:
+        """メモリ上のSPAシェル。ファイルが更新された場合（開発時の再ビルド）は読み直します。"""
+        path = os.path.join(self.build_dir, self.shell_name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            abort(404)
+        if self._shell is None or mtime != self._shell_mtime:
+            self._shell, self._shell_mtime = load_shell(path), mtime
+        return self._shell
+
+    def send_shell(self) -> Response:
+        shell = self.shell()
+        encoding = negotiate(tuple(e for e in shell.bodies if e is not None))
+        # 表現（エンコーディング）毎に異なる強い ETag にする
+        etag = f"{shell.etag}-{encoding}" if encoding else shell.etag
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(shell.bodies[encoding], mimetype="text/html")
+            if encoding:
+                response.headers["Content-Encoding"] = encoding
+        response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+        STATIC_RESPONSES.inc(kind="shell", encoding=encoding or "identity")
+        return response
+
+
+def init_app(app: Flask, build_dir: str) -> StaticAssets:
+    """
+    /static/<filename> を登録し、STATIC_PRECOMPRESS（既定1）の場合は圧縮版を作ります。
+    STATIC_PRECOMPRESS_MIN_BYTES（既定1024）未満のファイルは圧縮しません。
+    """
+    assets = StaticAssets(build_dir)
+    if os.environ.get("STATIC_PRECOMPRESS", "1").lower() in ("1", "true", "yes"):
+        try:
+            created = precompress(build_dir, int(os.environ.get("STATIC_PRECOMPRESS_MIN_BYTES", "1024")))
+            if created:
+                logger.info("Precompressed %d static files", created, extra={"encodings": list(available_encodings())})
+        except OSError:
+            # 読み取り専用のファイルシステム等では、圧縮版なしで配信する
+            logger.exception("Static precompression failed; serving uncompressed files")
+    app.add_url_rule("/static/<path:filename>", endpoint="static", view_func=assets.send_static)
+    return assets
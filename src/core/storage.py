@@ -0,0 +1,94 @@
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Sequence
+from src.core.request_stats import storage_job
+
+
+class QueryParameter(NamedTuple):
+    """バックエンド非依存のスカラークエリパラメータ（BigQueryのScalarQueryParameter相当）"""
+    name: str
+    type_: str  # "STRING", "INT64", "FLOAT64", "TIMESTAMP", "DATE", "JSON", "BOOL"
+    value: Any
+
+
+class QueryResult:
+    """クエリ結果の行（dict）とジョブ統計を保持します。"""
+
+    def __init__(self, rows: List[Dict[str, Any]], num_dml_affected_rows: Optional[int] = None,
+                 total_bytes_processed: Optional[int] = None, slot_millis: Optional[int] = None,
+                 cache_hit: Optional[bool] = None):
+        self.rows = rows
+        self.num_dml_affected_rows = num_dml_affected_rows
+        # BigQueryのジョブ統計（取得できないバックエンドでは None）
+        self.total_bytes_processed = total_bytes_processed
+        self.slot_millis = slot_millis
+        self.cache_hit = cache_hit
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def first(self) -> Optional[Dict[str, Any]]:
+        return self.rows[0] if self.rows else None
+
+
+class StorageBackend(ABC):
+    """
+    サービス層が利用するストレージバックエンドのインターフェース。
+    クエリはBigQuery標準SQL（`@name` 形式のパラメータ）で記述し、各実装が方言を吸収します。
+    `;` 区切りの複数ステートメント（スクリプト）も1ジョブとして実行でき、最後のステートメントの結果を返します。
+    公開メソッドは呼び出し毎の所要時間とジョブ統計をリクエスト・メトリクスに記録し（src/core/request_stats.py）、
+    実際の処理は各実装の `_` 付きメソッドに委譲します。
+    """
+
+    def query(self, sql: str, params: Optional[Sequence[QueryParameter]] = None) -> QueryResult:
+        """パラメータ付きクエリ（SELECT/DML/スクリプト）を実行し、結果を返します。"""
+        with storage_job("query") as job:
+            result = self._query(sql, params)
+            job.bytes_processed = result.total_bytes_processed
+            job.slot_millis = result.slot_millis
+            job.cache_hit = result.cache_hit
+        return result
+
+    def iter_query_pages(self, sql: str, params: Optional[Sequence[QueryParameter]] = None,
+                         page_size: int = 1000) -> Iterator[List[Dict[str, Any]]]:
+        """
+        SELECTを実行し、結果を page_size 行ずつのページとして遅延して返します。
+        クエリ自体は呼び出し時に実行され、保持するのは常に1ページ分の行だけです。
+        """
+        with storage_job("query_pages"):
+            return self._iter_query_pages(sql, params, page_size)
+
+    def insert_rows(self, table_id: str, rows: List[Dict[str, Any]], row_ids: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        """
+        行を挿入します。insert_rows_jsonと同様にエラーのリストを返します（成功時は空）。
+        row_ids は重複排除用のinsertId（再送時のベストエフォートな重複防止に使用）。
+        """
+        with storage_job("insert_rows"):
+            return self._insert_rows(table_id, rows, row_ids)
+
+    def load_ndjson(self, table_id: str, source: BinaryIO) -> int:
+        """
+        改行区切りJSON（NDJSON）をバッチロードジョブで追記し、ロードした行数を返します。
+        ストリーミング挿入と異なり、ロードした行はすぐに更新・削除できます。1行でも不正な行があればジョブ全体が失敗します。
+        """
+        with storage_job("load"):
+            return self._load_ndjson(table_id, source)
+
+    @abstractmethod
+    def _query(self, sql: str, params: Optional[Sequence[QueryParameter]]) -> QueryResult:
+        """バックエンド固有のクエリ実行"""
+
+    @abstractmethod
+    def _iter_query_pages(self, sql: str, params: Optional[Sequence[QueryParameter]],
+                          page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        """バックエンド固有のページ単位のクエリ実行"""
+
+    @abstractmethod
+    def _insert_rows(self, table_id: str, rows: List[Dict[str, Any]], row_ids: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        """バックエンド固有の行挿入"""
+
+    @abstractmethod
+    def _load_ndjson(self, table_id: str, source: BinaryIO) -> int:
+        """バックエンド固有のバッチロード"""
@@ -0,0 +1,56 @@
+"""
+テーブルのパーティション・クラスタリング定義（Table_JSON/<table>_layout.json）。
+
+定義はBigQueryのテーブルリソースの timePartitioning / clustering と同じ形式で、
+src/tools/migrate_tables.py がテーブルの作成・移行に、SQLiteBackend がインデックスの作成に使用します。
+"""
+import json
+import os
+from datetime import date, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+
+LAYOUT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'Table_JSON'))
+
+
+class TableLayout(NamedTuple):
+    table: str
+    # パーティション列（None の場合はパーティション分割しない）と単位（DAY / MONTH 等）
+    partition_field: Optional[str]
+    partition_type: Optional[str]
+    clustering_fields: Tuple[str, ...]
+
+    def to_api_repr(self) -> Dict[str, dict]:
+        resource: Dict[str, dict] = {}
+        if self.partition_field:
+            resource["timePartitioning"] = {"type": self.partition_type, "field": self.partition_field}
+        if self.clustering_fields:
+            resource["clustering"] = {"fields": list(self.clustering_fields)}
+        return resource
+
+
+def load_layouts(layout_dir: str = LAYOUT_DIR) -> Dict[str, TableLayout]:
+    """<table>_layout.json をすべて読み込みます（キーは Table_JSON のテーブル名）。"""
+    layouts = {}
+    for filename in sorted(os.listdir(layout_dir)):
+        if not filename.endswith('_layout.json'):
+            continue
+        table = filename[:-len('_layout.json')]
+        with open(os.path.join(layout_dir, filename), encoding='utf-8') as f:
+            resource = json.load(f)
+        partitioning = resource.get("timePartitioning") or {}
+        layouts[table] = TableLayout(
+            table,
+            partitioning.get("field"),
+            partitioning.get("type", "DAY") if partitioning.get("field") else None,
+            tuple((resource.get("clustering") or {}).get("fields", ())),
+        )
+    return layouts
+
+
+def utc_day_range(start_date: date, end_date: date) -> Tuple[str, str]:
+    """
+    DATE(ts)（UTC）が start_date〜end_date となる ts の範囲 [start, end) をTIMESTAMPパラメータ用の文字列で返します。
+    DATE(start_time) BETWEEN ... の代わりに start_time >= @start AND start_time < @end と書くと、
+    パーティション列を直接比較するためパーティションのプルーニングが確実に効きます。
+    """
+    return f"{start_date}T00:00:00+00:00", f"{end_date + timedelta(days=1)}T00:00:00+00:00"
@@ -3,6 +3,9 @@ from datetime import datetime
 from typing import Optional
 import uuid
 
+# 負荷ポイントの集計対象とするカテゴリ
+LOAD_CATEGORY_IDS = ('business', 'study', 'private')
+
 class ActivityBase(BaseModel):
     """行動記録の基本モデル"""
     start_time: datetime = Field(..., description="活動の開始日時")
@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Union
+from src.core.metrics import REGISTRY
+from src.models.activity import ActivityInDB
+
+CACHE_REQUESTS = REGISTRY.counter("activity_cache_requests_total", "行動記録キャッシュの参照回数", ("result",))
+CACHED_ROWS = REGISTRY.gauge("activity_cache_rows", "キャッシュ中の行動記録の行数")
+
+Bound = Optional[datetime]
+
+
+def parse_bound(value: Union[str, datetime, None]) -> Bound:
+    """期間指定（ISO8601文字列/datetime/None）をUTCのdatetimeに正規化します。"""
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        text = value.strip()
+        if text.endswith('Z'):
+            text = text[:-1] + '+00:00'
+        value = datetime.fromisoformat(text)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class _CachedRange:
+    """ある期間 [start, end] の検索結果（start_time >= start AND end_time <= end）"""
+
+    def __init__(self, start: Bound, end: Bound, activities: List[ActivityInDB]):
+        self.start = start
+        self.end = end
+        self.rows: Dict[str, ActivityInDB] = {a.id: a for a in activities}
+        self.loaded_at = time.monotonic()
+
+    def covers(self, start: Bound, end: Bound) -> bool:
+        start_ok = self.start is None or (start is not None and start >= self.start)
+        end_ok = self.end is None or (end is not None and end <= self.end)
+        return start_ok and end_ok
+
+    def contains(self, activity: ActivityInDB, start: Bound = None, end: Bound = None) -> bool:
+        start = start if start is not None else self.start
+        end = end if end is not None else self.end
+        if start is not None and _aware(activity.start_time) < start:
+            return False
+        if end is not None and _aware(activity.end_time) > end:
+            return False
+        return True
+
+
+class ActivityRangeCache:
+    """
+    ユーザー毎・期間毎の行動記録キャッシュ（プロセス内）。
+    キャッシュ済み期間に包含される期間の検索はメモリ上で絞り込んで返します。
+    総行数の上限を超えた場合は最も長く参照されていないユーザーから破棄します（LRU）。
+    作成・更新・削除時には該当ユーザーのキャッシュ済み期間をその場で書き換えます。
+    """
+
+    def __init__(self, max_rows: int = 100000, ttl_seconds: float = 300.0, max_ranges_per_user: int = 8):
+        self.max_rows = max_rows
+        self.ttl_seconds = ttl_seconds
+        self.max_ranges_per_user = max_ranges_per_user
+        self._users: "OrderedDict[str, List[_CachedRange]]" = OrderedDict()
+        self._row_count = 0
+        self._lock = threading.Lock()
+
+    def _live_ranges_locked(self, user_id: str) -> List[_CachedRange]:
+        ranges = self._users.get(user_id)
+        if not ranges:
+            return []
+        now = time.monotonic()
+        live = [r for r in ranges if now - r.loaded_at < self.ttl_seconds]
+        if len(live) != len(ranges):
+            self._row_count -= sum(len(r.rows) for r in ranges if r not in live)
+            if live:
+                self._users[user_id] = live
+            else:
+                del self._users[user_id]
+        return live
+
+    def get(self, user_id: str, start: Bound, end: Bound) -> Optional[List[ActivityInDB]]:
+        """キャッシュで応答できる場合は start_time 降順のリストを、できない場合は None を返します。"""
+        with self._lock:
+            for cached in self._live_ranges_locked(user_id):
+                if cached.covers(start, end):
+                    self._users.move_to_end(user_id)
+                    rows = [a for a in cached.rows.values() if cached.contains(a, start, end)]
+                    CACHE_REQUESTS.inc(result="hit")
+                    rows.sort(key=lambda a: _aware(a.start_time), reverse=True)
+                    return rows
+        CACHE_REQUESTS.inc(result="miss")
+        return None
+
+    def find(self, user_id: str, activity_id: str) -> Optional[ActivityInDB]:
+        """キャッシュ済みの期間に含まれる行動記録をIDで探します。"""
+        with self._lock:
+            for cached in self._live_ranges_locked(user_id):
+                activity = cached.rows.get(activity_id)
+                if activity is not None:
+                    return activity
+        return None
+
+    def put(self, user_id: str, start: Bound, end: Bound, activities: List[ActivityInDB]) -> None:
+        if len(activities) > self.max_rows:
+            return
+        with self._lock:
+            ranges = self._live_ranges_locked(user_id)
+            # 新しい期間に包含される既存の期間は不要になる
+            kept = [r for r in ranges if not _CachedRange(start, end, []).covers(r.start, r.end)]
+            kept.append(_CachedRange(start, end, activities))
+            if len(kept) > self.max_ranges_per_user:
+                kept = kept[-self.max_ranges_per_user:]
+            self._row_count += sum(len(r.rows) for r in kept) - sum(len(r.rows) for r in ranges)
+            self._users[user_id] = kept
+            self._users.move_to_end(user_id)
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        while self._row_count > self.max_rows and self._users:
+            _, ranges = self._users.popitem(last=False)
+            self._row_count -= sum(len(r.rows) for r in ranges)
+        CACHED_ROWS.set(self._row_count)
+
+    def on_created(self, user_id: str, activity: ActivityInDB) -> None:
+        with self._lock:
+            for cached in self._live_ranges_locked(user_id):
+                if cached.contains(activity) and activity.id not in cached.rows:
+                    cached.rows[activity.id] = activity
+                    self._row_count += 1
+            self._evict_locked()
+
+    def on_updated(self, user_id: str, activity: ActivityInDB) -> None:
+        with self._lock:
+            for cached in self._live_ranges_locked(user_id):
+                if cached.rows.pop(activity.id, None) is not None:
+                    self._row_count -= 1
+                if cached.contains(activity):
+                    cached.rows[activity.id] = activity
+                    self._row_count += 1
+            self._evict_locked()
+
+    def on_deleted(self, user_id: str, activity_id: str) -> None:
+        with self._lock:
+            for cached in self._live_ranges_locked(user_id):
+                if cached.rows.pop(activity_id, None) is not None:
+                    self._row_count -= 1
+            CACHED_ROWS.set(self._row_count)
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            ranges = self._users.pop(user_id, [])
+            self._row_count -= sum(len(r.rows) for r in ranges)
+            CACHED_ROWS.set(self._row_count)
+
+
+def create_activity_cache_from_env() -> Optional[ActivityRangeCache]:
+    """ACTIVITY_CACHE_MAX_ROWS が未指定または0の場合はキャッシュを無効にします（既定は無効）。
+
+    キャッシュはプロセス内にしかないため、他のワーカー・インスタンスでの更新は
+    TTLが切れるまで反映されません。単一プロセスで動かす場合にのみ有効にしてください。
+    """
+    max_rows = int(os.environ.get("ACTIVITY_CACHE_MAX_ROWS", "0"))
+    if max_rows <= 0:
+        return None
+    return ActivityRangeCache(
+        max_rows=max_rows,
+        ttl_seconds=float(os.environ.get("ACTIVITY_CACHE_TTL_SECONDS", "300")),
+    )
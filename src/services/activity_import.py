@@ -0,0 +1,65 @@
+import csv
+import json
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+# (行番号, 解析済みの行 or None, 解析エラー or None)
+ImportRecord = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+IMPORT_FORMATS = ("ndjson", "csv")
+
+
+def read_ndjson(stream: TextIO) -> Iterator[ImportRecord]:
+    """NDJSONを1行ずつ読み、空行は読み飛ばします。"""
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "each line must be a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def read_csv(stream: TextIO) -> Iterator[ImportRecord]:
+    """ヘッダ付きCSVを1行ずつ読みます。空のセルは未指定（None）として扱います。"""
+    reader = csv.DictReader(stream)
+    for row in reader:
+        # 行番号はヘッダを1行目とした物理行番号
+        line_number = reader.line_num
+        if None in row:
+            yield line_number, None, "too many columns"
+            continue
+        yield line_number, {key: (value if value != "" else None) for key, value in row.items()}, None
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[ImportRecord]:
+    if fmt == "csv":
+        return read_csv(stream)
+    return read_ndjson(stream)
+
+
+class ImportResult:
+    """一括インポートの結果。エラーの詳細は先頭 max_reported_errors 件のみ保持します。"""
+
+    def __init__(self, max_reported_errors: int = 100):
+        self.max_reported_errors = max_reported_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def add_error(self, line_number: int, errors: Any) -> None:
+        self.failed += 1
+        if len(self.errors) < self.max_reported_errors:
+            self.errors.append({"line": line_number, "errors": errors})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
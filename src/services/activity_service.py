@@ -1,59 +1,323 @@
-from google.cloud import bigquery
-from typing import List, Optional
+from src.core.storage import QueryParameter, StorageBackend
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+from datetime import date, datetime, timezone
+import base64
+import json
 import logging
+import tempfile
+from pydantic import TypeAdapter, ValidationError
 from src.models.activity import ActivityCreate, ActivityUpdate, ActivityInDB
+from src.services.activity_import import ImportRecord, ImportResult
+from src.services.activity_cache import ActivityRangeCache, parse_bound
+from src.services.activity_write_buffer import ActivityWriteBuffer
+from src.services.daily_rollup_service import DailyRollupService, rollup_date
+from src.services.data_version import DataVersion, DataVersions
+
+logger = logging.getLogger(__name__)
+
+ACTIVITY_FIELDS = tuple(ActivityInDB.model_fields)
+
+
+def _utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def encode_cursor(start_time: datetime, activity_id: str) -> str:
+    """ページングカーソル（(start_time, id) を不透明な文字列にしたもの）"""
+    payload = json.dumps([_utc(start_time).isoformat(), activity_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        start_time, activity_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return _utc(datetime.fromisoformat(start_time)), str(activity_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
 
 class ActivityService:
-    def __init__(self, db_client: bigquery.Client, table_id: str):
+    def __init__(self, db_client: StorageBackend, table_id: str, write_buffer: Optional[ActivityWriteBuffer] = None,
+                 cache: Optional[ActivityRangeCache] = None, rollups: Optional[DailyRollupService] = None,
+                 versions: Optional[DataVersions] = None):
         self.client = db_client
         self.table_id = table_id
+        # 有効な場合、挿入はwrite-behindバッファ経由でまとめて行う
+        self.write_buffer = write_buffer
+        # ユーザー毎・期間毎の読み取りキャッシュ（作成・更新・削除時にその場で書き換える）
+        self.cache = cache
+        # 日次集計（作成・更新・削除時に差分を反映する。反映の失敗は書き込みの結果に影響しない）
+        self.rollups = rollups
+        # ユーザー毎のデータバージョン（作成・更新・削除の完了直後に進め、一覧の条件付きGETに使う）
+        self.versions = versions
+        if self.write_buffer is not None and (self.rollups is not None or self.versions is not None):
+            self.write_buffer.on_flush = self._on_buffer_flush
 
-    def create_activity(self, user_id: str, activity_data: ActivityCreate) -> Optional[ActivityInDB]:
-        """新しい行動記録をBigQueryに挿入します。"""
-        new_record = ActivityInDB(user_id=user_id, **activity_data.dict())
-        record_dict = new_record.dict(by_alias=True)
-        # datetime型をISO8601文字列に変換
+    def _on_buffer_flush(self, rows: List[dict]) -> None:
+        # バッファ経由の挿入は、フラッシュ単位でまとめて集計に反映する
+        if self.rollups is not None:
+            self.rollups.on_created(ActivityInDB(**row) for row in rows)
+        # テーブルに書き込まれた時点で再度バージョンを進める（追加時点ではまだ一覧に含まれないため）
+        for user_id in {row["user_id"] for row in rows}:
+            self._changed(user_id)
+
+    def data_version(self, user_id: str) -> Optional[DataVersion]:
+        """ユーザーの行動記録の現在のバージョン（無効な場合は None）"""
+        return self.versions.current(user_id) if self.versions is not None else None
+
+    def _changed(self, user_id: str) -> None:
+        if self.versions is not None:
+            self.versions.bump(user_id)
+
+    @classmethod
+    def _to_row(cls, record: ActivityInDB) -> dict:
+        """挿入用の行（datetime型はISO8601文字列）に変換します。"""
+        return cls._to_row_values(record.dict(by_alias=True))
+
+    @staticmethod
+    def _to_row_values(record_dict: dict) -> dict:
         for k in ["created_at", "updated_at", "start_time", "end_time"]:
             if isinstance(record_dict.get(k), (str, type(None))):
                 continue
             record_dict[k] = record_dict[k].isoformat()
+        return record_dict
+
+    def create_activity(self, user_id: str, activity_data: ActivityCreate) -> Optional[ActivityInDB]:
+        """新しい行動記録をBigQueryに挿入します。"""
+        new_record = ActivityInDB(user_id=user_id, **activity_data.dict())
+        record_dict = self._to_row(new_record)
+        if self.write_buffer is not None:
+            self.write_buffer.add(record_dict)
+            if self.cache is not None:
+                self.cache.on_created(user_id, new_record)
+            self._changed(user_id)
+            return new_record
+
         rows_to_insert = [record_dict]
-        errors = self.client.insert_rows_json(self.table_id, rows_to_insert)
+        errors = self.client.insert_rows(self.table_id, rows_to_insert)
         
         if errors:
-            logging.error(f"Failed to insert rows into BigQuery: {errors}")
+            logger.error("Failed to insert activity rows: %s", errors)
             return None
         
+        if self.cache is not None:
+            self.cache.on_created(user_id, new_record)
+        if self.rollups is not None:
+            self.rollups.on_created([new_record])
+        self._changed(user_id)
         return new_record
 
-    def get_activities_by_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[ActivityInDB]:
-        """ユーザーIDに基づいて行動記録のリストを取得します。"""
+    def import_activities(self, user_id: str, records: Iterable[ImportRecord], chunk_rows: int = 1000,
+                          max_reported_errors: int = 100, spool_max_bytes: int = 8 * 1024 * 1024) -> ImportResult:
+        """
+        行動記録を一括でインポートします。
+        行を chunk_rows 件ずつ ActivityCreate で検証し、有効な行だけを一時ファイル（一定サイズまではメモリ）に
+        NDJSONとして書き出してから、1回のバッチロードジョブで追記します。不正な行は行番号とエラー内容を返します。
+        """
+        result = ImportResult(max_reported_errors)
+        first_date: Optional[date] = None
+        last_date: Optional[date] = None
+        with tempfile.SpooledTemporaryFile(max_size=spool_max_bytes, mode="w+b") as spool:
+            chunk: List[tuple] = []
+
+            def flush_chunk():
+                nonlocal first_date, last_date
+                for line_number, activity in self._validate_import_chunk(chunk, result):
+                    record = ActivityInDB(user_id=user_id, **activity.dict())
+                    spool.write(json.dumps(self._to_row(record), ensure_ascii=False).encode("utf-8") + b"\n")
+                    day = rollup_date(record)
+                    first_date = day if first_date is None or day < first_date else first_date
+                    last_date = day if last_date is None or day > last_date else last_date
+                    result.imported += 1
+                chunk.clear()
+
+            for line_number, row, error in records:
+                if error is not None:
+                    result.add_error(line_number, [{"msg": error}])
+                    continue
+                chunk.append((line_number, row))
+                if len(chunk) >= chunk_rows:
+                    flush_chunk()
+            flush_chunk()
+
+            if result.imported:
+                spool.seek(0)
+                loaded = self.client.load_ndjson(self.table_id, spool)
+                logger.info("Imported %d activities for user_id=%s (%d rows rejected)", loaded, user_id, result.failed)
+
+        if result.imported:
+            # ロードした行はキャッシュに無いため、該当ユーザーのキャッシュを破棄して次回の検索で読み直す
+            if self.cache is not None:
+                self.cache.invalidate_user(user_id)
+            if self.rollups is not None:
+                try:
+                    self.rollups.rebuild(user_id=user_id, start_date=first_date, end_date=last_date)
+                except Exception:
+                    # ロード済みの行は取り消せないため、インポート自体は成功として返す（期間は再集計待ちに残る）
+                    logger.exception("Failed to rebuild daily rollups after import for user_id=%s", user_id)
+            self._changed(user_id)
+        return result
+
+    _import_adapter = TypeAdapter(List[ActivityCreate])
+
+    @classmethod
+    def _validate_import_chunk(cls, chunk: List[tuple], result: ImportResult):
+        """チャンク全体を一括で検証し、不正な行を含む場合のみ1行ずつ検証し直します。"""
+        try:
+            activities = cls._import_adapter.validate_python([row for _, row in chunk])
+            return [(line_number, activity) for (line_number, _), activity in zip(chunk, activities)]
+        except ValidationError:
+            pass
+        valid = []
+        for line_number, row in chunk:
+            try:
+                valid.append((line_number, ActivityCreate(**row)))
+            except ValidationError as e:
+                result.add_error(line_number, e.errors(include_url=False, include_context=False, include_input=False))
+        return valid
+
+    def get_activities_by_user(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                               fields: Optional[Sequence[str]] = None, limit: Optional[int] = None,
+                               cursor: Optional[str] = None) -> List:
+        """
+        ユーザーIDに基づいて行動記録のリストを取得します。
+        fields / limit / cursor を指定した場合は、指定列（id, start_time は常に含む）だけを選択し、
+        (start_time, id) の降順でカーソルより後の最大 limit 件を dict のリストで返します。
+        """
+        if fields is None and limit is None and cursor is None:
+            return self._get_all_activities(user_id, start_date, end_date)
+
+        columns = self._projection(fields)
+        after = decode_cursor(cursor) if cursor else None
+        cache_key = self._cache_bounds(start_date, end_date)
+        if cache_key is not None:
+            cached = self.cache.get(user_id, *cache_key)
+            if cached is not None:
+                # キャッシュ済みの期間はメモリ上でカーソル以降を切り出す
+                cached.sort(key=lambda a: (_utc(a.start_time), a.id), reverse=True)
+                if after is not None:
+                    cached = [a for a in cached if (_utc(a.start_time), a.id) < after]
+                return [a.dict(include=set(columns)) for a in cached[:limit]]
+
+        query, params = self._list_query(user_id, start_date, end_date, columns=columns, after=after, limit=limit)
+        return list(self.client.query(query, params))
+
+    def get_activity_page(self, user_id: str, limit: int, cursor: Optional[str] = None,
+                          start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          fields: Optional[Sequence[str]] = None) -> Tuple[List[dict], Optional[str]]:
+        """1ページ分の行動記録と、次のページのカーソル（最後のページでは None）を返します。"""
+        rows = self.get_activities_by_user(user_id, start_date, end_date, fields=fields, limit=limit + 1, cursor=cursor)
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1]["start_time"], rows[-1]["id"])
+
+    def _get_all_activities(self, user_id: str, start_date: Optional[str], end_date: Optional[str]) -> List[ActivityInDB]:
+        cache_key = self._cache_bounds(start_date, end_date)
+        if cache_key is not None:
+            cached = self.cache.get(user_id, *cache_key)
+            if cached is not None:
+                return cached
+
+        query, params = self._list_query(user_id, start_date, end_date)
+        query_result = self.client.query(query, params)
+        
+        results = []
+        for row in query_result:
+            results.append(ActivityInDB(**row))
+        
+        if cache_key is not None:
+            self.cache.put(user_id, *cache_key, results)
+        return results
+
+    @staticmethod
+    def _projection(fields: Optional[Sequence[str]]) -> List[str]:
+        """選択する列。カーソルの生成に必要な id, start_time は常に含めます。"""
+        if not fields:
+            return list(ACTIVITY_FIELDS)
+        unknown = [name for name in fields if name not in ACTIVITY_FIELDS]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+        return [name for name in ACTIVITY_FIELDS if name in fields or name in ("id", "start_time")]
+
+    def iter_activity_pages(self, user_id: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            page_size: int = 1000) -> Iterator[List[dict]]:
+        """
+        get_activities_by_user と同じ条件の行動記録を、page_size 行ずつのページ（dict）で遅延して返します（エクスポート用）。
+        結果全体をメモリに載せず、キャッシュにも格納しません。
+        """
+        query, params = self._list_query(user_id, start_date, end_date)
+        return self.client.iter_query_pages(query, params, page_size=page_size)
+
+    def _list_query(self, user_id: str, start_date: Optional[str], end_date: Optional[str],
+                    columns: Optional[Sequence[str]] = None, after: Optional[Tuple[datetime, str]] = None,
+                    limit: Optional[int] = None):
+        select = ", ".join(columns) if columns else "*"
         query = f""" 
-            SELECT * 
+            SELECT {select} 
             FROM `{self.table_id}`
             WHERE user_id = @user_id
         """
-        params = [bigquery.ScalarQueryParameter("user_id", "STRING", user_id)]
+        params = [QueryParameter("user_id", "STRING", user_id)]
 
         if start_date:
             query += " AND start_time >= @start_date"
-            params.append(bigquery.ScalarQueryParameter("start_date", "TIMESTAMP", start_date))
+            params.append(QueryParameter("start_date", "TIMESTAMP", start_date))
         if end_date:
-            query += " AND end_time <= @end_date"
-            params.append(bigquery.ScalarQueryParameter("end_date", "TIMESTAMP", end_date))
+            # start_time <= end_time なので start_time の上限は結果を変えないが、パーティション（DATE(start_time)）を絞り込める
+            query += " AND end_time <= @end_date AND start_time <= @end_date"
+            params.append(QueryParameter("end_date", "TIMESTAMP", end_date))
+        if after is not None:
+            # キーセット方式：(start_time, id) がカーソルより小さい行だけを読む
+            query += " AND (start_time < @cursor_start_time OR (start_time = @cursor_start_time AND id < @cursor_id))"
+            params.append(QueryParameter("cursor_start_time", "TIMESTAMP", after[0]))
+            params.append(QueryParameter("cursor_id", "STRING", after[1]))
 
-        query += " ORDER BY start_time DESC"
+        if after is not None or limit is not None:
+            query += " ORDER BY start_time DESC, id DESC"
+        else:
+            query += " ORDER BY start_time DESC"
+        if limit is not None:
+            query += " LIMIT @limit"
+            params.append(QueryParameter("limit", "INT64", limit))
+        return query, params
 
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        
-        results = []
-        for row in query_job:
-            results.append(ActivityInDB(**row))
-        
-        return results
+    def _cache_bounds(self, start_date: Optional[str], end_date: Optional[str]):
+        """キャッシュのキーとなる期間を返します。キャッシュが無効、または解釈できない期間の場合は None。"""
+        if self.cache is None:
+            return None
+        try:
+            return parse_bound(start_date), parse_bound(end_date)
+        except ValueError:
+            return None
+
+    def get_cached_activities_started_between(self, user_id: str, start_time: str,
+                                              end_time: str) -> Optional[List[ActivityInDB]]:
+        """
+        start_time が [start_time, end_time) の行動記録を、キャッシュ済みの期間から応答できる場合に返します（できない場合は None）。
+        終了日時で絞り込んだ期間には翌日にまたがる行が含まれないため、終了側が開いた期間だけを使います。
+        """
+        cache_key = self._cache_bounds(start_time, None)
+        if cache_key is None:
+            return None
+        cached = self.cache.get(user_id, *cache_key)
+        if cached is None:
+            return None
+        end = parse_bound(end_time)
+        return [a for a in cached if _utc(a.start_time) < end]
 
     def get_activity_by_id(self, activity_id: str, user_id: str) -> Optional[ActivityInDB]:
         """特定のIDとユーザーIDに基づいて行動記録を取得します。"""
+        if self.write_buffer is not None:
+            buffered = self.write_buffer.get_pending(activity_id, user_id)
+            if buffered is not None:
+                return ActivityInDB(**buffered)
+        if self.cache is not None:
+            cached = self.cache.find(user_id, activity_id)
+            if cached is not None:
+                return cached
+
         query = f"""
             SELECT * 
             FROM `{self.table_id}`
@@ -61,73 +325,150 @@ class ActivityService:
             LIMIT 1
         """
         params = [
-            bigquery.ScalarQueryParameter("activity_id", "STRING", activity_id),
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+            QueryParameter("activity_id", "STRING", activity_id),
+            QueryParameter("user_id", "STRING", user_id)
         ]
 
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        
-        result = list(query_job.result())
-        if result:
-            return ActivityInDB(**result[0])
+        row = self.client.query(query, params).first()
+        if row:
+            return ActivityInDB(**row)
         return None
 
     def update_activity(self, activity_id: str, user_id: str, update_data: ActivityUpdate) -> Optional[ActivityInDB]:
         """既存の行動記録を更新します。"""
         updates = []
         params = [
-            bigquery.ScalarQueryParameter("activity_id", "STRING", activity_id),
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+            QueryParameter("activity_id", "STRING", activity_id),
+            QueryParameter("user_id", "STRING", user_id)
         ]
 
         # 更新対象のフィールドを動的に構築
         for field, value in update_data.dict(exclude_unset=True).items():
             if field == "start_time" or field == "end_time":
                 updates.append(f"{field} = @{field}")
-                params.append(bigquery.ScalarQueryParameter(field, "TIMESTAMP", value))
+                params.append(QueryParameter(field, "TIMESTAMP", value))
             elif field == "fatigue_level":
                 updates.append(f"{field} = @{field}")
-                params.append(bigquery.ScalarQueryParameter(field, "INT64", value))
+                params.append(QueryParameter(field, "INT64", value))
             else:
                 updates.append(f"{field} = @{field}")
-                params.append(bigquery.ScalarQueryParameter(field, "STRING", value))
+                params.append(QueryParameter(field, "STRING", value))
         
         if not updates:
             return self.get_activity_by_id(activity_id, user_id) # 更新データがない場合は現在のレコードを返す
 
-        # updated_at を自動更新
-        updates.append("updated_at = CURRENT_TIMESTAMP()");
+        # updated_at を自動更新（キャッシュ上の行と一致させるためアプリ側の時刻を使う）
+        updated_at = datetime.now(timezone.utc)
 
-        query = f"""
+        if self.write_buffer is not None:
+            # まだバッファにある（テーブルに無い）行は、バッファ上の行に反映する（集計はフラッシュ時に行われる）
+            changes = {**update_data.dict(exclude_unset=True), "updated_at": updated_at}
+            buffered = self.write_buffer.update_pending(activity_id, user_id, self._to_row_values(changes))
+            if buffered is not None:
+                updated = ActivityInDB(**buffered)
+                if self.cache is not None:
+                    self.cache.on_updated(user_id, updated)
+                self._changed(user_id)
+                return updated
+        updates.append("updated_at = @updated_at")
+        params.append(QueryParameter("updated_at", "TIMESTAMP", updated_at))
+
+        update_query = f"""
             UPDATE `{self.table_id}`
             SET {', '.join(updates)}
             WHERE id = @activity_id AND user_id = @user_id
         """
-        
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        query_job.result() # クエリの完了を待つ
 
-        return self.get_activity_by_id(activity_id, user_id)
+        # 日次集計を更新する場合は、差分がずれないよう更新前の行を常にストレージから取得する
+        prior = self.cache.find(user_id, activity_id) if self.cache is not None and self.rollups is None else None
+        updated = None
+        if prior is not None:
+            # キャッシュ上の行が最新（updated_at が一致）の場合に限り、UPDATEの影響行数だけを確認して
+            # ローカルで反映する（1ジョブ）。他で更新・削除されていた場合は下の再取得つきの経路で行う
+            guarded_params = params + [QueryParameter("prior_updated_at", "TIMESTAMP", prior.updated_at)]
+            result = self.client.query(update_query + " AND updated_at = @prior_updated_at", guarded_params)
+            if result.num_dml_affected_rows:
+                updated = prior.model_copy(update={**update_data.dict(exclude_unset=True), "updated_at": updated_at})
+        if updated is None:
+            if self.rollups is not None:
+                # 日次集計の差分計算に更新前の行が必要なため、UPDATEと前後の行の取得を1つのスクリプトで行う
+                prior, updated = self._mutate_returning_rows(update_query, params)
+            else:
+                # UPDATEと再取得を1つのスクリプトジョブで実行する
+                script = update_query + f""";
+                SELECT *
+                FROM `{self.table_id}`
+                WHERE id = @activity_id AND user_id = @user_id
+                LIMIT 1
+                """
+                row = self.client.query(script, params).first()
+                updated = ActivityInDB(**row) if row else None
+            if updated is None:
+                if self.cache is not None:
+                    self.cache.on_deleted(user_id, activity_id)
+                return None
+
+        if self.cache is not None:
+            self.cache.on_updated(user_id, updated)
+        if self.rollups is not None and prior is not None:
+            self.rollups.on_updated(prior, updated)
+        self._changed(user_id)
+        return updated
+
+    def _mutate_returning_rows(self, mutation_query: str, params: List[QueryParameter]):
+        """
+        行動記録1件に対するUPDATE/DELETEを実行し、変更前と変更後の行を1つのスクリプトジョブで返します。
+        該当行が無い場合はそれぞれ None。
+        """
+        script = f"""
+            CREATE TEMP TABLE prior_rows AS
+            SELECT * FROM `{self.table_id}` WHERE id = @activity_id AND user_id = @user_id;
+            {mutation_query};
+            SELECT 'after' AS row_version, * FROM `{self.table_id}` WHERE id = @activity_id AND user_id = @user_id
+            UNION ALL
+            SELECT 'before' AS row_version, * FROM prior_rows
+        """
+        rows = {}
+        for row in self.client.query(script, params):
+            version = row.pop("row_version")
+            rows.setdefault(version, ActivityInDB(**row))
+        return rows.get("before"), rows.get("after")
 
     def delete_activity(self, activity_id: str, user_id: str) -> bool:
         """特定のIDとユーザーIDに基づいて行動記録を削除します。"""
-        logging.info(f"Delete request: activity_id={activity_id}, user_id={user_id}")
         query = f"""
             DELETE FROM `{self.table_id}`
             WHERE id = @activity_id AND user_id = @user_id
         """
         params = [
-            bigquery.ScalarQueryParameter("activity_id", "STRING", activity_id),
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+            QueryParameter("activity_id", "STRING", activity_id),
+            QueryParameter("user_id", "STRING", user_id)
         ]
-        logging.info(f"Executing DELETE query: {query} with params: {params}")
+        logger.debug("delete_activity: activity_id=%s user_id=%s query=%s", activity_id, user_id, query)
+        if self.write_buffer is not None and self.write_buffer.remove_pending(activity_id, user_id) is not None:
+            # まだバッファにある行はバッファから取り除くだけでよい（テーブル・集計には反映されていない）
+            if self.cache is not None:
+                self.cache.on_deleted(user_id, activity_id)
+            self._changed(user_id)
+            return True
+        prior = None
         try:
-            query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-            query_job.result() # クエリの完了を待つ
-        except Exception as e:
-            logging.error(f"BigQuery DELETE error: {e}")
+            if self.rollups is not None:
+                # 日次集計から差し引くため、削除前の行を同じスクリプトでストレージから取得する
+                # （キャッシュ上の行は古い可能性があり、差分がずれるため使わない）
+                prior, _ = self._mutate_returning_rows(query, params)
+                deleted = prior is not None
+            else:
+                result = self.client.query(query, params) # クエリの完了を待つ
+                # DMLの影響行数で削除の成否を判定する（再取得による確認は行わない）
+                deleted = bool(result.num_dml_affected_rows)
+        except Exception:
+            logger.exception("Failed to delete activity_id=%s", activity_id)
             raise
-        # 削除が成功したかを確認するために、再度取得を試みる
-        if self.get_activity_by_id(activity_id, user_id) is None:
-            return True
-        return False
+        if self.cache is not None:
+            self.cache.on_deleted(user_id, activity_id)
+        if deleted and prior is not None:
+            self.rollups.on_deleted(prior)
+        if deleted:
+            self._changed(user_id)
+        return deleted
@@ -0,0 +1,387 @@
+import atexit
+import fcntl
+import glob
+import json
+import logging
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from src.core.metrics import REGISTRY
+from src.core.storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = REGISTRY.histogram(
+    "activity_write_buffer_batch_size", "1回のフラッシュで挿入した行数",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+FLUSH_SECONDS = REGISTRY.histogram("activity_write_buffer_flush_seconds", "バッチ挿入1回の所要時間（秒）")
+FLUSH_FAILURES = REGISTRY.counter("activity_write_buffer_flush_failures_total", "失敗したバッチ挿入の回数")
+PENDING_ROWS = REGISTRY.gauge("activity_write_buffer_pending_rows", "未フラッシュの行数")
+
+SPILL_FILE_PREFIX = "activity-write-buffer-"
+LOCK_SUFFIX = ".lock"
+
+
+def _instance_id() -> str:
+    """スピルファイル名に使うプロセスの識別子（共有ボリューム上で他のインスタンスと重複しない）"""
+    host = re.sub(r"[^A-Za-z0-9-]", "-", socket.gethostname())
+    return f"{host}-{os.getpid()}-{uuid.uuid4().hex[:12]}"
+
+
+def _try_lock(path: str) -> Optional[int]:
+    """path の排他ロックを待たずに取得し、ファイル記述子を返します（他のプロセスが保持している場合は None）。"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class ActivityWriteBuffer:
+    """
+    行動記録のwrite-behindバッファ。
+    受け付けた行をスピルファイルに追記（fsync）してから応答し、バックグラウンドのワーカーが
+    件数または経過時間のしきい値に達した時点でまとめて1回のinsert_rowsでフラッシュします。
+    プロセスが異常終了しても、スピルファイルに残った行は次に起動したプロセスが再送します
+    （spill_dir はインスタンスの停止後も残るディスクであること。省略した場合は永続化しない）。
+    スピルファイルはホスト名・PID・UUIDから成るプロセス毎の名前で作成し、プロセスが動いている間は
+    ロックファイルの排他ロック（flock）を保持します。ロックを取得できたファイルだけを、終了したプロセスの残りとして
+    リネームで引き取るため、同じボリュームを共有する複数のインスタンスでも取り違えません。
+    ワーカーの起動と回収はワーカーの初期化時に start() で行います（app.warm_up）。
+    未フラッシュの行への更新・削除は update_pending / remove_pending でバッファ上の行に反映します。
+    """
+
+    def __init__(self, db_client: StorageBackend, table_id: str, max_rows: int = 500,
+                 max_age_seconds: float = 2.0, spill_dir: Optional[str] = None,
+                 on_flush: Optional[Callable[[List[Dict[str, Any]]], None]] = None):
+        self.client = db_client
+        self.table_id = table_id
+        self.max_rows = max_rows
+        self.max_age_seconds = max_age_seconds
+        self.spill_dir = spill_dir
+        self.on_flush = on_flush
+        self._pending: List[Dict[str, Any]] = []
+        self._oldest_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._owner_pid: Optional[int] = None
+        self._instance_id: Optional[str] = None
+        self._lock_fd: Optional[int] = None
+        self._closed = False
+        self._retry_delay = 0.0
+        self._consecutive_failures = 0
+        self._start_lock = threading.Lock()
+
+    @property
+    def spill_path(self) -> Optional[str]:
+        if not self.spill_dir or self._instance_id is None:
+            return None
+        return self._path_for(self._instance_id, ".ndjson")
+
+    def _path_for(self, instance_id: str, suffix: str) -> str:
+        return os.path.join(self.spill_dir, f"{SPILL_FILE_PREFIX}{instance_id}{suffix}")
+
+    def start(self) -> None:
+        """このプロセスのワーカーを起動し、終了したプロセスのスピルファイルを回収します（起動済みなら何もしない）。"""
+        self._ensure_started()
+
+    def _ensure_started(self) -> None:
+        # fork後（gunicornのワーカー等）は親のスレッドが引き継がれないため、プロセス毎に起動する
+        if self._owner_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._owner_pid == os.getpid():
+                return
+            self._pending = []
+            self._oldest_at = None
+            self._closed = False
+            self._instance_id = _instance_id()
+            if self._lock_fd is not None:
+                # 親から引き継いだロックは閉じる（保持し続けると親の終了後もそのファイルを回収できない）
+                os.close(self._lock_fd)
+                self._lock_fd = None
+            if self.spill_dir:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                self._lock_fd = _try_lock(self._path_for(self._instance_id, LOCK_SUFFIX))
+            self._recover_spill_files()
+            self._worker = threading.Thread(target=self._run, name="activity-write-buffer", daemon=True)
+            self._worker.start()
+            atexit.register(self.close)
+            self._owner_pid = os.getpid()
+
+    def _recover_spill_files(self) -> None:
+        """終了したプロセスが残したスピルファイルを引き取り、未フラッシュの行として再投入します。"""
+        if not self.spill_dir:
+            return
+        owners = set()
+        for path in glob.glob(os.path.join(self.spill_dir, f"{SPILL_FILE_PREFIX}*")):
+            name = os.path.basename(path)[len(SPILL_FILE_PREFIX):]
+            if name.endswith((".ndjson", ".claim")):
+                owners.add(name.split(".")[0])
+        owners.discard(self._instance_id)
+        recovered = []
+        claimed_paths = []
+        for owner in sorted(owners):
+            lock_path = self._path_for(owner, LOCK_SUFFIX)
+            # 所有するプロセスが動いている（ロックを保持している）ファイルには触れない
+            fd = _try_lock(lock_path)
+            if fd is None:
+                continue
+            try:
+                paths = sorted(glob.glob(self._path_for(owner, ".*")))
+                for path in paths:
+                    if not path.endswith((".ndjson", ".claim")):
+                        continue
+                    # 同時に起動した他のプロセスと取り合わないよう、リネームで所有権を取得する
+                    claimed = self._path_for(self._instance_id, f".{len(claimed_paths)}.claim")
+                    try:
+                        os.rename(path, claimed)
+                    except FileNotFoundError:
+                        continue
+                    claimed_paths.append(claimed)
+                    recovered.extend(self._read_spill(claimed))
+                for path in (self._path_for(owner, ".ndjson.tmp"), lock_path):
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass
+            finally:
+                os.close(fd)
+        if recovered:
+            logger.info("Recovered %d buffered activity rows from spill files", len(recovered))
+            with self._lock:
+                self._pending.extend(recovered)
+                self._oldest_at = time.monotonic()
+                self._rewrite_spill_locked()
+                PENDING_ROWS.set(len(self._pending))
+        for claimed in claimed_paths:
+            os.remove(claimed)
+
+    @staticmethod
+    def _read_spill(path: str) -> List[Dict[str, Any]]:
+        rows = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        # 書き込み途中で落ちた末尾行は確定前（未応答）なので捨てる
+                        logger.warning("Skipping truncated spill line in %s", path)
+        return rows
+
+    def _append_spill_locked(self, row: Dict[str, Any]) -> None:
+        path = self.spill_path
+        if not path:
+            return
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_spill_locked(self) -> None:
+        path = self.spill_path
+        if not path:
+            return
+        if not self._pending:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in self._pending:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def add(self, row: Dict[str, Any]) -> None:
+        """行をバッファに追加します。スピルファイルへの書き込みが完了した時点で確定とみなします。"""
+        self._ensure_started()
+        with self._lock:
+            self._append_spill_locked(row)
+            self._pending.append(row)
+            if self._oldest_at is None:
+                self._oldest_at = time.monotonic()
+            PENDING_ROWS.set(len(self._pending))
+            if len(self._pending) >= self.max_rows:
+                self._wakeup.notify()
+
+    def _find_pending_locked(self, row_id: str, user_id: str) -> Optional[int]:
+        for index, row in enumerate(self._pending):
+            if row["id"] == row_id and row["user_id"] == user_id:
+                return index
+        return None
+
+    def get_pending(self, row_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """未フラッシュの行（該当する行が無い場合は None）"""
+        if self._owner_pid != os.getpid():
+            return None
+        with self._lock:
+            index = self._find_pending_locked(row_id, user_id)
+            return dict(self._pending[index]) if index is not None else None
+
+    def update_pending(self, row_id: str, user_id: str, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        未フラッシュの行に changes を反映し、反映後の行を返します（該当する行が無い場合は None）。
+        挿入中の行を取りこぼさないよう、実行中のフラッシュの完了を待ってから探します。
+        """
+        if self._owner_pid != os.getpid():
+            return None
+        with self._flush_lock, self._lock:
+            index = self._find_pending_locked(row_id, user_id)
+            if index is None:
+                return None
+            self._pending[index] = dict(self._pending[index], **changes)
+            self._rewrite_spill_locked()
+            return dict(self._pending[index])
+
+    def remove_pending(self, row_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """未フラッシュの行を取り除き、取り除いた行を返します（該当する行が無い場合は None）。"""
+        if self._owner_pid != os.getpid():
+            return None
+        with self._flush_lock, self._lock:
+            index = self._find_pending_locked(row_id, user_id)
+            if index is None:
+                return None
+            row = self._pending.pop(index)
+            if not self._pending:
+                self._oldest_at = None
+            self._rewrite_spill_locked()
+            PENDING_ROWS.set(len(self._pending))
+            return row
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._closed:
+                    if self._pending and self._retry_delay == 0:
+                        age = time.monotonic() - self._oldest_at
+                        if len(self._pending) >= self.max_rows or age >= self.max_age_seconds:
+                            break
+                        timeout = self.max_age_seconds - age
+                    else:
+                        timeout = self._retry_delay or self.max_age_seconds
+                    self._wakeup.wait(timeout)
+                    self._retry_delay = 0.0
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self) -> bool:
+        """バッファ内の行をまとめて挿入します。失敗した場合は行を残して次回再送します。"""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending[:self.max_rows]
+            if not batch:
+                return True
+            started = time.perf_counter()
+            try:
+                errors = self.client.insert_rows(self.table_id, batch, row_ids=[row["id"] for row in batch])
+            except Exception as e:
+                errors = [{"errors": [{"message": str(e)}]}]
+            FLUSH_SECONDS.observe(time.perf_counter() - started)
+            if errors:
+                FLUSH_FAILURES.inc()
+                logger.error("Failed to flush %d buffered activity rows: %s", len(batch), errors)
+                with self._lock:
+                    self._consecutive_failures += 1
+                    self._retry_delay = min(2.0 ** (self._consecutive_failures - 1), 30.0)
+                return False
+            BATCH_SIZE.observe(len(batch))
+            with self._lock:
+                self._consecutive_failures = 0
+                del self._pending[:len(batch)]
+                self._oldest_at = time.monotonic() if self._pending else None
+                self._rewrite_spill_locked()
+                PENDING_ROWS.set(len(self._pending))
+            if self.on_flush:
+                try:
+                    self.on_flush(batch)
+                except Exception:
+                    logger.exception("on_flush callback failed")
+            return True
+
+    def close(self) -> None:
+        """ワーカーを停止し、残りの行をすべてフラッシュします（シャットダウン時）。"""
+        if self._owner_pid != os.getpid():
+            return
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._wakeup.notify()
+        if self._worker is not None:
+            self._worker.join(timeout=5)
+        while True:
+            with self._lock:
+                if not self._pending:
+                    break
+            if not self.flush():
+                # フラッシュできなかった行はスピルファイルに残り、次に起動したプロセスが再送する
+                break
+        self._release_lock()
+
+    def _release_lock(self) -> None:
+        if self._lock_fd is None:
+            return
+        try:
+            os.remove(self._path_for(self._instance_id, LOCK_SUFFIX))
+        except FileNotFoundError:
+            pass
+        os.close(self._lock_fd)
+        self._lock_fd = None
+
+
+def _filesystem_type(path: str) -> Optional[str]:
+    """path を含むマウントのファイルシステムの種類（/proc/self/mounts が読めない場合は None）"""
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open("/proc/self/mounts", encoding="utf-8") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                mount_point = fields[1].replace("\\040", " ")
+                inside = path == mount_point or path.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best):
+                    best, best_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return best_type
+
+
+def create_write_buffer_from_env(db_client: StorageBackend, table_id: str) -> Optional[ActivityWriteBuffer]:
+    """
+    ACTIVITY_WRITE_BUFFER_ENABLED が有効な場合のみバッファを生成します。
+    受け付けた行を失わないよう、ACTIVITY_WRITE_BUFFER_SPILL_DIR にインスタンスの停止後も残るディレクトリ
+    （Cloud Run ではボリュームのマウント先）の指定を必須とし、メモリ上のファイルシステム（/tmp 等）は拒否します。
+    """
+    if os.environ.get("ACTIVITY_WRITE_BUFFER_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    spill_dir = os.environ.get("ACTIVITY_WRITE_BUFFER_SPILL_DIR")
+    if not spill_dir:
+        raise ValueError("ACTIVITY_WRITE_BUFFER_SPILL_DIR must be set to a durable directory "
+                         "when ACTIVITY_WRITE_BUFFER_ENABLED is set")
+    os.makedirs(spill_dir, exist_ok=True)
+    if _filesystem_type(spill_dir) in ("tmpfs", "ramfs"):
+        raise ValueError(f"ACTIVITY_WRITE_BUFFER_SPILL_DIR {spill_dir} is on an in-memory filesystem; "
+                         "buffered rows would be lost when the instance stops")
+    return ActivityWriteBuffer(
+        db_client,
+        table_id,
+        max_rows=int(os.environ.get("ACTIVITY_WRITE_BUFFER_MAX_ROWS", "500")),
+        max_age_seconds=float(os.environ.get("ACTIVITY_WRITE_BUFFER_MAX_AGE_SECONDS", "2.0")),
+        spill_dir=spill_dir,
+    )
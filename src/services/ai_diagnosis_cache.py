@@ -0,0 +1,179 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from src.core.metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter("ai_diagnosis_cache_requests_total", "AI診断キャッシュの参照回数", ("result",))
+CACHE_BYTES = REGISTRY.gauge("ai_diagnosis_cache_memory_bytes", "メモリ上のAI診断キャッシュのサイズ（バイト）")
+CACHE_EVICTIONS = REGISTRY.counter("ai_diagnosis_cache_evictions_total", "サイズ上限により破棄したAI診断キャッシュの件数", ("tier",))
+
+
+def _text(value: Any) -> str:
+    return " ".join(str(value).split()) if value is not None else ""
+
+
+def normalize_diagnosis_inputs(data: Dict[str, Any]) -> Dict[str, Any]:
+    """診断結果に影響しない差異（前後・連続する空白、None と空文字）を取り除いた入力"""
+    return {
+        "title": _text(data.get("title")),
+        "questions": [
+            {"text": _text(q.get("text")), "score": q.get("score")}
+            for q in data.get("questions") or []
+        ],
+        "anxieties": _text(data.get("anxieties")),
+        "good_things": _text(data.get("good_things")),
+    }
+
+
+def diagnosis_cache_key(model_name: str, prompt: str) -> str:
+    """モデル名と（正規化済みの入力から組み立てた）プロンプトのハッシュ"""
+    return hashlib.sha256(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """プロセス内のLRU。合計サイズが max_bytes を超えた場合は最も長く参照されていないものから破棄します。"""
+
+    def __init__(self, max_bytes: int, ttl_seconds: float):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if time.time() - stored_at >= self.ttl_seconds:
+                self._remove_locked(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: str, stored_at: Optional[float] = None) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = (value, stored_at or time.time())
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                CACHE_EVICTIONS.inc(tier="memory")
+            CACHE_BYTES.set(self._bytes)
+
+    def _remove_locked(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0].encode("utf-8"))
+
+
+class SQLiteTier:
+    """
+    ローカルのSQLiteファイルによる永続キャッシュ（プロセス・再起動をまたいで共有する）。
+    件数が max_entries を超えた場合は最終参照の古いものから破棄します。
+    """
+
+    def __init__(self, path: str, ttl_seconds: float, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = self._connect()
+        self._owner_pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ai_diagnosis_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ai_diagnosis_cache_accessed_at ON ai_diagnosis_cache (accessed_at)")
+        conn.commit()
+        return conn
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        # 呼び出しは self._lock の内側。fork後は親のコネクションを使わず開き直す
+        if self._owner_pid != os.getpid():
+            self._connection = self._connect()
+            self._owner_pid = os.getpid()
+        return self._connection
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, stored_at FROM ai_diagnosis_cache WHERE key = ? AND stored_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE ai_diagnosis_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        return row
+
+    def put(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ai_diagnosis_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            evicted = self._conn.execute(
+                "DELETE FROM ai_diagnosis_cache WHERE stored_at <= ? OR key IN ("
+                "SELECT key FROM ai_diagnosis_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (now - self.ttl_seconds, self.max_entries),
+            ).rowcount
+            self._conn.commit()
+        if evicted:
+            CACHE_EVICTIONS.inc(evicted, tier="persistent")
+
+
+class AIDiagnosisCache:
+    """AI診断結果のキャッシュ（メモリのLRU → 任意の永続層の順に参照）"""
+
+    def __init__(self, memory: MemoryTier, persistent: Optional[SQLiteTier] = None):
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.memory.get(key)
+        if value is not None:
+            CACHE_REQUESTS.inc(result="memory_hit")
+            return value
+        if self.persistent is not None:
+            row = self.persistent.get(key)
+            if row is not None:
+                CACHE_REQUESTS.inc(result="persistent_hit")
+                self.memory.put(key, row[0], stored_at=row[1])
+                return row[0]
+        CACHE_REQUESTS.inc(result="miss")
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        self.memory.put(key, value)
+        if self.persistent is not None:
+            self.persistent.put(key, value)
+
+
+def create_diagnosis_cache_from_env() -> Optional[AIDiagnosisCache]:
+    """AI_DIAGNOSIS_CACHE_MAX_BYTES=0 の場合はキャッシュを無効にします。"""
+    max_bytes = int(os.environ.get("AI_DIAGNOSIS_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+    if max_bytes <= 0:
+        return None
+    ttl_seconds = float(os.environ.get("AI_DIAGNOSIS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    db_path = os.environ.get("AI_DIAGNOSIS_CACHE_DB_PATH")
+    persistent = None
+    if db_path:
+        persistent = SQLiteTier(db_path, ttl_seconds,
+                                max_entries=int(os.environ.get("AI_DIAGNOSIS_CACHE_MAX_ENTRIES", "10000")))
+    return AIDiagnosisCache(MemoryTier(max_bytes, ttl_seconds), persistent)
@@ -0,0 +1,280 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.core.metrics import REGISTRY
+from src.core.storage import QueryParameter, StorageBackend
+
+logger = logging.getLogger(__name__)
+
+AI_DIAGNOSIS_JOBS_TABLE_ID = 'health-report-465810.health_data.AiDiagnosisJobs'
+
+QUEUE_DEPTH = REGISTRY.gauge("ai_diagnosis_queue_depth", "実行待ち・実行中のAI診断ジョブ数（全ワーカー合計）")
+JOBS_TOTAL = REGISTRY.counter("ai_diagnosis_jobs_total", "AI診断ジョブの件数", ("status",))
+JOB_SECONDS = REGISTRY.histogram(
+    "ai_diagnosis_job_seconds", "AI診断ジョブの実行時間（秒）",
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+TIMED_OUT_ERROR = "AI診断が時間内に完了しませんでした。再度お試しください。"
+
+
+class QueueFullError(Exception):
+    """実行待ちのジョブ数が上限に達している"""
+
+
+def diagnosis_key(user_id: str, data: Dict[str, Any]) -> str:
+    """同一内容の依頼を判定するキー（ユーザー毎）"""
+    payload = json.dumps([user_id, data], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _aware(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+class AIDiagnosisQueue:
+    """
+    AI診断をバックグラウンドのワーカープール（最大 max_workers 並列）で実行するジョブキュー。
+    投入時はジョブIDだけを返し、結果は get() でポーリングします。
+
+    ジョブの状態・結果は共有ストレージのテーブル（AiDiagnosisJobs）に保存するため、
+    どのワーカー・インスタンスに届いたポーリングにも応答できます。実行は受け付けたプロセスのスレッドプールで行います。
+    同じユーザーの同一内容の依頼が実行待ち・実行中の場合は既存のジョブを返し、
+    実行待ち・実行中のジョブ数（全体）が max_pending に達している場合は受け付けません。
+    受け付けから job_timeout_seconds を過ぎても完了しないジョブ（実行したプロセスが停止した等）は失敗として扱い、
+    完了したジョブは result_ttl_seconds 経過後に返さなくなります（行は定期的に削除します）。
+
+    BigQueryのDMLの同時実行数を消費しないよう、ジョブ1件あたりの書き込みは登録と結果の保存の2回だけとし、
+    実行中の状態は保存しません（受け付けから job_timeout_seconds 以内の未完了のジョブを実行中とみなす）。
+    完了した状態（成功・失敗）は変わらないため、プロセス毎に最大 max_cached_results 件をメモリに保持し、
+    以降のポーリングにはクエリを発行せずに応答します。自プロセスで実行中のジョブもクエリなしで running を返します。
+    """
+
+    def __init__(self, db_client: StorageBackend, run: Callable[[Dict[str, Any]], str],
+                 table_id: str = AI_DIAGNOSIS_JOBS_TABLE_ID, max_workers: int = 4, max_pending: int = 100,
+                 result_ttl_seconds: float = 600.0, job_timeout_seconds: float = 300.0,
+                 max_cached_results: int = 1000):
+        self.client = db_client
+        self.run = run
+        self.table_id = table_id
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.result_ttl_seconds = result_ttl_seconds
+        self.job_timeout_seconds = job_timeout_seconds
+        self.max_cached_results = max_cached_results
+        # job_id -> (user_id, 応答, 返さなくなる時刻（monotonic）)
+        self._results: "OrderedDict[str, Tuple[str, Dict[str, Any], float]]" = OrderedDict()
+        # 自プロセスで実行中のジョブ（job_id -> user_id。結果を _results に入れてから取り除く）
+        self._running: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._owner_pid: Optional[int] = None
+        self._purged_at = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # fork後（gunicornのワーカー等）は親のスレッドが引き継がれないため、プロセス毎に生成する
+        with self._lock:
+            if self._owner_pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ai-diagnosis")
+                self._owner_pid = os.getpid()
+                self._results.clear()
+                self._running.clear()
+                self._purged_at = time.monotonic()
+            return self._executor
+
+    def _in_flight_condition(self) -> str:
+        return f"status = '{QUEUED}' AND created_at >= @stale_before"
+
+    def submit(self, user_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        executor = self._get_executor()
+        now = datetime.now(timezone.utc)
+        job_id = str(uuid.uuid4())
+        in_flight = self._in_flight_condition()
+        # 重複・上限の判定と登録、登録後の行（または既存の同一内容のジョブ）の取得を1つのスクリプトジョブで行う
+        script = f"""
+            INSERT INTO `{self.table_id}` (id, user_id, request_key, status, owner, created_at, updated_at)
+            SELECT @job_id, @user_id, @request_key, '{QUEUED}', @owner, @now, @now
+            FROM (
+                SELECT COUNT(*) AS pending, SUM(CASE WHEN request_key = @request_key THEN 1 ELSE 0 END) AS same_key
+                FROM `{self.table_id}`
+                WHERE {in_flight}
+            ) AS pending_jobs
+            WHERE pending_jobs.pending < @max_pending AND COALESCE(pending_jobs.same_key, 0) = 0;
+            SELECT id, status, ai_comment, error, created_at,
+                   (SELECT COUNT(*) FROM `{self.table_id}` WHERE {in_flight}) AS pending
+            FROM `{self.table_id}`
+            WHERE created_at >= @stale_before AND user_id = @user_id
+              AND (id = @job_id OR (request_key = @request_key AND status = '{QUEUED}'))
+            ORDER BY created_at
+        """
+        params = [
+            QueryParameter("job_id", "STRING", job_id),
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("request_key", "STRING", diagnosis_key(user_id, data)),
+            QueryParameter("owner", "STRING", f"{socket.gethostname()}:{os.getpid()}"),
+            QueryParameter("now", "TIMESTAMP", now),
+            QueryParameter("stale_before", "TIMESTAMP", now - timedelta(seconds=self.job_timeout_seconds)),
+            QueryParameter("max_pending", "INT64", self.max_pending),
+        ]
+        rows = list(self.client.query(script, params))
+        if not rows:
+            JOBS_TOTAL.inc(status="rejected")
+            QUEUE_DEPTH.set(self.max_pending)
+            raise QueueFullError("AI診断の混雑により受け付けできません。しばらくしてから再度お試しください。")
+        QUEUE_DEPTH.set(rows[0]["pending"])
+        mine = next((row for row in rows if row["id"] == job_id), None)
+        if mine is None:
+            JOBS_TOTAL.inc(status="deduplicated")
+            return self._to_response(rows[0], now)
+        # 同時に同じ内容の依頼が別のワーカーで登録された場合は両方実行される（重複排除はベストエフォート）
+        executor.submit(self._run_job, job_id, user_id, mine["created_at"], data)
+        self._maybe_purge(executor)
+        return self._to_response(mine, now)
+
+    def _run_job(self, job_id: str, user_id: str, created_at: datetime, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._running[job_id] = user_id
+        try:
+            self._execute(job_id, user_id, created_at, data)
+        finally:
+            with self._lock:
+                self._running.pop(job_id, None)
+
+    def _execute(self, job_id: str, user_id: str, created_at: datetime, data: Dict[str, Any]) -> None:
+        params = [
+            QueryParameter("job_id", "STRING", job_id),
+            QueryParameter("created_at", "TIMESTAMP", created_at),
+        ]
+        started = time.perf_counter()
+        result, error = None, None
+        try:
+            result = self.run(data)
+        except Exception as e:
+            logger.exception("AI diagnosis job %s failed", job_id)
+            error = str(e)
+        JOB_SECONDS.observe(time.perf_counter() - started)
+        status = FAILED if error is not None else SUCCEEDED
+        finished_at = datetime.now(timezone.utc)
+        try:
+            # ポーリング側から結果と状態が揃って見えるよう、1回のUPDATEでまとめて更新する
+            self.client.query(f"""
+                UPDATE `{self.table_id}`
+                SET status = @status, ai_comment = @ai_comment, error = @error,
+                    finished_at = @finished_at, updated_at = @finished_at
+                WHERE id = @job_id AND created_at = @created_at
+            """, params + [
+                QueryParameter("status", "STRING", status),
+                QueryParameter("ai_comment", "STRING", result),
+                QueryParameter("error", "STRING", error),
+                QueryParameter("finished_at", "TIMESTAMP", finished_at),
+            ])
+        except Exception:
+            # 保存できなかったジョブは job_timeout_seconds 経過後に失敗として扱われる
+            logger.exception("Failed to store the result of AI diagnosis job %s", job_id)
+            return
+        JOBS_TOTAL.inc(status=status)
+        row = {"id": job_id, "status": status, "ai_comment": result, "error": error, "created_at": created_at}
+        self._remember(job_id, user_id, self._to_response(row, finished_at), self.result_ttl_seconds)
+
+    def get(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """ジョブの状態を返します。他のユーザーのジョブや期限切れのジョブは None。"""
+        with self._lock:
+            cached = self._results.get(job_id)
+            if cached is not None and cached[2] <= time.monotonic():
+                del self._results[job_id]
+                cached = None
+            if cached is not None:
+                return dict(cached[1]) if cached[0] == user_id else None
+            if self._running.get(job_id) == user_id:
+                return {"job_id": job_id, "status": RUNNING}
+        now = datetime.now(timezone.utc)
+        query = f"""
+            SELECT id, status, ai_comment, error, created_at, finished_at
+            FROM `{self.table_id}`
+            WHERE id = @job_id AND user_id = @user_id AND created_at >= @oldest
+        """
+        params = [
+            QueryParameter("job_id", "STRING", job_id),
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("oldest", "TIMESTAMP", now - timedelta(seconds=self._retention_seconds())),
+        ]
+        row = self.client.query(query, params).first()
+        if row is None:
+            return None
+        finished_at = row["finished_at"]
+        if finished_at is not None and _aware(finished_at) < now - timedelta(seconds=self.result_ttl_seconds):
+            return None
+        response = self._to_response(row, now)
+        if response["status"] in (SUCCEEDED, FAILED):
+            # 完了した状態は変わらないため、返さなくなる時刻まで以降のポーリングにはメモリから応答する
+            expires_at = _aware(finished_at) if finished_at is not None else \
+                _aware(row["created_at"]) + timedelta(seconds=self.job_timeout_seconds)
+            self._remember(job_id, user_id, response,
+                           (expires_at - now).total_seconds() + self.result_ttl_seconds)
+        return response
+
+    def _remember(self, job_id: str, user_id: str, response: Dict[str, Any], ttl_seconds: float) -> None:
+        with self._lock:
+            self._results[job_id] = (user_id, response, time.monotonic() + ttl_seconds)
+            self._results.move_to_end(job_id)
+            while len(self._results) > self.max_cached_results:
+                self._results.popitem(last=False)
+
+    def _to_response(self, row: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        status = row["status"]
+        if status == QUEUED and \
+                _aware(row["created_at"]) < now - timedelta(seconds=self.job_timeout_seconds):
+            return {"job_id": row["id"], "status": FAILED, "error": TIMED_OUT_ERROR}
+        # 受け付けから job_timeout_seconds 以内の未完了のジョブは実行待ちまたは実行中（区別しない）
+        data = {"job_id": row["id"], "status": status}
+        if status == SUCCEEDED:
+            data["ai_comment"] = row["ai_comment"]
+        elif status == FAILED:
+            data["error"] = row["error"]
+        return data
+
+    def _retention_seconds(self) -> float:
+        # 完了までの最大時間と結果の保持時間を過ぎた行は参照されない
+        return self.job_timeout_seconds + self.result_ttl_seconds
+
+    def _maybe_purge(self, executor: ThreadPoolExecutor) -> None:
+        """参照されなくなった行の削除を、プロセス毎に result_ttl_seconds に1回、バックグラウンドで行う"""
+        with self._lock:
+            if time.monotonic() - self._purged_at < self.result_ttl_seconds:
+                return
+            self._purged_at = time.monotonic()
+        executor.submit(self.purge_expired)
+
+    def purge_expired(self) -> None:
+        before = datetime.now(timezone.utc) - timedelta(seconds=self._retention_seconds())
+        try:
+            self.client.query(f"DELETE FROM `{self.table_id}` WHERE created_at < @before",
+                              [QueryParameter("before", "TIMESTAMP", before)])
+        except Exception:
+            logger.exception("Failed to purge expired AI diagnosis jobs")
+
+
+def create_diagnosis_queue_from_env(db_client: StorageBackend, run: Callable[[Dict[str, Any]], str]) -> AIDiagnosisQueue:
+    return AIDiagnosisQueue(
+        db_client,
+        run,
+        table_id=os.environ.get("AI_DIAGNOSIS_JOBS_TABLE_ID", AI_DIAGNOSIS_JOBS_TABLE_ID),
+        max_workers=int(os.environ.get("AI_DIAGNOSIS_WORKERS", "4")),
+        max_pending=int(os.environ.get("AI_DIAGNOSIS_MAX_PENDING", "100")),
+        result_ttl_seconds=float(os.environ.get("AI_DIAGNOSIS_RESULT_TTL_SECONDS", "600")),
+        job_timeout_seconds=float(os.environ.get("AI_DIAGNOSIS_JOB_TIMEOUT_SECONDS", "300")),
+    )
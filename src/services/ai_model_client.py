@@ -0,0 +1,129 @@
+import hashlib
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional
+from src.core.request_stats import AICall, ai_call
+
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+
+
+class AIModelClient(ABC):
+    """AI診断に使う生成モデルのクライアント（Vertex AI / 負荷試験用スタブを差し替え可能にする）"""
+
+    model_name: str
+
+    def generate(self, prompt: str) -> str:
+        """プロンプトからテキストを生成します。失敗時は例外を送出します。"""
+        with ai_call(self.model_name, "generate") as call:
+            return self._generate(prompt, call)
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """生成されたテキストを断片ごとに返します。"""
+        with ai_call(self.model_name, "stream") as call:
+            yield from self._generate_stream(prompt, call)
+
+    @abstractmethod
+    def _generate(self, prompt: str, call: AICall) -> str:
+        """クライアント固有の生成。トークン数が分かる場合は call に設定します。"""
+
+    def _generate_stream(self, prompt: str, call: AICall) -> Iterator[str]:
+        # 既定では生成完了後に全体を1つの断片として返す
+        yield self._generate(prompt, call)
+
+
+class VertexAIModelClient(AIModelClient):
+    """Vertex AI Gemini。GenerativeModel はプロセス内で1度だけ生成して使い回します。"""
+
+    def __init__(self, model_name: str = DEFAULT_MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from src.core.clients import get_client_registry
+                    from vertexai.generative_models import GenerativeModel
+                    get_client_registry().ensure_vertexai()
+                    self._model = GenerativeModel(self.model_name)
+        return self._model
+
+    def _generate(self, prompt: str, call: AICall) -> str:
+        response = self._get_model().generate_content(prompt)
+        self._record_usage(response, call)
+        return response.text.strip()
+
+    def _generate_stream(self, prompt: str, call: AICall) -> Iterator[str]:
+        for response in self._get_model().generate_content(prompt, stream=True):
+            # 使用量はストリームの最後の応答が全体の値を持つ
+            self._record_usage(response, call)
+            text = self._chunk_text(response)
+            if text:
+                yield text
+
+    @staticmethod
+    def _chunk_text(response) -> str:
+        """
+        ストリームの1応答のテキスト。response.text はテキストのパートが無い応答（使用量だけの最後の応答、
+        安全性フィルタでブロックされた応答等）で ValueError を送出するため、パートから直接読みます。
+        """
+        candidates = getattr(response, "candidates", None) or []
+        if not candidates:
+            return ""
+        content = getattr(candidates[0], "content", None)
+        texts = []
+        for part in getattr(content, "parts", None) or []:
+            try:
+                text = part.text
+            except (AttributeError, ValueError):
+                # テキスト以外のパート（関数呼び出し等）
+                continue
+            if text:
+                texts.append(text)
+        return "".join(texts)
+
+    @staticmethod
+    def _record_usage(response, call: AICall) -> None:
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            call.prompt_tokens = usage.prompt_token_count or call.prompt_tokens
+            call.output_tokens = usage.candidates_token_count or call.output_tokens
+
+
+class StubModelClient(AIModelClient):
+    """
+    Vertex AIを呼ばずに、一定の遅延の後に固定のコメントを返すスタブ（ローカル開発・負荷試験用）。
+    同じプロンプトには同じコメントを返します。
+    """
+
+    def __init__(self, latency_seconds: float = 2.0, model_name: str = "stub"):
+        self.model_name = model_name
+        self.latency_seconds = latency_seconds
+
+    def _generate(self, prompt: str, call: AICall) -> str:
+        time.sleep(self.latency_seconds)
+        return self._comment(prompt)
+
+    def _generate_stream(self, prompt: str, call: AICall, chunk_chars: int = 8) -> Iterator[str]:
+        # 全体の遅延を断片数で按分し、最初の断片までの時間を短くする
+        comment = self._comment(prompt)
+        chunks = [comment[i:i + chunk_chars] for i in range(0, len(comment), chunk_chars)]
+        for chunk in chunks:
+            time.sleep(self.latency_seconds / len(chunks))
+            yield chunk
+
+    @staticmethod
+    def _comment(prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"今週もよく頑張りましたね。無理をせず、できたことを大切にしていきましょう。（stub:{digest}）"
+
+
+def create_model_client_from_env(model_name: Optional[str] = None) -> AIModelClient:
+    """AI_MODEL_CLIENT=stub の場合はスタブを、それ以外はVertex AIを使用します。"""
+    model_name = model_name or os.environ.get("AI_MODEL_NAME", DEFAULT_MODEL_NAME)
+    if os.environ.get("AI_MODEL_CLIENT", "vertex").lower() == "stub":
+        return StubModelClient(latency_seconds=float(os.environ.get("AI_STUB_LATENCY_SECONDS", "2.0")))
+    return VertexAIModelClient(model_name)
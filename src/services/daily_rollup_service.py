@@ -0,0 +1,308 @@
+import atexit
+import logging
+import os
+import threading
+from datetime import date, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.core.metrics import REGISTRY
+from src.core.storage import QueryParameter, StorageBackend
+from src.core.table_layout import utc_day_range
+from src.models.activity import ActivityInDB, LOAD_CATEGORY_IDS
+
+logger = logging.getLogger(__name__)
+
+DAILY_ROLLUPS_TABLE_ID = 'health-report-465810.health_data.DailyLoadRollups'
+ACTIVITIES_TABLE_ID = 'health-report-465810.health_data.activities'
+
+RollupKey = Tuple[str, date, str]
+# 再集計する期間（None は制限なし）
+DateRange = Tuple[Optional[date], Optional[date]]
+
+APPLY_FAILURES = REGISTRY.counter("daily_rollup_apply_failures_total", "日次集計への差分の反映（MERGE）に失敗した回数")
+PENDING_REBUILDS = REGISTRY.gauge("daily_rollup_pending_rebuilds", "再集計待ちのユーザー数")
+
+
+def activity_minutes(activity: ActivityInDB) -> int:
+    """TIMESTAMP_DIFF(end_time, start_time, MINUTE) と同じく、分未満を0方向に切り捨てた活動時間"""
+    seconds = (activity.end_time - activity.start_time).total_seconds()
+    minutes = int(abs(seconds) // 60)
+    return minutes if seconds >= 0 else -minutes
+
+
+def rollup_date(activity: ActivityInDB) -> date:
+    """DATE(start_time)（UTC）"""
+    start = activity.start_time
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    return start.astimezone(timezone.utc).date()
+
+
+class DailyRollupService:
+    """
+    ユーザー毎・日毎・カテゴリ毎の活動時間と負荷ポイントの集計（DailyLoadRollups）を管理します。
+    行動記録の作成・更新・削除時に差分を加算し、週次サマリーは集計済みの行だけを読みます。
+
+    差分はメモリ上で (user_id, 日付, カテゴリ) 毎に合算し、flush_interval_seconds 毎にバックグラウンドの
+    ワーカーが1回のMERGEで反映します（0の場合は呼び出したスレッドでその場で反映する）。
+    反映に失敗しても例外は呼び出し元（行動記録の書き込み）に伝えず、該当するユーザー・日を再集計待ちとして
+    記録し、次回のフラッシュで行動記録から作り直します（rebuild）。
+    """
+
+    def __init__(self, db_client: StorageBackend, table_id: str = DAILY_ROLLUPS_TABLE_ID,
+                 activities_table_id: str = ACTIVITIES_TABLE_ID, flush_interval_seconds: float = 0.0):
+        self.client = db_client
+        self.table_id = table_id
+        self.activities_table_id = activities_table_id
+        self.flush_interval_seconds = flush_interval_seconds
+        self._pending: Dict[RollupKey, List[float]] = {}
+        self._rebuilds: Dict[str, DateRange] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._owner_pid: Optional[int] = None
+
+    def _add_delta(self, deltas: Dict[RollupKey, List[float]], activity: ActivityInDB, sign: int) -> None:
+        minutes = activity_minutes(activity)
+        key = (activity.user_id, rollup_date(activity), activity.category_id)
+        delta = deltas.setdefault(key, [0, 0.0, 0])
+        delta[0] += sign * minutes
+        delta[1] += sign * activity.fatigue_level * (minutes / 60.0)
+        delta[2] += sign
+
+    def on_created(self, activities: Iterable[ActivityInDB]) -> None:
+        with self._lock:
+            for activity in activities:
+                self._add_delta(self._pending, activity, 1)
+        self._schedule()
+
+    def on_updated(self, before: ActivityInDB, after: ActivityInDB) -> None:
+        with self._lock:
+            self._add_delta(self._pending, before, -1)
+            self._add_delta(self._pending, after, 1)
+        self._schedule()
+
+    def on_deleted(self, activity: ActivityInDB) -> None:
+        with self._lock:
+            self._add_delta(self._pending, activity, -1)
+        self._schedule()
+
+    def mark_for_rebuild(self, user_id: str, start_date: Optional[date], end_date: Optional[date]) -> None:
+        """ユーザーの指定期間を再集計待ちとして記録します（次回のフラッシュで rebuild する）。"""
+        with self._lock:
+            if user_id in self._rebuilds:
+                start, end = self._rebuilds[user_id]
+                start_date = None if start is None or start_date is None else min(start, start_date)
+                end_date = None if end is None or end_date is None else max(end, end_date)
+            self._rebuilds[user_id] = (start_date, end_date)
+            PENDING_REBUILDS.set(len(self._rebuilds))
+
+    def _schedule(self) -> None:
+        if self.flush_interval_seconds <= 0:
+            self.flush()
+            return
+        # fork後（gunicornのワーカー等）は親のスレッドが引き継がれないため、プロセス毎に起動する
+        if self._owner_pid == os.getpid():
+            return
+        with self._lock:
+            if self._owner_pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name="daily-rollups", daemon=True).start()
+            atexit.register(self.close)
+            self._owner_pid = os.getpid()
+
+    def _run(self) -> None:
+        while not self._wakeup.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def close(self) -> None:
+        """ワーカーを停止し、残りの差分を反映します（シャットダウン時）。"""
+        if self._owner_pid != os.getpid():
+            return
+        self._wakeup.set()
+        self.flush()
+
+    def flush(self) -> bool:
+        """
+        溜まった差分を1回のMERGEで反映し、再集計待ちの期間を作り直します。
+        失敗しても例外は送出せず、反映できなかったユーザー・日を再集計待ちに残して False を返します。
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._pending = self._pending, {}
+                rebuilds = dict(self._rebuilds)
+            # 再集計する期間の差分は作り直した集計に含まれるため加算しない
+            deltas = {key: delta for key, delta in deltas.items() if not _covered(rebuilds, key)}
+            succeeded = True
+            try:
+                if deltas:
+                    self.apply_deltas(deltas)
+            except Exception:
+                APPLY_FAILURES.inc()
+                logger.exception("Failed to apply daily rollup deltas; marking %d user-days for rebuild", len(deltas))
+                for user_id, day, _ in deltas:
+                    self.mark_for_rebuild(user_id, day, day)
+                succeeded = False
+            for user_id, (start_date, end_date) in rebuilds.items():
+                try:
+                    self._rebuild(user_id, start_date, end_date)
+                except Exception:
+                    logger.exception(
+                        "Failed to rebuild daily rollups; retrying on the next flush or run "
+                        "python -m src.tools.rebuild_daily_rollups --user-id %s --start-date %s --end-date %s",
+                        user_id, start_date, end_date)
+                    succeeded = False
+                    continue
+                with self._lock:
+                    if self._rebuilds.get(user_id) == (start_date, end_date):
+                        del self._rebuilds[user_id]
+            PENDING_REBUILDS.set(len(self._rebuilds))
+            return succeeded
+
+    def apply_deltas(self, deltas: Dict[RollupKey, List[float]]) -> None:
+        """(user_id, 日付, カテゴリ) 毎の差分を1回のMERGEで加算します。"""
+        deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+        if not deltas:
+            return
+        selects = []
+        params = []
+        for i, ((user_id, day, category_id), (minutes, points, count)) in enumerate(deltas.items()):
+            selects.append(
+                f"SELECT @user_id_{i} AS user_id, @rollup_date_{i} AS rollup_date, @category_id_{i} AS category_id, "
+                f"@activity_minutes_{i} AS activity_minutes, @load_points_{i} AS load_points, @activity_count_{i} AS activity_count"
+            )
+            params += [
+                QueryParameter(f"user_id_{i}", "STRING", user_id),
+                QueryParameter(f"rollup_date_{i}", "DATE", str(day)),
+                QueryParameter(f"category_id_{i}", "STRING", category_id),
+                QueryParameter(f"activity_minutes_{i}", "INT64", int(minutes)),
+                QueryParameter(f"load_points_{i}", "FLOAT64", float(points)),
+                QueryParameter(f"activity_count_{i}", "INT64", int(count)),
+            ]
+        union = "\n            UNION ALL ".join(selects)
+        query = f"""
+        MERGE `{self.table_id}` AS target
+        USING (
+            {union}
+        ) AS source
+        ON target.user_id = source.user_id AND target.rollup_date = source.rollup_date AND target.category_id = source.category_id
+        WHEN MATCHED THEN
+          UPDATE SET
+            activity_minutes = target.activity_minutes + source.activity_minutes,
+            load_points = target.load_points + source.load_points,
+            activity_count = target.activity_count + source.activity_count,
+            updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+          INSERT (user_id, rollup_date, category_id, activity_minutes, load_points, activity_count, updated_at)
+          VALUES (source.user_id, source.rollup_date, source.category_id, source.activity_minutes,
+                  source.load_points, source.activity_count, CURRENT_TIMESTAMP())
+        """
+        self.client.query(query, params)
+
+    def get_daily_totals(self, user_id: str, start_date: date, end_date: date) -> List[dict]:
+        """負荷ポイント対象カテゴリについて、日毎の活動時間・負荷ポイントを返します。"""
+        categories = ", ".join(f"'{category_id}'" for category_id in LOAD_CATEGORY_IDS)
+        query = f"""
+        SELECT rollup_date AS date,
+               SUM(activity_minutes) AS activity_minutes,
+               SUM(load_points) AS load_points
+        FROM `{self.table_id}`
+        WHERE user_id = @user_id
+          AND rollup_date BETWEEN @start_date AND @end_date
+          AND category_id IN ({categories})
+        GROUP BY rollup_date
+        HAVING SUM(activity_count) > 0
+        ORDER BY rollup_date
+        """
+        params = [
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("start_date", "DATE", str(start_date)),
+            QueryParameter("end_date", "DATE", str(end_date)),
+        ]
+        return list(self.client.query(query, params))
+
+    def weekly_load_points_sql(self) -> str:
+        """@user_id の @week_start_date〜@week_end_date の負荷ポイント合計を返すSELECT文"""
+        categories = ", ".join(f"'{category_id}'" for category_id in LOAD_CATEGORY_IDS)
+        return f"""SELECT COALESCE(SUM(load_points), 0) as total_load_points
+        FROM `{self.table_id}`
+        WHERE user_id = @user_id
+        AND rollup_date BETWEEN @week_start_date AND @week_end_date
+        AND category_id IN ({categories})"""
+
+    def rebuild(self, user_id: Optional[str] = None, start_date: Optional[date] = None,
+                end_date: Optional[date] = None) -> None:
+        """
+        指定範囲の集計をActivitiesテーブルから作り直します（バックフィル・修復用）。
+        範囲を省略した場合は全ユーザー・全期間が対象です。
+        """
+        with self._flush_lock:
+            with self._lock:
+                # 範囲内の未反映の差分は作り直した集計に含まれる
+                self._pending = {key: delta for key, delta in self._pending.items()
+                                 if not _in_range(key, user_id, start_date, end_date)}
+            try:
+                self._rebuild(user_id, start_date, end_date)
+            except Exception:
+                if user_id is not None:
+                    self.mark_for_rebuild(user_id, start_date, end_date)
+                raise
+
+    def _rebuild(self, user_id: Optional[str], start_date: Optional[date], end_date: Optional[date]) -> None:
+        rollup_filters = ["TRUE"]
+        activity_filters = ["TRUE"]
+        params = []
+        if user_id:
+            rollup_filters.append("user_id = @user_id")
+            activity_filters.append("user_id = @user_id")
+            params.append(QueryParameter("user_id", "STRING", user_id))
+        # 行動記録は DATE(start_time) ではなく start_time の範囲で絞り込み、パーティションのプルーニングを効かせる
+        if start_date:
+            rollup_filters.append("rollup_date >= @start_date")
+            activity_filters.append("start_time >= @start_time")
+            params.append(QueryParameter("start_date", "DATE", str(start_date)))
+            params.append(QueryParameter("start_time", "TIMESTAMP", utc_day_range(start_date, start_date)[0]))
+        if end_date:
+            rollup_filters.append("rollup_date <= @end_date")
+            activity_filters.append("start_time < @end_time")
+            params.append(QueryParameter("end_date", "DATE", str(end_date)))
+            params.append(QueryParameter("end_time", "TIMESTAMP", utc_day_range(end_date, end_date)[1]))
+        script = f"""
+        DELETE FROM `{self.table_id}` WHERE {' AND '.join(rollup_filters)};
+        INSERT INTO `{self.table_id}` (user_id, rollup_date, category_id, activity_minutes, load_points, activity_count, updated_at)
+        SELECT user_id,
+               DATE(start_time) AS rollup_date,
+               category_id,
+               SUM(TIMESTAMP_DIFF(end_time, start_time, MINUTE)) AS activity_minutes,
+               SUM(fatigue_level * (TIMESTAMP_DIFF(end_time, start_time, MINUTE) / 60.0)) AS load_points,
+               COUNT(*) AS activity_count,
+               CURRENT_TIMESTAMP() AS updated_at
+        FROM `{self.activities_table_id}`
+        WHERE {' AND '.join(activity_filters)}
+        GROUP BY user_id, rollup_date, category_id
+        """
+        logger.info("Rebuilding daily rollups: user_id=%s start_date=%s end_date=%s", user_id, start_date, end_date)
+        self.client.query(script, params)
+
+
+def _in_range(key: RollupKey, user_id: Optional[str], start_date: Optional[date], end_date: Optional[date]) -> bool:
+    key_user_id, day, _ = key
+    return (user_id is None or key_user_id == user_id) and \
+        (start_date is None or start_date <= day) and (end_date is None or day <= end_date)
+
+
+def _covered(rebuilds: Dict[str, DateRange], key: RollupKey) -> bool:
+    return key[0] in rebuilds and _in_range(key, key[0], *rebuilds[key[0]])
+
+
+def create_daily_rollup_service_from_env(db_client: StorageBackend) -> Optional[DailyRollupService]:
+    """
+    DAILY_ROLLUPS_ENABLED が有効な場合のみ日次集計を使用します。
+    差分は DAILY_ROLLUPS_FLUSH_SECONDS（既定2.0秒）毎にまとめて反映します。
+    """
+    if os.environ.get("DAILY_ROLLUPS_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    return DailyRollupService(
+        db_client,
+        os.environ.get("DAILY_ROLLUPS_TABLE_ID", DAILY_ROLLUPS_TABLE_ID),
+        flush_interval_seconds=float(os.environ.get("DAILY_ROLLUPS_FLUSH_SECONDS", "2.0")),
+    )
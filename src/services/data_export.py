@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Sequence
+import orjson
+from src.models.activity import ActivityInDB
+from src.models.weekly_reflection import WeeklyReflectionInDB
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+ACTIVITY_EXPORT_COLUMNS = tuple(ActivityInDB.model_fields)
+REFLECTION_EXPORT_COLUMNS = tuple(WeeklyReflectionInDB.model_fields)
+
+Page = List[Dict[str, Any]]
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, ensure_ascii=False, default=_json_default)
+    return value
+
+
+def ndjson_chunks(pages: Iterable[Page], columns: Sequence[str]) -> Iterator[str]:
+    """ページ毎に、columns の列だけをNDJSON（日時はISO8601）にした文字列を返します。"""
+    # orjson は datetime / date を isoformat() と同じ形式で直接エンコードする
+    for page in pages:
+        yield b"".join(
+            orjson.dumps({name: row.get(name) for name in columns}, default=_json_default, option=orjson.OPT_APPEND_NEWLINE)
+            for row in page
+        ).decode("utf-8")
+
+
+def csv_chunks(pages: Iterable[Page], columns: Sequence[str]) -> Iterator[str]:
+    """ヘッダ行に続けて、ページ毎にCSVの文字列を返します。"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    yield buffer.getvalue()
+    for page in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([_csv_value(row.get(name)) for name in columns] for row in page)
+        yield buffer.getvalue()
+
+
+def export_chunks(pages: Iterable[Page], columns: Sequence[str], fmt: str) -> Iterator[str]:
+    if fmt == "csv":
+        return csv_chunks(pages, columns)
+    return ndjson_chunks(pages, columns)
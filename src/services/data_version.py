@@ -0,0 +1,89 @@
+import hashlib
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple, Optional, Tuple
+
+
+class DataVersion(NamedTuple):
+    """ユーザーのデータのバージョン（ETag のトークンと Last-Modified）"""
+    etag: str
+    last_modified: datetime
+
+
+class DataVersions:
+    """
+    ユーザー毎のデータのバージョン（プロセス内のカウンタ）。作成・更新・削除の完了直後に bump() で進めます。
+    条件付きGET（If-None-Match）はこのバージョンとの比較だけで判定し、一致すればクエリを発行せずに304を返します。
+
+    カウンタはプロセス（gunicornのワーカー・インスタンス）毎のため、他のプロセスでの変更は見えません。
+    そのため各バージョンは ttl_seconds だけ有効とし、過ぎたら（変更が無くても）新しいバージョンにします。
+    他のプロセスでの変更が304で隠れるのは最大 ttl_seconds です。
+    ETag はプロセス毎の識別子とカウンタから作るため、他のプロセス・以前のバージョンと一致することはありません。
+    """
+
+    def __init__(self, table_id: str, ttl_seconds: float = 10.0, max_users: int = 100000):
+        self.table_id = table_id
+        self.ttl_seconds = ttl_seconds
+        self.max_users = max_users
+        # user_id -> (有効期限（monotonic）, バージョン)
+        self._versions: "OrderedDict[str, Tuple[float, DataVersion]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._owner_pid: Optional[int] = None
+        self._instance_id = ""
+        self._sequence = itertools.count()
+
+    def _new_version_locked(self, user_id: str, previous: Optional[DataVersion]) -> DataVersion:
+        # fork後（gunicornのワーカー等）は親と同じカウンタを引き継がないよう、プロセス毎に識別子を作り直す
+        if self._owner_pid != os.getpid():
+            self._versions.clear()
+            self._instance_id = uuid.uuid4().hex
+            self._sequence = itertools.count()
+            self._owner_pid = os.getpid()
+            previous = None
+        # Last-Modified は秒単位のため、同じ秒に続けて変更されても前のバージョンより後の時刻にする
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        if previous is not None and last_modified <= previous.last_modified:
+            last_modified = previous.last_modified + timedelta(seconds=1)
+        token = f"{self.table_id}:{user_id}:{self._instance_id}:{next(self._sequence)}"
+        version = DataVersion(hashlib.sha256(token.encode("utf-8")).hexdigest()[:16], last_modified)
+        self._versions[user_id] = (time.monotonic() + self.ttl_seconds, version)
+        self._versions.move_to_end(user_id)
+        while len(self._versions) > self.max_users:
+            self._versions.popitem(last=False)
+        return version
+
+    def current(self, user_id: str) -> DataVersion:
+        """現在のバージョン。未知または期限切れの場合は新しいバージョンを作ります。"""
+        with self._lock:
+            entry = self._versions.get(user_id) if self._owner_pid == os.getpid() else None
+            if entry is not None and time.monotonic() < entry[0]:
+                return entry[1]
+            return self._new_version_locked(user_id, entry[1] if entry is not None else None)
+
+    def bump(self, user_id: str) -> None:
+        """
+        データが変わったことを記録します。変更の完了直後に呼びます
+        （変更前に呼ぶと、変更中に読まれた古い内容が新しいバージョンで返る場合があるため）。
+        """
+        with self._lock:
+            entry = self._versions.get(user_id) if self._owner_pid == os.getpid() else None
+            self._new_version_locked(user_id, entry[1] if entry is not None else None)
+
+
+def create_data_versions_from_env(table_id: str) -> Optional[DataVersions]:
+    """
+    DATA_VERSION_ENABLED=0 の場合は条件付きGETを無効にします。
+    DATA_VERSION_TTL_SECONDS（既定10秒）は、他のプロセスでの変更が304で隠れうる最大の時間です。
+    """
+    if os.environ.get("DATA_VERSION_ENABLED", "1").lower() not in ("1", "true", "yes"):
+        return None
+    return DataVersions(
+        table_id,
+        ttl_seconds=float(os.environ.get("DATA_VERSION_TTL_SECONDS", "10")),
+        max_users=int(os.environ.get("DATA_VERSION_MAX_USERS", "100000")),
+    )
@@ -0,0 +1,148 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Sequence, Tuple
+import numpy as np
+from src.models.activity import ActivityInDB, LOAD_CATEGORY_IDS
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US_PER_DAY = 86_400_000_000
+_US_PER_MINUTE = 60_000_000
+
+
+def _epoch_us(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def _epoch_day(value: date) -> int:
+    return (value - _EPOCH.date()).days
+
+
+class ActivityColumns(NamedTuple):
+    """
+    1ユーザー分の行動記録の列指向表現。
+    start_us / end_us はUTCエポックからのマイクロ秒、category_codes は categories へのインデックス。
+    """
+    start_us: np.ndarray
+    end_us: np.ndarray
+    fatigue: np.ndarray
+    category_codes: np.ndarray
+    categories: Tuple[str, ...]
+
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "ActivityColumns":
+        """ActivityInDB、または start_time/end_time/fatigue_level/category_id を持つ行（dict）から生成します。"""
+        start, end, fatigue, codes = [], [], [], []
+        index: Dict[str, int] = {}
+        for row in rows:
+            if isinstance(row, ActivityInDB):
+                row = {"start_time": row.start_time, "end_time": row.end_time,
+                       "fatigue_level": row.fatigue_level, "category_id": row.category_id}
+            start.append(_epoch_us(row["start_time"]))
+            end.append(_epoch_us(row["end_time"]))
+            fatigue.append(row["fatigue_level"] or 0)
+            codes.append(index.setdefault(row["category_id"], len(index)))
+        return cls(
+            np.array(start, dtype=np.int64),
+            np.array(end, dtype=np.int64),
+            np.array(fatigue, dtype=np.float64),
+            np.array(codes, dtype=np.int64),
+            tuple(index),
+        )
+
+
+def _weekly_sums(daily: np.ndarray) -> np.ndarray:
+    if not len(daily):
+        return daily
+    return np.add.reduceat(daily, np.arange(0, len(daily), 7))
+
+
+class LoadReport(NamedTuple):
+    """start_date から days 日間の負荷集計（配列はすべて日毎、長さ days）"""
+    start_date: date
+    daily_minutes: np.ndarray
+    daily_load_points: np.ndarray
+    daily_counts: np.ndarray
+    rolling_load_points: np.ndarray
+    category_minutes: Dict[str, int]
+    peak_day_indices: np.ndarray
+
+    def day(self, index: int) -> date:
+        return self.start_date + timedelta(days=int(index))
+
+    @property
+    def weekly_load_points(self) -> np.ndarray:
+        """start_date から7日毎の負荷ポイント合計"""
+        return _weekly_sums(self.daily_load_points)
+
+    @property
+    def weekly_minutes(self) -> np.ndarray:
+        return _weekly_sums(self.daily_minutes)
+
+    def daily_summary(self) -> List[dict]:
+        """活動のあった日だけを {date, activity_minutes, load_points} のリストで返します。"""
+        return [
+            {
+                "date": str(self.day(i)),
+                "activity_minutes": int(self.daily_minutes[i]),
+                "load_points": float(self.daily_load_points[i]),
+            }
+            for i in np.flatnonzero(self.daily_counts)
+        ]
+
+
+def compute_load(columns: ActivityColumns, start_date: date, days: int,
+                 rolling_window: int = 7, peak_days: int = 3,
+                 load_categories: Sequence[str] = LOAD_CATEGORY_IDS) -> LoadReport:
+    """
+    行動記録の列から、日毎の活動時間・負荷ポイント（fatigue_level * 分 / 60）、直近 rolling_window 日の移動合計、
+    カテゴリ毎の活動時間、負荷ポイントの大きい日を1回のベクトル演算で求めます。
+
+    日付は DATE(start_time)（UTC）、活動時間は TIMESTAMP_DIFF(end_time, start_time, MINUTE) と同じ定義です。
+    日毎の値と移動合計は load_categories のみ、カテゴリ毎の活動時間は全カテゴリが対象です。
+    移動合計の期間初日分を正しく求めるには、start_date の rolling_window - 1 日前からの行を渡してください。
+    """
+    lookback = max(rolling_window - 1, 0)
+    origin = _epoch_day(start_date) - lookback
+    span = days + lookback
+
+    duration = columns.end_us - columns.start_us
+    # 0方向への切り捨て（TIMESTAMP_DIFF と同じ）
+    minutes = np.where(duration >= 0, duration // _US_PER_MINUTE, -((-duration) // _US_PER_MINUTE))
+    load_points = columns.fatigue * (minutes / 60.0)
+    day_index = columns.start_us // _US_PER_DAY - origin
+
+    in_span = (day_index >= 0) & (day_index < span)
+    load_codes = [i for i, category in enumerate(columns.categories) if category in load_categories]
+    is_load = np.isin(columns.category_codes, load_codes) & in_span
+
+    idx = day_index[is_load]
+    span_minutes = np.bincount(idx, weights=minutes[is_load], minlength=span).astype(np.int64)
+    span_load = np.bincount(idx, weights=load_points[is_load], minlength=span)
+    span_counts = np.bincount(idx, minlength=span)
+
+    cumulative = np.concatenate(([0.0], np.cumsum(span_load)))
+    window = max(rolling_window, 1)
+    ends = np.arange(lookback + 1, span + 1)
+    rolling = cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+    in_range = in_span & (day_index >= lookback)
+    per_category = np.bincount(columns.category_codes[in_range], weights=minutes[in_range],
+                               minlength=len(columns.categories))
+
+    daily_load = span_load[lookback:]
+    active = np.flatnonzero(span_counts[lookback:])
+    # 負荷ポイントの降順（同値は日付の古い順）
+    peaks = active[np.argsort(-daily_load[active], kind="stable")][:peak_days]
+
+    return LoadReport(
+        start_date=start_date,
+        daily_minutes=span_minutes[lookback:],
+        daily_load_points=daily_load,
+        daily_counts=span_counts[lookback:],
+        rolling_load_points=rolling,
+        category_minutes={category: int(per_category[i]) for i, category in enumerate(columns.categories)
+                          if per_category[i]},
+        peak_day_indices=peaks,
+    )
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from src.core.metrics import REGISTRY
+
+CACHE_REQUESTS = REGISTRY.counter("user_cache_requests_total", "ユーザー情報キャッシュの参照回数", ("result",))
+CACHED_USERS = REGISTRY.gauge("user_cache_users", "キャッシュ中のユーザー数")
+
+
+class UserIdentityCache:
+    """
+    ユーザーの行（users テーブルの1行）のプロセス内キャッシュ。id と username のどちらでも引けます。
+    ログイン・登録時に格納し、ユーザーの更新時に破棄します。他のプロセスでの更新は ttl_seconds 経過後に反映されます。
+    件数の上限を超えた場合は最も長く参照されていないユーザーから破棄します（LRU）。
+    """
+
+    def __init__(self, max_users: int = 10000, ttl_seconds: float = 300.0):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        # id → (格納時刻, 行)
+        self._by_id: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._id_by_username: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _get_locked(self, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        entry = self._by_id.get(user_id) if user_id is not None else None
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] >= self.ttl_seconds:
+            self._remove_locked(user_id)
+            return None
+        self._by_id.move_to_end(user_id)
+        return dict(entry[1])
+
+    def _remove_locked(self, user_id: str) -> None:
+        entry = self._by_id.pop(user_id, None)
+        if entry is not None and self._id_by_username.get(entry[1].get("username")) == user_id:
+            del self._id_by_username[entry[1]["username"]]
+        CACHED_USERS.set(len(self._by_id))
+
+    def _lookup(self, user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user = self._get_locked(user_id)
+        CACHE_REQUESTS.inc(result="hit" if user is not None else "miss")
+        return user
+
+    def get_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+        return self._lookup(user_id)
+
+    def get_by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            user_id = self._id_by_username.get(username)
+        return self._lookup(user_id)
+
+    def put(self, user: Dict[str, Any]) -> None:
+        with self._lock:
+            self._remove_locked(user["id"])
+            self._by_id[user["id"]] = (time.monotonic(), dict(user))
+            if user.get("username"):
+                self._id_by_username[user["username"]] = user["id"]
+            while len(self._by_id) > self.max_users:
+                self._remove_locked(next(iter(self._by_id)))
+            CACHED_USERS.set(len(self._by_id))
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._remove_locked(user_id)
+
+
+def create_user_cache_from_env() -> Optional[UserIdentityCache]:
+    """USER_CACHE_MAX_USERS=0 の場合はキャッシュを無効にします。"""
+    max_users = int(os.environ.get("USER_CACHE_MAX_USERS", "10000"))
+    if max_users <= 0:
+        return None
+    return UserIdentityCache(
+        max_users=max_users,
+        ttl_seconds=float(os.environ.get("USER_CACHE_TTL_SECONDS", "300")),
+    )
@@ -1,12 +1,22 @@
-from google.cloud import bigquery
+from src.core.storage import QueryParameter, StorageBackend
 from typing import Optional
 import logging
 from src.models.user import UserCreate, UserInDB
+from src.services.user_cache import UserIdentityCache
+
+logger = logging.getLogger(__name__)
 
 class UserService:
-    def __init__(self, db_client: bigquery.Client, table_id: str):
+    def __init__(self, db_client: StorageBackend, table_id: str, cache: Optional[UserIdentityCache] = None):
         self.client = db_client
         self.table_id = table_id
+        # id・usernameで引くユーザー情報のキャッシュ（取得・登録時に格納し、更新時に破棄する）
+        self.cache = cache
+
+    def _remember(self, row):
+        if row and self.cache is not None:
+            self.cache.put(row)
+        return row
 
     def upsert_user(self, user_data: UserCreate) -> Optional[UserInDB]:
         """ユーザー情報をBigQueryにUPSERT（MERGE）します。"""
@@ -42,20 +52,26 @@ class UserService:
             """
             
             params = [
-                bigquery.ScalarQueryParameter("google_id", "STRING", user_data.google_id),
-                bigquery.ScalarQueryParameter("email", "STRING", user_data.email),
-                bigquery.ScalarQueryParameter("display_name", "STRING", user_data.display_name),
-                bigquery.ScalarQueryParameter("profile_picture_url", "STRING", user_data.profile_picture_url)
+                QueryParameter("google_id", "STRING", user_data.google_id),
+                QueryParameter("email", "STRING", user_data.email),
+                QueryParameter("display_name", "STRING", user_data.display_name),
+                QueryParameter("profile_picture_url", "STRING", user_data.profile_picture_url)
             ]
 
-            query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-            query_job.result()  # クエリの完了を待つ
-
-            # UPSERT後のユーザー情報を取得
-            return self.get_user_by_google_id(user_data.google_id)
+            # MERGEとUPSERT後のユーザー情報の取得を1つのスクリプトジョブで実行する
+            script = query + f""";
+                SELECT *
+                FROM `{self.table_id}`
+                WHERE google_id = @google_id
+                LIMIT 1
+            """
+            row = self.client.query(script, params).first()
+            if row and self.cache is not None:
+                self.cache.invalidate(row["id"])
+            return UserInDB(**row) if row else None
 
         except Exception as e:
-            logging.error(f"Failed to upsert user into BigQuery: {e}")
+            logger.error("Failed to upsert user: %s", e)
             return None
 
     def get_user_by_google_id(self, google_id: str) -> Optional[UserInDB]:
@@ -66,13 +82,11 @@ class UserService:
             WHERE google_id = @google_id
             LIMIT 1
         """
-        params = [bigquery.ScalarQueryParameter("google_id", "STRING", google_id)]
+        params = [QueryParameter("google_id", "STRING", google_id)]
 
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        
-        result = list(query_job.result())
-        if result:
-            return UserInDB(**result[0])
+        row = self.client.query(query, params).first()
+        if row:
+            return UserInDB(**row)
         return None
 
     def get_user_by_email(self, email: str) -> Optional[UserInDB]:
@@ -83,52 +97,84 @@ class UserService:
             WHERE email = @email
             LIMIT 1
         """
-        params = [bigquery.ScalarQueryParameter("email", "STRING", email)]
+        params = [QueryParameter("email", "STRING", email)]
 
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        
-        result = list(query_job.result())
-        if result:
-            return UserInDB(**result[0])
+        row = self.client.query(query, params).first()
+        if row:
+            return UserInDB(**row)
         return None
 
     def get_user_by_username(self, username: str):
         """
         usernameでユーザー情報を取得
         """
+        if self.cache is not None:
+            cached = self.cache.get_by_username(username)
+            if cached is not None:
+                return cached
         query = f"""
             SELECT * FROM `{self.table_id}`
             WHERE username = @username
             LIMIT 1
         """
-        params = [bigquery.ScalarQueryParameter("username", "STRING", username)]
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        result = list(query_job.result())
-        if result:
-            return result[0]
-        return None
+        params = [QueryParameter("username", "STRING", username)]
+        return self._remember(self.client.query(query, params).first())
+
+    def get_user_by_id(self, user_id: str):
+        """
+        user_idでユーザー情報を取得
+        """
+        if self.cache is not None:
+            cached = self.cache.get_by_id(user_id)
+            if cached is not None:
+                return cached
+        query = f"""
+            SELECT * FROM `{self.table_id}`
+            WHERE id = @user_id
+            LIMIT 1
+        """
+        params = [QueryParameter("user_id", "STRING", user_id)]
+        return self._remember(self.client.query(query, params).first())
 
     def get_user_by_username_or_id(self, value: str):
         """
         usernameまたはuser_idでユーザー情報を取得
         """
+        if self.cache is not None:
+            cached = self.cache.get_by_id(value) or self.cache.get_by_username(value)
+            if cached is not None:
+                return cached
         query = f"""
             SELECT * FROM `{self.table_id}`
             WHERE username = @value OR id = @value
             LIMIT 1
         """
-        params = [bigquery.ScalarQueryParameter("value", "STRING", value)]
-        query_job = self.client.query(query, job_config=bigquery.QueryJobConfig(query_parameters=params))
-        result = list(query_job.result())
-        if result:
-            return result[0]
-        return None
+        params = [QueryParameter("value", "STRING", value)]
+        return self._remember(self.client.query(query, params).first())
+
+    def update_password_hash(self, user_id: str, password_hash: str) -> None:
+        """
+        パスワードハッシュを更新します（コストを上げたハッシュへの移行用）。
+        """
+        query = f"""
+            UPDATE `{self.table_id}`
+            SET password_hash = @password_hash, updated_at = CURRENT_TIMESTAMP()
+            WHERE id = @user_id
+        """
+        params = [
+            QueryParameter("password_hash", "STRING", password_hash),
+            QueryParameter("user_id", "STRING", user_id),
+        ]
+        self.client.query(query, params)
+        if self.cache is not None:
+            self.cache.invalidate(user_id)
 
     def create_user(self, user: dict):
         """
         新規ユーザーをBigQueryにINSERT
         """
-        errors = self.client.insert_rows_json(self.table_id, [user])
+        errors = self.client.insert_rows(self.table_id, [user])
         if errors:
             raise Exception(f"BigQuery insert error: {errors}")
+        self._remember(user)
         return True 
\ No newline at end of file
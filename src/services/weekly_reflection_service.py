@@ -1,16 +1,75 @@
-from google.cloud import bigquery
+from src.core.storage import QueryParameter, StorageBackend
+from src.core.table_layout import utc_day_range
 from src.models.weekly_reflection import WeeklyReflectionCreate, WeeklyReflectionInDB
-from typing import Optional
+from src.services.daily_rollup_service import DailyRollupService
+from src.services.load_engine import ActivityColumns, compute_load
+from typing import Iterator, List, Optional, TYPE_CHECKING
 from datetime import datetime, timedelta, date
 import uuid
 import json
-from vertexai.generative_models import GenerativeModel
-import vertexai
+import logging
+from src.services.ai_model_client import AIModelClient, VertexAIModelClient
+from src.services.ai_diagnosis_cache import AIDiagnosisCache, diagnosis_cache_key, normalize_diagnosis_inputs
+from src.services.data_version import DataVersion, DataVersions
+
+if TYPE_CHECKING:
+    from src.services.activity_service import ActivityService
+
+logger = logging.getLogger(__name__)
+
+ACTIVITIES_TABLE_ID = 'health-report-465810.health_data.activities'
 
 class WeeklyReflectionService:
-    def __init__(self, db_client: bigquery.Client, table_id: str):
+    def __init__(self, db_client: StorageBackend, table_id: str, activities_table_id: str = ACTIVITIES_TABLE_ID,
+                 rollups: Optional[DailyRollupService] = None, activity_service: Optional["ActivityService"] = None,
+                 model_client: Optional[AIModelClient] = None, diagnosis_cache: Optional[AIDiagnosisCache] = None,
+                 versions: Optional[DataVersions] = None):
         self.client = db_client
         self.table_id = table_id
+        self.activities_table_id = activities_table_id
+        # 有効な場合、負荷ポイントは行動記録ではなく日次集計から読む
+        self.rollups = rollups
+        # 指定された場合、負荷集計に使う行動記録はActivityService経由（読み取りキャッシュ付き）で取得する
+        self.activity_service = activity_service
+        # AI診断の生成モデル（プロセス内で共有する）
+        self.model_client = model_client or VertexAIModelClient()
+        # 同一内容のAI診断結果のキャッシュ（入力を正規化したプロンプトとモデル名で引く）
+        self.diagnosis_cache = diagnosis_cache
+        # ユーザー毎のデータバージョン（保存の完了直後に進め、一覧の条件付きGETに使う）
+        self.versions = versions
+
+    def data_version(self, user_id: str) -> Optional[DataVersion]:
+        """ユーザーの週次振り返りの現在のバージョン（無効な場合は None）"""
+        return self.versions.current(user_id) if self.versions is not None else None
+
+    def _changed(self, user_id: str) -> None:
+        if self.versions is not None:
+            self.versions.bump(user_id)
+
+    def _weekly_load_points_sql(self) -> str:
+        """
+        @user_id の @week_start_date〜@week_end_date の負荷ポイント合計を返すSELECT文
+        fatigue_level * 作業時間（分）/ 60 を負荷ポイントとして計算
+        行動記録からの集計では同じ期間を @week_start_time〜@week_end_time（TIMESTAMP, 終端を含まない）で絞り込む
+        """
+        if self.rollups is not None:
+            return self.rollups.weekly_load_points_sql()
+        return f"""SELECT COALESCE(SUM(
+          fatigue_level * 
+          (TIMESTAMP_DIFF(end_time, start_time, MINUTE) / 60.0)
+        ), 0) as total_load_points
+        FROM `{self.activities_table_id}`
+        WHERE user_id = @user_id 
+        AND start_time >= @week_start_time AND start_time < @week_end_time
+        AND category_id IN ('business', 'study', 'private')"""
+
+    @staticmethod
+    def _week_time_params(week_start_date: date, week_end_date: date) -> List[QueryParameter]:
+        week_start_time, week_end_time = utc_day_range(week_start_date, week_end_date)
+        return [
+            QueryParameter("week_start_time", "TIMESTAMP", week_start_time),
+            QueryParameter("week_end_time", "TIMESTAMP", week_end_time),
+        ]
 
     def calculate_weekly_load_points(self, user_id: str, week_start_date: date) -> float:
         """
@@ -21,33 +80,109 @@ class WeeklyReflectionService:
         week_end_date = week_start_date + timedelta(days=6)
         
         # Activitiesテーブルから該当週の負荷ポイントを取得
-        # fatigue_level * 作業時間（分）を負荷ポイントとして計算
-        activities_table_id = 'health-report-465810.health_data.activities'
+        query = self._weekly_load_points_sql()
         
-        query = f"""
-        SELECT COALESCE(SUM(
-          fatigue_level * 
-          (TIMESTAMP_DIFF(end_time, start_time, MINUTE) / 60.0)
-        ), 0) as total_load_points
-        FROM `{activities_table_id}`
-        WHERE user_id = @user_id 
-        AND DATE(start_time) BETWEEN @week_start_date AND @week_end_date
-        AND category_id IN ('business', 'study', 'private')
-        """
+        params = [
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("week_start_date", "DATE", str(week_start_date)),
+            QueryParameter("week_end_date", "DATE", str(week_end_date)),
+            *self._week_time_params(week_start_date, week_end_date),
+        ]
         
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-                bigquery.ScalarQueryParameter("week_start_date", "DATE", str(week_start_date)),
-                bigquery.ScalarQueryParameter("week_end_date", "DATE", str(week_end_date))
+        row = self.client.query(query, params).first()
+        return float(row["total_load_points"] or 0) if row else 0.0
+
+    def get_weekly_load_summary(self, user_id: str, week_start_date: date) -> dict:
+        """
+        指定された週の日別サマリー（活動時間・負荷ポイント）と週次合計を返す
+        """
+        week_end_date = week_start_date + timedelta(days=6)
+        if self.rollups is not None:
+            rows = self.rollups.get_daily_totals(user_id, week_start_date, week_end_date)
+            return self._to_load_summary(rows)
+        report = compute_load(self._activity_columns(user_id, week_start_date, week_end_date), week_start_date, 7,
+                              rolling_window=1)
+        return {
+            "total_load_points": float(report.daily_load_points.sum()),
+            "daily": report.daily_summary()
+        }
+
+    def get_load_trends(self, user_id: str, week_start_date: date, weeks: int = 4, rolling_window: int = 7,
+                        peak_days: int = 3) -> dict:
+        """
+        week_start_date の週までの直近 weeks 週分の負荷推移を返す
+        行動記録の取得は期間全体で1回のみ（週毎のクエリは発行しない）
+        """
+        first_week_start = week_start_date - timedelta(days=7 * (weeks - 1))
+        days = 7 * weeks
+        fetch_start = first_week_start - timedelta(days=max(rolling_window - 1, 0))
+        columns = self._activity_columns(user_id, fetch_start, week_start_date + timedelta(days=6))
+        report = compute_load(columns, first_week_start, days, rolling_window=rolling_window, peak_days=peak_days)
+        return {
+            "weeks": [
+                {
+                    "week_start_date": str(first_week_start + timedelta(days=7 * i)),
+                    "total_load_points": float(report.weekly_load_points[i]),
+                    "activity_minutes": int(report.weekly_minutes[i])
+                }
+                for i in range(weeks)
+            ],
+            "daily": [
+                {
+                    "date": str(report.day(i)),
+                    "activity_minutes": int(report.daily_minutes[i]),
+                    "load_points": float(report.daily_load_points[i]),
+                    "rolling_load_points": float(report.rolling_load_points[i])
+                }
+                for i in range(days)
+            ],
+            "category_minutes": report.category_minutes,
+            "peak_days": [
+                {"date": str(report.day(i)), "load_points": float(report.daily_load_points[i])}
+                for i in report.peak_day_indices
             ]
-        )
-        
-        results = list(self.client.query(query, job_config=job_config).result())
-        return float(results[0]["total_load_points"]) if results else 0.0
+        }
+
+    def _activity_columns(self, user_id: str, start_date: date, end_date: date) -> ActivityColumns:
+        """DATE(start_time) が start_date〜end_date の行動記録を含む列データを1回の取得で返す"""
+        start_time, end_time = utc_day_range(start_date, end_date)
+        if self.activity_service is not None:
+            # 読み取りキャッシュに載っている期間であれば、SQLと同じ範囲をメモリ上で切り出す
+            # （キャッシュに無い場合に期間を広げて取得・キャッシュすることはしない）
+            cached = self.activity_service.get_cached_activities_started_between(user_id, start_time, end_time)
+            if cached is not None:
+                return ActivityColumns.from_rows(cached)
+        query = f"""
+        SELECT start_time, end_time, fatigue_level, category_id
+        FROM `{self.activities_table_id}`
+        WHERE user_id = @user_id
+          AND start_time >= @start_time AND start_time < @end_time
+        """
+        params = [
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("start_time", "TIMESTAMP", start_time),
+            QueryParameter("end_time", "TIMESTAMP", end_time),
+        ]
+        return ActivityColumns.from_rows(self.client.query(query, params))
+
+    @staticmethod
+    def _to_load_summary(rows) -> dict:
+        daily = []
+        total_load_points = 0
+        for row in rows:
+            daily.append({
+                "date": str(row["date"]),
+                "activity_minutes": int(row["activity_minutes"] or 0),
+                "load_points": float(row["load_points"] or 0)
+            })
+            total_load_points += float(row["load_points"] or 0)
+        return {
+            "total_load_points": total_load_points,
+            "daily": daily
+        }
 
     def create_weekly_reflection(self, user_id: str, data: WeeklyReflectionCreate) -> Optional[WeeklyReflectionInDB]:
-        print(f"=== [DEBUG] create_weekly_reflection called with user_id: {user_id} ===")
+        logger.debug("create_weekly_reflection: user_id=%s week_start_date=%s", user_id, data.week_start_date)
         now = datetime.utcnow()
         
         # 週次負荷ポイント合計を計算
@@ -68,12 +203,12 @@ class WeeklyReflectionService:
             "created_at": now.isoformat(),
             "updated_at": now.isoformat()
         }
-        print(f"=== [DEBUG] Inserting row: {row} ===")
-        errors = self.client.insert_rows_json(self.table_id, [row])
+        logger.debug("Inserting weekly reflection row: %s", row)
+        errors = self.client.insert_rows(self.table_id, [row])
         if errors:
-            print(f"=== [ERROR] BigQuery insert errors: {errors} ===")
+            logger.error("Weekly reflection insert failed: %s", errors)
             raise Exception(f"BigQuery insert error: {errors}")
-        print("=== [DEBUG] Insert successful ===")
+        self._changed(user_id)
         # questionsをリストに戻してからPydanticモデルに渡す
         row["questions"] = json.loads(row["questions"]) if row["questions"] else []
         return WeeklyReflectionInDB(**row)
@@ -88,6 +223,47 @@ class WeeklyReflectionService:
             "good_things": str
         }
         """
+        try:
+            return self.generate_ai_diagnosis(data)
+        except Exception as e:
+            return f"AI診断コメント生成中にエラーが発生しました: {e}"
+
+    def generate_ai_diagnosis(self, data: dict) -> str:
+        """AI診断コメントを生成する（失敗時は例外を送出。ジョブキューから呼ばれる）"""
+        if self.diagnosis_cache is None:
+            return self.model_client.generate(self.build_diagnosis_prompt(data))
+        prompt = self.build_diagnosis_prompt(normalize_diagnosis_inputs(data))
+        key = diagnosis_cache_key(self.model_client.model_name, prompt)
+        cached = self.diagnosis_cache.get(key)
+        if cached is not None:
+            return cached
+        comment = self.model_client.generate(prompt)
+        self.diagnosis_cache.put(key, comment)
+        return comment
+
+    def stream_ai_diagnosis(self, data: dict) -> Iterator[str]:
+        """
+        AI診断コメントを生成されたそばから断片ごとに返す（失敗時は例外を送出）。
+        キャッシュ済みの場合は全体を1つの断片として返し、生成した場合は完了後にキャッシュする。
+        """
+        if self.diagnosis_cache is None:
+            prompt = self.build_diagnosis_prompt(data)
+        else:
+            prompt = self.build_diagnosis_prompt(normalize_diagnosis_inputs(data))
+            key = diagnosis_cache_key(self.model_client.model_name, prompt)
+            cached = self.diagnosis_cache.get(key)
+            if cached is not None:
+                yield cached
+                return
+        chunks = []
+        for chunk in self.model_client.generate_stream(prompt):
+            chunks.append(chunk)
+            yield chunk
+        if self.diagnosis_cache is not None:
+            self.diagnosis_cache.put(key, "".join(chunks).strip())
+
+    @staticmethod
+    def build_diagnosis_prompt(data: dict) -> str:
         # プロンプト生成（ペルソナ強化＆指摘＋ポジティブ締め）
         prompt = f"""
 あなたは優しいカウンセラーです。以下の週次振り返り内容をもとに、ユーザーが前向きになれるような温かいコメントを日本語で200文字程度で作成してください。
@@ -98,135 +274,141 @@ class WeeklyReflectionService:
 
 【設問とスコア】
 """
-        for q in data.get('questions', []):
+        for q in data.get('questions', []) or []:
             prompt += f"・{q.get('text', '')}：{q.get('score', '')}点\n"
         prompt += f"\n【不安なこと】\n{data.get('anxieties', '')}\n"
         prompt += f"\n【良かったこと】\n{data.get('good_things', '')}\n"
         prompt += "\n---\n\nコメント："
-
-        # Geminiモデル呼び出し
-        try:
-            model = GenerativeModel("gemini-2.5-flash")
-            response = model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            return f"AI診断コメント生成中にエラーが発生しました: {e}"
+        return prompt
 
     def get_weekly_reflections(self, user_id: str, week_start_date: Optional[str] = None):
-        # デバッグ用：ユーザーIDをログ出力
-        print(f"=== [DEBUG] Service user_id: {user_id} ===")
-        
         # BigQueryからユーザーの週次振り返りを取得
         query = f"""
         SELECT * FROM `{self.table_id}`
         WHERE user_id = @user_id
         """
-        print(f"=== [DEBUG] Query: {query} ===")
-        print(f"=== [DEBUG] user_id parameter: {user_id} ===")
+        logger.debug("get_weekly_reflections: user_id=%s query=%s", user_id, query)
         query_parameters = [
-            bigquery.ScalarQueryParameter("user_id", "STRING", user_id)
+            QueryParameter("user_id", "STRING", user_id)
         ]
         
         if week_start_date:
             query += " AND week_start_date = @week_start_date"
             query_parameters.append(
-                bigquery.ScalarQueryParameter("week_start_date", "DATE", week_start_date)
+                QueryParameter("week_start_date", "DATE", week_start_date)
             )
         
-        job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
         query += " ORDER BY week_start_date DESC"
-        results = self.client.query(query, job_config=job_config).result()
-        reflections = []
-        for row in results:
-            # questionsはJSON型なのでlistに変換（型チェック）
-            if row["questions"]:
-                if isinstance(row["questions"], str):
-                    questions = json.loads(row["questions"])
-                else:
-                    questions = row["questions"]
+        results = self.client.query(query, query_parameters)
+        return [self._to_reflection(row) for row in results]
+
+    def iter_reflection_pages(self, user_id: str, page_size: int = 1000) -> Iterator[List[dict]]:
+        """ユーザーの週次振り返りを page_size 行ずつのページ（dict）で遅延して返します（エクスポート用）。"""
+        query = f"""
+        SELECT * FROM `{self.table_id}`
+        WHERE user_id = @user_id
+        ORDER BY week_start_date DESC
+        """
+        pages = self.client.iter_query_pages(query, [QueryParameter("user_id", "STRING", user_id)], page_size=page_size)
+        return ([self._normalize_questions(row) for row in page] for page in pages)
+
+    @staticmethod
+    def _normalize_questions(row: dict) -> dict:
+        # JSON型の列はバックエンドによって文字列で返るため、listに揃える
+        if isinstance(row.get("questions"), str):
+            row["questions"] = json.loads(row["questions"])
+        return row
+
+    @staticmethod
+    def _to_reflection(row: dict) -> WeeklyReflectionInDB:
+        # questionsはJSON型なのでlistに変換（型チェック）
+        if row["questions"]:
+            if isinstance(row["questions"], str):
+                questions = json.loads(row["questions"])
             else:
-                questions = []
-            reflection = WeeklyReflectionInDB(
-                id=row["id"],
-                user_id=row["user_id"],
-                week_start_date=row["week_start_date"],
-                most_frequent_category_id=row.get("most_frequent_category_id"),
-                reflection_notes=row.get("reflection_notes"),
-                ai_diagnosis_result=row.get("ai_diagnosis_result"),
-                title=row.get("title"),
-                questions=questions,
-                anxieties=row.get("anxieties"),
-                good_things=row.get("good_things"),
-                weekly_total_load_points=row.get("weekly_total_load_points"),
-                created_at=row["created_at"],
-                updated_at=row["updated_at"]
-            )
-            reflections.append(reflection)
-        return reflections
+                questions = row["questions"]
+        else:
+            questions = []
+        return WeeklyReflectionInDB(
+            id=row["id"],
+            user_id=row["user_id"],
+            week_start_date=row["week_start_date"],
+            most_frequent_category_id=row.get("most_frequent_category_id"),
+            reflection_notes=row.get("reflection_notes"),
+            ai_diagnosis_result=row.get("ai_diagnosis_result"),
+            title=row.get("title"),
+            questions=questions,
+            anxieties=row.get("anxieties"),
+            good_things=row.get("good_things"),
+            weekly_total_load_points=row.get("weekly_total_load_points"),
+            created_at=row["created_at"],
+            updated_at=row["updated_at"]
+        )
 
     def upsert_weekly_reflection(self, user_id: str, data: WeeklyReflectionCreate) -> Optional[WeeklyReflectionInDB]:
-        print(f"=== [DEBUG] upsert_weekly_reflection called with user_id: {user_id}, week_start_date: {data.week_start_date} ===")
-        
-        # 既存レコードの有無を確認
+        """
+        週次振り返りを (user_id, week_start_date) 単位でUPSERTします。
+        週次負荷ポイントはMERGE内でActivitiesテーブルから集計し、保存後の行を同じスクリプトジョブで返します。
+        """
+        logger.debug("upsert_weekly_reflection: user_id=%s week_start_date=%s", user_id, data.week_start_date)
+        week_end_date = data.week_start_date + timedelta(days=6)
         query = f"""
-        SELECT id FROM `{self.table_id}`
+        MERGE `{self.table_id}` AS target
+        USING (
+          SELECT
+            @user_id AS user_id,
+            @week_start_date AS week_start_date,
+            @reflection_notes AS reflection_notes,
+            @title AS title,
+            @questions AS questions,
+            @anxieties AS anxieties,
+            @good_things AS good_things,
+            @ai_diagnosis_result AS ai_diagnosis_result,
+            ({self._weekly_load_points_sql()}) AS weekly_total_load_points
+        ) AS source
+        ON target.user_id = source.user_id AND target.week_start_date = source.week_start_date
+        WHEN MATCHED THEN
+          UPDATE SET
+            reflection_notes = source.reflection_notes,
+            title = source.title,
+            questions = source.questions,
+            anxieties = source.anxieties,
+            good_things = source.good_things,
+            ai_diagnosis_result = source.ai_diagnosis_result,
+            weekly_total_load_points = source.weekly_total_load_points,
+            updated_at = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN
+          INSERT (
+            id, user_id, week_start_date, reflection_notes, title, questions, anxieties,
+            good_things, ai_diagnosis_result, weekly_total_load_points, created_at, updated_at
+          )
+          VALUES (
+            @id, source.user_id, source.week_start_date, source.reflection_notes, source.title,
+            source.questions, source.anxieties, source.good_things, source.ai_diagnosis_result,
+            source.weekly_total_load_points, CURRENT_TIMESTAMP(), CURRENT_TIMESTAMP()
+          );
+        SELECT * FROM `{self.table_id}`
         WHERE user_id = @user_id AND week_start_date = @week_start_date
+        ORDER BY updated_at DESC
+        LIMIT 1
         """
-        job_config = bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("user_id", "STRING", user_id),
-                bigquery.ScalarQueryParameter("week_start_date", "DATE", str(data.week_start_date))
-            ]
-        )
-        results = list(self.client.query(query, job_config=job_config).result())
-        print(f"=== [DEBUG] Existing records found: {len(results)} ===")
-        
-        # 週次負荷ポイント合計を計算
-        weekly_total_load_points = self.calculate_weekly_load_points(user_id, data.week_start_date)
-        print(f"=== [DEBUG] Weekly total load points: {weekly_total_load_points} ===")
-        
-        if results:
-            # UPDATE
-            row_id = results[0]["id"]
-            print(f"=== [DEBUG] Updating existing record with id: {row_id} ===")
-            update_query = f"""
-            UPDATE `{self.table_id}`
-            SET
-              reflection_notes = @reflection_notes,
-              title = @title,
-              questions = @questions,
-              anxieties = @anxieties,
-              good_things = @good_things,
-              ai_diagnosis_result = @ai_diagnosis_result,
-              weekly_total_load_points = @weekly_total_load_points,
-              updated_at = CURRENT_TIMESTAMP()
-            WHERE id = @id
-            """
-            job_config = bigquery.QueryJobConfig(
-                query_parameters=[
-                    bigquery.ScalarQueryParameter("reflection_notes", "STRING", data.reflection_notes),
-                    bigquery.ScalarQueryParameter("title", "STRING", data.title),
-                    bigquery.ScalarQueryParameter("questions", "JSON", json.dumps([q.dict() for q in data.questions]) if data.questions else None),
-                    bigquery.ScalarQueryParameter("anxieties", "STRING", data.anxieties),
-                    bigquery.ScalarQueryParameter("good_things", "STRING", data.good_things),
-                    bigquery.ScalarQueryParameter("ai_diagnosis_result", "STRING", data.ai_diagnosis_result),
-                    bigquery.ScalarQueryParameter("weekly_total_load_points", "FLOAT64", weekly_total_load_points),
-                    bigquery.ScalarQueryParameter("id", "STRING", row_id)
-                ]
-            )
-            try:
-                self.client.query(update_query, job_config=job_config).result()
-                print("=== [DEBUG] Update successful ===")
-            except Exception as e:
-                print(f"=== [ERROR] Update failed: {str(e)} ===")
-                raise e
-            # 返却用に再取得
-            return self.get_weekly_reflections(user_id, str(data.week_start_date))[0]
-        else:
-            # INSERT（今まで通り）
-            print("=== [DEBUG] Creating new record ===")
-            try:
-                return self.create_weekly_reflection(user_id, data)
-            except Exception as e:
-                print(f"=== [ERROR] Create failed: {str(e)} ===")
-                raise e 
\ No newline at end of file
+        params = [
+            QueryParameter("id", "STRING", str(uuid.uuid4())),
+            QueryParameter("user_id", "STRING", user_id),
+            QueryParameter("week_start_date", "DATE", str(data.week_start_date)),
+            QueryParameter("week_end_date", "DATE", str(week_end_date)),
+            *self._week_time_params(data.week_start_date, week_end_date),
+            QueryParameter("reflection_notes", "STRING", data.reflection_notes),
+            QueryParameter("title", "STRING", data.title),
+            QueryParameter("questions", "JSON", json.dumps([q.dict() for q in data.questions]) if data.questions else None),
+            QueryParameter("anxieties", "STRING", data.anxieties),
+            QueryParameter("good_things", "STRING", data.good_things),
+            QueryParameter("ai_diagnosis_result", "STRING", data.ai_diagnosis_result),
+        ]
+        try:
+            row = self.client.query(query, params).first()
+        except Exception:
+            logger.exception("Weekly reflection upsert failed: user_id=%s", user_id)
+            raise
+        self._changed(user_id)
+        return self._to_reflection(row) if row else None
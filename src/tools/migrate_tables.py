@@ -0,0 +1,189 @@
+"""
+BigQueryのテーブルを Table_JSON/<table>_layout.json のパーティション・クラスタリング構成に移行するコマンド
+
+    python -m src.tools.migrate_tables [--tables activities,weekly_reflections] [--dataset PROJECT.DATASET]
+                                       [--batch-days 3000] [--drop-backup] [--dry-run]
+
+テーブル毎に次を行います（構成が既に一致しているテーブルは何もしない）。
+
+1. テーブルが無い場合は、スキーマと構成を指定して作成する
+2. 構成が異なる場合は、新しい構成の一時テーブル（<table>__migrating）を作成し、
+   元のテーブルからパーティション列の範囲を batch_days 日ずつ区切ってバックフィルする
+   （1回のDMLで変更できるパーティション数の上限を超えないようにするため）
+3. バックフィル中に追加された行を補ってから、元のテーブルを <table>__backup_YYYYMMDD に、
+   一時テーブルを元の名前に変更する
+
+移行中の書き込みは補完しますが、更新・削除は反映されないため、メンテナンス中（書き込みを止めた状態）に実行してください。
+ストリーミングバッファにデータがあるテーブルは名前を変更できないため、バッファが空になってから実行します。
+"""
+import argparse
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+from src.core.bigquery_backend import BigQueryBackend
+from src.core.storage import QueryParameter, StorageBackend
+from src.core.table_layout import LAYOUT_DIR, TableLayout, load_layouts
+
+logger = logging.getLogger(__name__)
+
+DATASET_ID = "health-report-465810.health_data"
+# Table_JSON のテーブル名 → BigQueryのテーブル名
+TABLE_NAMES = {
+    "activities": "activities",
+    "users": "users",
+    "weekly_reflections": "WeeklyReflections",
+    "daily_load_rollups": "DailyLoadRollups",
+    "ai_diagnosis_jobs": "AiDiagnosisJobs",
+}
+# バックフィル後に追加された行の判定に使う一意キー（既定は id）
+TABLE_KEYS = {"daily_load_rollups": ("user_id", "rollup_date", "category_id")}
+MIGRATING_SUFFIX = "__migrating"
+
+
+def _load_schema(table: str) -> List[bigquery.SchemaField]:
+    with open(os.path.join(LAYOUT_DIR, f"{table}_schema.json"), encoding="utf-8") as f:
+        return [bigquery.SchemaField.from_api_repr(field) for field in json.load(f)]
+
+
+def _matches(existing: bigquery.Table, layout: TableLayout) -> bool:
+    partitioning = existing.time_partitioning
+    if layout.partition_field:
+        if partitioning is None or partitioning.field != layout.partition_field \
+                or partitioning.type_ != layout.partition_type:
+            return False
+    elif partitioning is not None:
+        return False
+    return tuple(existing.clustering_fields or ()) == layout.clustering_fields
+
+
+class TableMigrator:
+    def __init__(self, client: bigquery.Client, storage: StorageBackend, dataset_id: str = DATASET_ID,
+                 batch_days: int = 3000, drop_backup: bool = False, dry_run: bool = False):
+        self.client = client
+        self.storage = storage
+        self.dataset_id = dataset_id
+        self.batch_days = batch_days
+        self.drop_backup = drop_backup
+        self.dry_run = dry_run
+
+    def _new_table(self, table_id: str, layout: TableLayout) -> bigquery.Table:
+        table = bigquery.Table(table_id, schema=_load_schema(layout.table))
+        if layout.partition_field:
+            table.time_partitioning = bigquery.TimePartitioning(type_=layout.partition_type, field=layout.partition_field)
+        if layout.clustering_fields:
+            table.clustering_fields = list(layout.clustering_fields)
+        return table
+
+    def _run(self, sql: str, params: Optional[Sequence[QueryParameter]] = None) -> None:
+        if self.dry_run:
+            logger.info("[dry-run] %s params=%s", " ".join(sql.split()), list(params or []))
+            return
+        self.storage.query(sql, params)
+
+    def migrate(self, layout: TableLayout) -> None:
+        table_id = f"{self.dataset_id}.{TABLE_NAMES[layout.table]}"
+        try:
+            existing = self.client.get_table(table_id)
+        except NotFound:
+            logger.info("Creating %s with %s", table_id, layout.to_api_repr())
+            if not self.dry_run:
+                self.client.create_table(self._new_table(table_id, layout))
+            return
+        if _matches(existing, layout):
+            logger.info("%s is already %s", table_id, layout.to_api_repr())
+            return
+        if existing.streaming_buffer is not None:
+            raise RuntimeError(f"{table_id} has rows in the streaming buffer; retry after it is flushed")
+
+        migrating_id = table_id + MIGRATING_SUFFIX
+        logger.info("Migrating %s to %s via %s", table_id, layout.to_api_repr(), migrating_id)
+        if not self.dry_run:
+            self.client.delete_table(migrating_id, not_found_ok=True)
+            self.client.create_table(self._new_table(migrating_id, layout))
+
+        columns = ", ".join(field.name for field in existing.schema)
+        self._backfill(table_id, migrating_id, columns, layout)
+        # バックフィル中に追加された行を補う
+        keys = " AND ".join(f"target.{key} = source.{key}" for key in TABLE_KEYS.get(layout.table, ("id",)))
+        self._run(f"""
+            INSERT INTO `{migrating_id}` ({columns})
+            SELECT {columns} FROM `{table_id}` AS source
+            WHERE NOT EXISTS (SELECT 1 FROM `{migrating_id}` AS target WHERE {keys})
+        """)
+        self._verify_counts(table_id, migrating_id)
+
+        backup_name = f"{TABLE_NAMES[layout.table]}__backup_{date.today():%Y%m%d}"
+        self._run(f"ALTER TABLE `{table_id}` RENAME TO `{backup_name}`")
+        self._run(f"ALTER TABLE `{migrating_id}` RENAME TO `{TABLE_NAMES[layout.table]}`")
+        if self.drop_backup:
+            self._run(f"DROP TABLE `{self.dataset_id}.{backup_name}`")
+        logger.info("Migrated %s (backup: %s.%s)", table_id, self.dataset_id, backup_name)
+
+    def _backfill(self, table_id: str, migrating_id: str, columns: str, layout: TableLayout) -> None:
+        insert = f"INSERT INTO `{migrating_id}` ({columns}) SELECT {columns} FROM `{table_id}`"
+        if not layout.partition_field:
+            self._run(insert)
+            return
+        # パーティション列の日付（TIMESTAMP列は DATE(列)）で batch_days 日ずつ区切る
+        partition_date = layout.partition_field
+        if any(f.name == layout.partition_field and f.field_type == "TIMESTAMP" for f in _load_schema(layout.table)):
+            partition_date = f"DATE({layout.partition_field})"
+        bounds = self.storage.query(
+            f"SELECT MIN({partition_date}) AS min_date, MAX({partition_date}) AS max_date FROM `{table_id}`"
+        ).first()
+        if bounds is None or bounds["min_date"] is None:
+            return
+        start, max_date = bounds["min_date"], bounds["max_date"]
+        if isinstance(start, str):
+            start, max_date = date.fromisoformat(start[:10]), date.fromisoformat(max_date[:10])
+        while start <= max_date:
+            end = start + timedelta(days=self.batch_days)
+            logger.info("Backfilling %s: %s <= %s < %s", migrating_id, start, partition_date, end)
+            self._run(f"{insert} WHERE {partition_date} >= @batch_start AND {partition_date} < @batch_end", [
+                QueryParameter("batch_start", "DATE", str(start)),
+                QueryParameter("batch_end", "DATE", str(end)),
+            ])
+            start = end
+
+    def _verify_counts(self, table_id: str, migrating_id: str) -> None:
+        if self.dry_run:
+            return
+        row = self.storage.query(
+            f"SELECT (SELECT COUNT(*) FROM `{table_id}`) AS source_rows, "
+            f"(SELECT COUNT(*) FROM `{migrating_id}`) AS migrated_rows"
+        ).first()
+        if row["source_rows"] != row["migrated_rows"]:
+            raise RuntimeError(
+                f"row count mismatch for {table_id}: {row['source_rows']} != {row['migrated_rows']} ({migrating_id} is kept)"
+            )
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="テーブルをパーティション・クラスタリング構成に移行します")
+    parser.add_argument("--tables", help="対象テーブル（Table_JSON のテーブル名をカンマ区切り、省略時はすべて）")
+    parser.add_argument("--dataset", default=os.environ.get("BIGQUERY_DATASET_ID", DATASET_ID),
+                        help="PROJECT.DATASET 形式のデータセット")
+    parser.add_argument("--batch-days", type=int, default=3000, help="バックフィル1回あたりの日数")
+    parser.add_argument("--drop-backup", action="store_true", help="移行後に元のテーブルを削除します")
+    parser.add_argument("--dry-run", action="store_true", help="実行するSQLを出力するだけで変更しません")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    layouts = load_layouts()
+    names = args.tables.split(",") if args.tables else list(layouts)
+    unknown = [name for name in names if name not in layouts or name not in TABLE_NAMES]
+    if unknown:
+        parser.error(f"unknown tables: {', '.join(unknown)}")
+
+    storage = BigQueryBackend()
+    migrator = TableMigrator(storage.client, storage, args.dataset, args.batch_days, args.drop_backup, args.dry_run)
+    for name in names:
+        migrator.migrate(layouts[name])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,23 @@
+"""
+フロントエンドのビルド成果物の gzip / brotli 版を作るコマンド（イメージのビルド時に実行し、起動時の圧縮を省く）
+
+    python -m src.tools.precompress_static [--build-dir static/frontend/build] [--min-bytes 1024]
+"""
+import argparse
+import logging
+from src.core.static_assets import available_encodings, precompress
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="静的ファイルの圧縮版（.gz / .br）を作ります")
+    parser.add_argument("--build-dir", default="static/frontend/build", help="ビルド成果物のディレクトリ")
+    parser.add_argument("--min-bytes", type=int, default=1024, help="これより小さいファイルは圧縮しない")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    created = precompress(args.build_dir, args.min_bytes)
+    logging.info("Precompressed %d files (%s) under %s", created, ", ".join(available_encodings()), args.build_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+"""
+日次集計（DailyLoadRollups）を行動記録から作り直すバックフィル・修復用コマンド
+
+    python -m src.tools.rebuild_daily_rollups [--user-id USER_ID] [--start-date YYYY-MM-DD] [--end-date YYYY-MM-DD]
+"""
+import argparse
+import logging
+import os
+from datetime import date
+from src.core.db import get_db_client
+from src.services.daily_rollup_service import DAILY_ROLLUPS_TABLE_ID, DailyRollupService
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="日次集計を行動記録から再構築します")
+    parser.add_argument("--user-id", help="対象ユーザー（省略時は全ユーザー）")
+    parser.add_argument("--start-date", type=date.fromisoformat, help="対象期間の開始日（省略時は制限なし）")
+    parser.add_argument("--end-date", type=date.fromisoformat, help="対象期間の終了日（省略時は制限なし）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    service = DailyRollupService(get_db_client(), os.environ.get("DAILY_ROLLUPS_TABLE_ID", DAILY_ROLLUPS_TABLE_ID))
+    service.rebuild(user_id=args.user_id, start_date=args.start_date, end_date=args.end_date)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+from typing import Optional
+import pytest
+from src.core.sqlite_backend import SQLiteBackend
+from src.models.activity import ActivityCreate
+
+ACTIVITIES_TABLE_ID = 'health-report-465810.health_data.activities'
+ROLLUPS_TABLE_ID = 'health-report-465810.health_data.DailyLoadRollups'
+REFLECTIONS_TABLE_ID = 'health-report-465810.health_data.WeeklyReflections'
+USER_ID = "00000000-0000-0000-0000-000000000001"
+
+
+def utc(year: int, month: int, day: int, hour: int = 0, minute: int = 0, second: int = 0) -> datetime:
+    return datetime(year, month, day, hour, minute, second, tzinfo=timezone.utc)
+
+
+def activity(start: datetime, end: datetime, category_id: str = "business", fatigue_level: int = 3,
+             content: Optional[str] = None) -> ActivityCreate:
+    return ActivityCreate(start_time=start, end_time=end, activity_content=content or f"{category_id} {start}",
+                          category_id=category_id, fatigue_level=fatigue_level)
+
+
+@pytest.fixture
+def backend() -> SQLiteBackend:
+    return SQLiteBackend()
@@ -0,0 +1,147 @@
+import fcntl
+import json
+import os
+import pytest
+from src.models.activity import ActivityUpdate
+from src.services import activity_write_buffer
+from src.services.activity_service import ActivityService
+from src.services.activity_write_buffer import SPILL_FILE_PREFIX, ActivityWriteBuffer, create_write_buffer_from_env
+from src.services.daily_rollup_service import DailyRollupService
+from tests.conftest import ACTIVITIES_TABLE_ID, ROLLUPS_TABLE_ID, USER_ID, activity, utc
+
+
+def _row(activity_id: str) -> dict:
+    return {
+        "id": activity_id, "user_id": USER_ID, "start_time": "2025-01-06T09:00:00+00:00",
+        "end_time": "2025-01-06T10:00:00+00:00", "activity_content": activity_id, "category_id": "business",
+        "fatigue_level": 2, "fatigue_notes": None, "created_at": "2025-01-06T10:00:00+00:00",
+        "updated_at": "2025-01-06T10:00:00+00:00",
+    }
+
+
+def _stored_ids(backend):
+    return sorted(row["id"] for row in backend.query(f"SELECT id FROM `{ACTIVITIES_TABLE_ID}`"))
+
+
+@pytest.fixture
+def buffer(backend, tmp_path):
+    buffer = ActivityWriteBuffer(backend, ACTIVITIES_TABLE_ID, max_rows=100, max_age_seconds=60,
+                                 spill_dir=str(tmp_path))
+    yield buffer
+    buffer.close()
+
+
+def test_rows_left_by_stopped_instance_are_recovered_at_start(backend, buffer, tmp_path):
+    # 別のインスタンス（同じPIDでもよい）が残したファイル。ロックは保持されていない
+    spill = tmp_path / f"{SPILL_FILE_PREFIX}other-host-{os.getpid()}-0123456789ab.ndjson"
+    # 書き込み途中で落ちた末尾行（応答前）は捨てる
+    spill.write_text("".join(json.dumps(_row(f"r{i}")) + "\n" for i in range(3)) + '{"id": "trunc', encoding="utf-8")
+    # 引き取り途中で止まったプロセスのファイルも回収する
+    (tmp_path / f"{SPILL_FILE_PREFIX}other-host-7-0123456789ab.0.claim").write_text(
+        json.dumps(_row("r3")) + "\n", encoding="utf-8")
+
+    buffer.start()
+
+    assert not spill.exists()
+    assert buffer.get_pending("r0", USER_ID)["id"] == "r0"
+    assert buffer.flush()
+    assert _stored_ids(backend) == ["r0", "r1", "r2", "r3"]
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(buffer.spill_path)[:-len(".ndjson")] + ".lock"]
+
+
+def test_spill_file_of_running_instance_is_left_alone(backend, buffer, tmp_path):
+    live = tmp_path / f"{SPILL_FILE_PREFIX}other-host-1-0123456789ab.ndjson"
+    live.write_text(json.dumps(_row("other")) + "\n", encoding="utf-8")
+    with open(tmp_path / f"{SPILL_FILE_PREFIX}other-host-1-0123456789ab.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        buffer.add(_row("mine"))
+        buffer.flush()
+
+    assert live.exists()
+    assert _stored_ids(backend) == ["mine"]
+
+
+def test_spill_file_names_are_unique_per_buffer(backend, buffer, tmp_path):
+    other = ActivityWriteBuffer(backend, ACTIVITIES_TABLE_ID, max_rows=100, max_age_seconds=60, spill_dir=str(tmp_path))
+    try:
+        buffer.add(_row("a"))
+        other.add(_row("b"))
+
+        assert buffer.spill_path != other.spill_path
+        # 動いている（ロックを保持している）相手のファイルは引き取らない
+        assert buffer.get_pending("b", USER_ID) is None
+    finally:
+        other.close()
+
+
+def test_unflushed_rows_stay_in_spill_file(backend, buffer, tmp_path):
+    buffer.add(_row("a"))
+    buffer.add(_row("b"))
+
+    lines = open(buffer.spill_path, encoding="utf-8").read().splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == ["a", "b"]
+    assert _stored_ids(backend) == []
+
+
+def test_failed_flush_keeps_rows_for_retry(backend, buffer):
+    buffer.add(_row("a"))
+    buffer.table_id = "health-report-465810.health_data.NoSuchTable"
+
+    assert not buffer.flush()
+
+    buffer.table_id = ACTIVITIES_TABLE_ID
+    assert buffer.flush()
+    assert _stored_ids(backend) == ["a"]
+
+
+def test_flushed_rows_are_added_to_rollups(backend, buffer):
+    rollups = DailyRollupService(backend, ROLLUPS_TABLE_ID, ACTIVITIES_TABLE_ID)
+    service = ActivityService(backend, ACTIVITIES_TABLE_ID, write_buffer=buffer, rollups=rollups)
+    service.create_activity(USER_ID, activity(utc(2025, 1, 6, 9), utc(2025, 1, 6, 10, 30), "study", 4))
+
+    assert rollups.get_daily_totals(USER_ID, utc(2025, 1, 6).date(), utc(2025, 1, 6).date()) == []
+    buffer.flush()
+
+    [total] = rollups.get_daily_totals(USER_ID, utc(2025, 1, 6).date(), utc(2025, 1, 6).date())
+    assert (total["activity_minutes"], total["load_points"]) == (90, 6.0)
+
+
+def test_update_and_delete_apply_to_buffered_rows(backend, buffer, tmp_path):
+    rollups = DailyRollupService(backend, ROLLUPS_TABLE_ID, ACTIVITIES_TABLE_ID)
+    service = ActivityService(backend, ACTIVITIES_TABLE_ID, write_buffer=buffer, rollups=rollups)
+    kept = service.create_activity(USER_ID, activity(utc(2025, 1, 6, 9), utc(2025, 1, 6, 10), "study", 1))
+    dropped = service.create_activity(USER_ID, activity(utc(2025, 1, 6, 11), utc(2025, 1, 6, 12), "study", 1))
+
+    updated = service.update_activity(kept.id, USER_ID, ActivityUpdate(fatigue_level=4, end_time=utc(2025, 1, 6, 10, 30)))
+    assert (updated.fatigue_level, updated.activity_content) == (4, kept.activity_content)
+    assert service.get_activity_by_id(kept.id, USER_ID) == updated
+    assert service.update_activity(kept.id, "other-user", ActivityUpdate(fatigue_level=5)) is None
+    assert service.delete_activity(dropped.id, USER_ID)
+    assert service.get_activity_by_id(dropped.id, USER_ID) is None
+    # スピルファイルにも反映されている（再起動時に古い内容で再送しない）
+    spilled = [json.loads(line) for line in open(buffer.spill_path, encoding="utf-8").read().splitlines()]
+    assert [(row["id"], row["fatigue_level"]) for row in spilled] == [(kept.id, 4)]
+
+    buffer.flush()
+
+    assert _stored_ids(backend) == [kept.id]
+    [total] = rollups.get_daily_totals(USER_ID, utc(2025, 1, 6).date(), utc(2025, 1, 6).date())
+    assert (total["activity_minutes"], total["load_points"]) == (90, 6.0)
+    assert service.update_activity(kept.id, USER_ID, ActivityUpdate(fatigue_level=2)).fatigue_level == 2
+
+
+def test_env_factory_requires_durable_spill_dir(backend, tmp_path, monkeypatch):
+    monkeypatch.setenv("ACTIVITY_WRITE_BUFFER_ENABLED", "1")
+    monkeypatch.delenv("ACTIVITY_WRITE_BUFFER_SPILL_DIR", raising=False)
+    with pytest.raises(ValueError):
+        create_write_buffer_from_env(backend, ACTIVITIES_TABLE_ID)
+
+    monkeypatch.setattr(activity_write_buffer, "_filesystem_type", lambda path: "tmpfs")
+    monkeypatch.setenv("ACTIVITY_WRITE_BUFFER_SPILL_DIR", str(tmp_path))
+    with pytest.raises(ValueError):
+        create_write_buffer_from_env(backend, ACTIVITIES_TABLE_ID)
+
+    monkeypatch.setattr(activity_write_buffer, "_filesystem_type", lambda path: "ext4")
+    assert create_write_buffer_from_env(backend, ACTIVITIES_TABLE_ID).spill_dir == str(tmp_path)
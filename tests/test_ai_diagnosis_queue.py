@@ -0,0 +1,160 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import pytest
+from src.services.ai_diagnosis_queue import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, TIMED_OUT_ERROR, AIDiagnosisQueue, QueueFullError,
+)
+from tests.conftest import USER_ID
+
+JOBS_TABLE_ID = 'health-report-465810.health_data.AiDiagnosisJobs'
+
+
+class _GatedModel:
+    """release() されるまで応答しない生成処理"""
+
+    def __init__(self):
+        self.calls = []
+        self._released = threading.Event()
+
+    def __call__(self, data):
+        self.calls.append(data)
+        self._released.wait(5)
+        if data.get("title") == "boom":
+            raise RuntimeError("model error")
+        return f"comment for {data['title']}"
+
+    def release(self):
+        self._released.set()
+
+
+@pytest.fixture
+def model():
+    model = _GatedModel()
+    yield model
+    model.release()
+
+
+def _queue(backend, model, **kwargs) -> AIDiagnosisQueue:
+    return AIDiagnosisQueue(backend, model, table_id=JOBS_TABLE_ID, max_workers=2, **kwargs)
+
+
+def _wait(queue, job_id, user_id=USER_ID):
+    for _ in range(500):
+        job = queue.get(job_id, user_id)
+        if job["status"] in (SUCCEEDED, FAILED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_job_is_visible_from_another_worker(backend, model):
+    # 2つのワーカー（別々のキュー）が同じストレージを共有する
+    accepting, polling = _queue(backend, model), _queue(backend, model)
+
+    job = accepting.submit(USER_ID, {"title": "週の振り返り"})
+
+    assert job["status"] == QUEUED
+    assert polling.get(job["job_id"], USER_ID)["status"] == QUEUED
+    assert polling.get(job["job_id"], "other-user") is None
+    model.release()
+    assert _wait(polling, job["job_id"]) == {"job_id": job["job_id"], "status": SUCCEEDED,
+                                             "ai_comment": "comment for 週の振り返り"}
+
+
+def test_only_registration_and_result_are_written(backend, model):
+    queue = _queue(backend, model)
+    statements = []
+    query = backend.query
+    backend.query = lambda sql, params=None: statements.append(sql.split()[0]) or query(sql, params)
+
+    job = queue.submit(USER_ID, {"title": "a"})
+    for _ in range(500):
+        if queue.get(job["job_id"], USER_ID)["status"] == RUNNING:
+            break
+        time.sleep(0.01)
+    # 実行開始時に状態を書き込まず、実行中の状態は実行しているプロセスがクエリなしで返す
+    assert "UPDATE" not in statements
+    statements.clear()
+    assert queue.get(job["job_id"], USER_ID) == {"job_id": job["job_id"], "status": RUNNING}
+    assert statements == []
+    model.release()
+    _wait(queue, job["job_id"])
+    backend.query = query
+
+    # 書き込みは登録（INSERT）と結果の保存（UPDATE）の2回だけ
+    assert statements == ["UPDATE"]
+
+
+def test_finished_state_is_served_from_memory(backend, model):
+    accepting, polling = _queue(backend, model), _queue(backend, model)
+    model.release()
+    job = accepting.submit(USER_ID, {"title": "a"})
+    done = _wait(polling, job["job_id"])
+
+    backend.query(f"DELETE FROM `{JOBS_TABLE_ID}` WHERE TRUE")
+
+    assert polling.get(job["job_id"], USER_ID) == done
+    assert accepting.get(job["job_id"], USER_ID) == done
+    assert polling.get(job["job_id"], "other-user") is None
+
+
+def test_same_request_is_deduplicated_across_workers(backend, model):
+    first, second = _queue(backend, model), _queue(backend, model)
+
+    job = first.submit(USER_ID, {"title": "同じ内容"})
+    duplicate = second.submit(USER_ID, {"title": "同じ内容"})
+    other_user = second.submit("other-user", {"title": "同じ内容"})
+
+    assert duplicate["job_id"] == job["job_id"]
+    assert other_user["job_id"] != job["job_id"]
+    model.release()
+    _wait(first, job["job_id"])
+    # 完了後の同じ依頼は新しいジョブになる
+    assert second.submit(USER_ID, {"title": "同じ内容"})["job_id"] != job["job_id"]
+
+
+def test_max_pending_is_shared_by_workers(backend, model):
+    first, second = _queue(backend, model, max_pending=2), _queue(backend, model, max_pending=2)
+
+    first.submit(USER_ID, {"title": "a"})
+    second.submit(USER_ID, {"title": "b"})
+
+    with pytest.raises(QueueFullError):
+        first.submit(USER_ID, {"title": "c"})
+
+
+def test_failed_job_reports_error(backend, model):
+    queue = _queue(backend, model)
+    model.release()
+
+    job = queue.submit(USER_ID, {"title": "boom"})
+
+    assert _wait(queue, job["job_id"]) == {"job_id": job["job_id"], "status": FAILED, "error": "model error"}
+
+
+def test_job_abandoned_by_stopped_worker_times_out(backend, model):
+    queue = _queue(backend, model, job_timeout_seconds=60)
+    created_at = datetime.now(timezone.utc) - timedelta(seconds=120)
+    backend.insert_rows(JOBS_TABLE_ID, [{
+        "id": "abandoned", "user_id": USER_ID, "request_key": "k", "status": QUEUED, "owner": "stopped:1",
+        "created_at": created_at.isoformat(), "updated_at": created_at.isoformat(),
+    }])
+
+    assert queue.get("abandoned", USER_ID) == {"job_id": "abandoned", "status": FAILED, "error": TIMED_OUT_ERROR}
+    # 実行中の件数にも数えない
+    queue.max_pending = 1
+    assert queue.submit(USER_ID, {"title": "new"})["status"] == QUEUED
+
+
+def test_expired_results_are_not_returned_and_purged(backend, model):
+    queue = _queue(backend, model, result_ttl_seconds=60, job_timeout_seconds=60)
+    old = (datetime.now(timezone.utc) - timedelta(seconds=600)).isoformat()
+    backend.insert_rows(JOBS_TABLE_ID, [{
+        "id": "old", "user_id": USER_ID, "request_key": "k", "status": SUCCEEDED, "ai_comment": "x",
+        "owner": "w:1", "created_at": old, "updated_at": old, "finished_at": old,
+    }])
+
+    assert queue.get("old", USER_ID) is None
+    queue.purge_expired()
+    assert backend.query(f"SELECT id FROM `{JOBS_TABLE_ID}`").first() is None
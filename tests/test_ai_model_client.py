@@ -0,0 +1,31 @@
+from types import SimpleNamespace
+from src.core.request_stats import AICall
+from src.services.ai_model_client import VertexAIModelClient
+
+
+class _NonTextPart:
+    @property
+    def text(self):
+        raise ValueError("Part has no text")
+
+
+def _response(*parts, usage=None):
+    candidates = [SimpleNamespace(content=SimpleNamespace(parts=list(parts)))] if parts else []
+    return SimpleNamespace(candidates=candidates, usage_metadata=usage)
+
+
+def test_stream_skips_chunks_without_text():
+    usage = SimpleNamespace(prompt_token_count=12, candidates_token_count=5)
+    responses = [
+        _response(SimpleNamespace(text="今週も")),
+        _response(_NonTextPart(), SimpleNamespace(text="よく頑張り")),
+        # 安全性フィルタでブロックされた応答（候補にパートが無い）と、使用量だけの最後の応答
+        SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[]))], usage_metadata=None),
+        _response(usage=usage),
+    ]
+    client = VertexAIModelClient()
+    client._model = SimpleNamespace(generate_content=lambda prompt, stream: iter(responses))
+    call = AICall("gemini", "stream")
+
+    assert list(client._generate_stream("prompt", call)) == ["今週も", "よく頑張り"]
+    assert (call.prompt_tokens, call.output_tokens) == (12, 5)
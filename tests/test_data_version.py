@@ -0,0 +1,81 @@
+import time
+from flask import Flask
+from src.core.conditional import conditional_response
+from src.models.activity import ActivityUpdate
+from src.services.activity_service import ActivityService
+from src.services.activity_write_buffer import ActivityWriteBuffer
+from src.services.data_version import DataVersions
+from tests.conftest import ACTIVITIES_TABLE_ID, USER_ID, activity, utc
+
+
+def test_every_write_advances_the_version_without_a_query(backend):
+    versions = DataVersions(ACTIVITIES_TABLE_ID)
+    service = ActivityService(backend, ACTIVITIES_TABLE_ID, versions=versions)
+    query = backend.query
+    backend.query = lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("version must not query"))
+    try:
+        empty = service.data_version(USER_ID)
+        assert service.data_version(USER_ID) == empty
+    finally:
+        backend.query = query
+
+    created = service.create_activity(USER_ID, activity(utc(2025, 1, 6, 9), utc(2025, 1, 6, 10)))
+    after_create = service.data_version(USER_ID)
+    service.create_activity("other-user", activity(utc(2025, 1, 7, 9), utc(2025, 1, 7, 10)))
+    assert service.data_version(USER_ID) == after_create
+    service.update_activity(created.id, USER_ID, ActivityUpdate(fatigue_level=5))
+    after_update = service.data_version(USER_ID)
+    assert service.delete_activity(created.id, USER_ID)
+    after_delete = service.data_version(USER_ID)
+    # 該当行が無い削除では進めない
+    assert not service.delete_activity(created.id, USER_ID)
+
+    assert service.data_version(USER_ID) == after_delete
+    assert len({empty.etag, after_create.etag, after_update.etag, after_delete.etag}) == 4
+    assert empty.last_modified < after_create.last_modified < after_update.last_modified < after_delete.last_modified
+
+
+def test_buffered_create_advances_the_version_on_add_and_on_flush(backend, tmp_path):
+    buffer = ActivityWriteBuffer(backend, ACTIVITIES_TABLE_ID, max_rows=100, max_age_seconds=60, spill_dir=str(tmp_path))
+    service = ActivityService(backend, ACTIVITIES_TABLE_ID, write_buffer=buffer, versions=DataVersions(ACTIVITIES_TABLE_ID))
+    try:
+        before = service.data_version(USER_ID)
+        service.create_activity(USER_ID, activity(utc(2025, 1, 6, 9), utc(2025, 1, 6, 10)))
+        added = service.data_version(USER_ID)
+        # 一覧に含まれるのはフラッシュ後のため、その時点でも進める
+        buffer.flush()
+        flushed = service.data_version(USER_ID)
+    finally:
+        buffer.close()
+
+    assert len({before.etag, added.etag, flushed.etag}) == 3
+
+
+def test_version_expires_so_other_workers_changes_show_up():
+    versions, other_worker = DataVersions(ACTIVITIES_TABLE_ID, ttl_seconds=0.05), DataVersions(ACTIVITIES_TABLE_ID)
+    version = versions.current(USER_ID)
+    assert other_worker.current(USER_ID).etag != version.etag
+
+    time.sleep(0.06)
+
+    assert versions.current(USER_ID).etag != version.etag
+
+
+def test_not_modified_only_on_matching_etag():
+    versions = DataVersions(ACTIVITIES_TABLE_ID)
+    version = versions.current(USER_ID)
+    app = Flask(__name__)
+    built = []
+
+    def respond(headers):
+        with app.test_request_context(headers=headers):
+            return conditional_response(versions.current(USER_ID), lambda: built.append(1) or {"rows": []})
+
+    assert respond({"If-None-Match": f'W/"{version.etag}"'}).status_code == 304
+    assert built == []
+    response = respond({"If-None-Match": '"stale"'})
+    assert (response.status_code, response.headers["ETag"]) == (200, f'W/"{version.etag}"')
+    # Last-Modified はプロセス毎の時刻のため、If-Modified-Since だけでは304にしない
+    assert respond({"If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"}).status_code == 200
+    versions.bump(USER_ID)
+    assert respond({"If-None-Match": f'W/"{version.etag}"'}).status_code == 200
@@ -0,0 +1,24 @@
+from flask import Flask, has_request_context
+from src.core import request_stats
+from src.core.executor import FanOutExecutor
+from src.core.logging_config import _debug_sampled
+
+
+def test_parts_get_request_stats_but_not_the_flask_request():
+    app = Flask(__name__)
+    stats = request_stats.RequestStats()
+
+    def part():
+        return has_request_context(), request_stats._request_stats.get(), _debug_sampled.get()
+
+    with app.test_request_context("/api/v1/dashboard"):
+        token = request_stats._request_stats.set(stats)
+        sampled = _debug_sampled.set(True)
+        try:
+            result = FanOutExecutor(max_workers=2).run("test", {"part": part})["part"]
+        finally:
+            _debug_sampled.reset(sampled)
+            request_stats._request_stats.reset(token)
+
+    assert result.error is None
+    assert result.value == (False, stats, True)
@@ -0,0 +1,68 @@
+import os
+import runpy
+import pytest
+from src.core import resources
+
+CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+MB = 1024 * 1024
+
+
+@pytest.fixture
+def env(monkeypatch):
+    for name in ("GUNICORN_WORKERS", "GUNICORN_THREADS", "GUNICORN_WORKER_MEMORY_MB", "GUNICORN_WORKER_CLASS",
+                 "ACTIVITY_CACHE_MAX_ROWS", "USER_CACHE_MAX_USERS", "STORAGE_BACKEND", "SQLITE_DB_PATH"):
+        monkeypatch.delenv(name, raising=False)
+    # 設定ファイルが書き換える値をテスト後に戻す
+    monkeypatch.setenv("WEB_CONCURRENCY", "")
+    monkeypatch.setattr(resources, "available_cpus", lambda: 4)
+    monkeypatch.setattr(resources, "memory_limit_bytes", lambda: None)
+    return monkeypatch
+
+
+def test_defaults_follow_container_cpus(env):
+    config = runpy.run_path(CONFIG)
+
+    # ユーザー情報のキャッシュ（既定で有効、TTLあり）は複数ワーカーを妨げない
+    assert (config["workers"], config["threads"]) == (4, 8)
+    assert os.environ["WEB_CONCURRENCY"] == "4"
+
+
+def test_memory_limit_caps_workers_and_adds_threads(env):
+    env.setattr(resources, "memory_limit_bytes", lambda: 512 * MB)
+
+    config = runpy.run_path(CONFIG)
+
+    assert (config["workers"], config["threads"]) == (2, 16)
+
+
+def test_per_process_state_defaults_to_one_worker(env):
+    env.setenv("ACTIVITY_CACHE_MAX_ROWS", "1000")
+
+    config = runpy.run_path(CONFIG)
+
+    assert (config["workers"], config["threads"]) == (1, 32)
+
+
+@pytest.mark.parametrize("enabled", [
+    {"ACTIVITY_CACHE_MAX_ROWS": "1000"},
+    {"STORAGE_BACKEND": "sqlite"},
+])
+def test_refuses_several_workers_with_per_process_state(env, enabled):
+    env.setenv("GUNICORN_WORKERS", "3")
+    for name, value in enabled.items():
+        env.setenv(name, value)
+
+    with pytest.raises(RuntimeError):
+        runpy.run_path(CONFIG)
+
+
+def test_explicit_workers_and_threads(env):
+    env.setenv("GUNICORN_WORKERS", "3")
+    env.setenv("GUNICORN_THREADS", "5")
+    env.setenv("STORAGE_BACKEND", "sqlite")
+    env.setenv("SQLITE_DB_PATH", "/data/app.db")
+
+    config = runpy.run_path(CONFIG)
+
+    assert (config["workers"], config["threads"]) == (3, 5)
+    assert os.environ["WEB_CONCURRENCY"] == "3"
@@ -0,0 +1,128 @@
+from datetime import date, timedelta
+import pytest
+from src.services.activity_cache import ActivityRangeCache
+from src.services.activity_service import ActivityService
+from src.services.daily_rollup_service import DailyRollupService
+from src.services.load_engine import ActivityColumns, compute_load
+from src.services.weekly_reflection_service import WeeklyReflectionService
+from tests.conftest import ACTIVITIES_TABLE_ID, REFLECTIONS_TABLE_ID, ROLLUPS_TABLE_ID, USER_ID, activity, utc
+
+WEEK_START = date(2025, 1, 13)
+
+
+class _NoModel:
+    model_name = "none"
+
+
+@pytest.fixture
+def loaded(backend):
+    """4週間分＋移動合計の前日分の行動記録（日付の境界をまたぐ行・負荷対象外のカテゴリ・秒の端数を含む）"""
+    activities = ActivityService(backend, ACTIVITIES_TABLE_ID)
+    categories = ("business", "study", "private", "sleep", "meal")
+    first = WEEK_START - timedelta(days=28)
+    for day in range(35):
+        for slot in range(day % 4):
+            start = utc(first.year, first.month, first.day, 6 + slot * 5) + timedelta(days=day, seconds=day * 7)
+            end = start + timedelta(minutes=25 + 17 * slot + day, seconds=slot * 41)
+            activities.create_activity(USER_ID, activity(start, end, categories[(day + slot) % 5], (day * 3 + slot) % 6))
+    # 週の最終日の夜から翌週にまたがる行は DATE(start_time) の日に数える
+    last_day = WEEK_START + timedelta(days=6)
+    late = utc(last_day.year, last_day.month, last_day.day, 22, 30)
+    activities.create_activity(USER_ID, activity(late, late + timedelta(hours=3), "business", 5))
+    activities.create_activity("other-user", activity(utc(2025, 1, 14, 9), utc(2025, 1, 14, 18), "business", 5))
+    return backend
+
+
+def _sql_service(backend, rollups=False) -> WeeklyReflectionService:
+    return WeeklyReflectionService(
+        backend, REFLECTIONS_TABLE_ID, activities_table_id=ACTIVITIES_TABLE_ID,
+        rollups=DailyRollupService(backend, ROLLUPS_TABLE_ID, ACTIVITIES_TABLE_ID) if rollups else None,
+        model_client=_NoModel(),
+    )
+
+
+def _sql_daily_totals(backend, start: date, end: date):
+    rollups = DailyRollupService(backend, ROLLUPS_TABLE_ID, ACTIVITIES_TABLE_ID)
+    rollups.rebuild(user_id=USER_ID)
+    return {str(row["date"]): (row["activity_minutes"], row["load_points"])
+            for row in rollups.get_daily_totals(USER_ID, start, end)}
+
+
+def test_weekly_summary_matches_sql_aggregation(loaded):
+    service = _sql_service(loaded)
+
+    summary = service.get_weekly_load_summary(USER_ID, WEEK_START)
+
+    expected = _sql_daily_totals(loaded, WEEK_START, WEEK_START + timedelta(days=6))
+    assert {d["date"]: (d["activity_minutes"], pytest.approx(d["load_points"]))
+            for d in summary["daily"]} == expected
+    assert summary["total_load_points"] == pytest.approx(service.calculate_weekly_load_points(USER_ID, WEEK_START))
+    # 日次集計（作り直した DailyLoadRollups）から読む経路とも一致する
+    rolled_up = _sql_service(loaded, rollups=True).get_weekly_load_summary(USER_ID, WEEK_START)
+    assert [(d["date"], d["activity_minutes"]) for d in rolled_up["daily"]] == \
+        [(d["date"], d["activity_minutes"]) for d in summary["daily"]]
+    assert rolled_up["total_load_points"] == pytest.approx(summary["total_load_points"])
+
+
+def test_load_trends_match_sql_aggregation(loaded):
+    service = _sql_service(loaded)
+
+    trends = service.get_load_trends(USER_ID, WEEK_START, weeks=4, rolling_window=3)
+
+    first_week = WEEK_START - timedelta(days=21)
+    totals = _sql_daily_totals(loaded, first_week - timedelta(days=2), WEEK_START + timedelta(days=6))
+    for week in trends["weeks"]:
+        week_start = date.fromisoformat(week["week_start_date"])
+        assert week["total_load_points"] == pytest.approx(service.calculate_weekly_load_points(USER_ID, week_start))
+    for day in trends["daily"]:
+        today = date.fromisoformat(day["date"])
+        minutes, points = totals.get(day["date"], (0, 0.0))
+        assert (day["activity_minutes"], day["load_points"]) == (minutes, pytest.approx(points))
+        window = [totals.get(str(today - timedelta(days=i)), (0, 0.0))[1] for i in range(3)]
+        assert day["rolling_load_points"] == pytest.approx(sum(window))
+    assert len(trends["daily"]) == 28
+    assert [p["load_points"] for p in trends["peak_days"]] == sorted(
+        (p["load_points"] for p in trends["peak_days"]), reverse=True)
+
+
+def test_compute_load_counts_by_start_date_and_truncates_minutes():
+    rows = [
+        {"start_time": utc(2025, 1, 13, 23, 0), "end_time": utc(2025, 1, 14, 1, 0, 59), "fatigue_level": 3, "category_id": "study"},
+        {"start_time": utc(2025, 1, 14, 9, 0), "end_time": utc(2025, 1, 14, 9, 0, 59), "fatigue_level": 5, "category_id": "business"},
+        {"start_time": utc(2025, 1, 14, 10, 0), "end_time": utc(2025, 1, 14, 12, 0), "fatigue_level": 5, "category_id": "sleep"},
+        {"start_time": utc(2025, 1, 20, 0, 0), "end_time": utc(2025, 1, 20, 1, 0), "fatigue_level": 5, "category_id": "study"},
+    ]
+
+    report = compute_load(ActivityColumns.from_rows(rows), WEEK_START, 7, rolling_window=1)
+
+    assert report.daily_summary() == [
+        {"date": "2025-01-13", "activity_minutes": 120, "load_points": 6.0},
+        {"date": "2025-01-14", "activity_minutes": 0, "load_points": 0.0},
+    ]
+    assert report.category_minutes == {"study": 120, "sleep": 120}
+
+
+def test_compute_load_of_no_rows_is_empty():
+    report = compute_load(ActivityColumns.from_rows([]), WEEK_START, 14)
+
+    assert report.daily_summary() == []
+    assert list(report.weekly_load_points) == [0.0, 0.0]
+    assert len(report.peak_day_indices) == 0
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_summary_through_activity_service_matches_sql(loaded, cache):
+    activities = ActivityService(loaded, ACTIVITIES_TABLE_ID, cache=ActivityRangeCache() if cache else None)
+    if cache:
+        # 一覧（終了側が開いた期間）で載せたキャッシュから切り出す経路を通す
+        activities.get_activities_by_user(USER_ID, start_date=f"{WEEK_START - timedelta(days=30)}T00:00:00+00:00")
+    service = WeeklyReflectionService(loaded, REFLECTIONS_TABLE_ID, activities_table_id=ACTIVITIES_TABLE_ID,
+                                      activity_service=activities, model_client=_NoModel())
+
+    summary = service.get_weekly_load_summary(USER_ID, WEEK_START)
+
+    assert summary == _sql_service(loaded).get_weekly_load_summary(USER_ID, WEEK_START)
+    if cache:
+        # 期間外の週はキャッシュに載っていないため、期間を広げずにSQLで取得する
+        assert activities.get_cached_activities_started_between(
+            USER_ID, f"{WEEK_START - timedelta(days=60)}T00:00:00+00:00", f"{WEEK_START}T00:00:00+00:00") is None
@@ -0,0 +1,62 @@
+import pytest
+from src.auth import password_hasher
+from src.auth.password_hasher import MIN_QUEUE_TIMEOUT, PasswordHasher, create_password_hasher_from_env
+from src.core import resources
+
+
+@pytest.fixture
+def cpus(monkeypatch):
+    monkeypatch.setattr(resources, "available_cpus", lambda: 8)
+    for name in ("PASSWORD_HASHER_WORKERS", "PASSWORD_HASHER_MAX_PENDING", "PASSWORD_HASHER_QUEUE_TIMEOUT_SECONDS"):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+@pytest.mark.parametrize("web_concurrency, workers, max_pending", [(None, 8, 32), ("1", 8, 32), ("3", 2, 10), ("16", 1, 2)])
+def test_pool_is_split_between_gunicorn_workers(cpus, web_concurrency, workers, max_pending):
+    if web_concurrency is None:
+        cpus.delenv("WEB_CONCURRENCY", raising=False)
+    else:
+        cpus.setenv("WEB_CONCURRENCY", web_concurrency)
+
+    hasher = create_password_hasher_from_env()
+
+    assert (hasher.max_workers, hasher.max_pending, hasher.queue_timeout) == (workers, max_pending, None)
+
+
+def test_explicit_settings_win(cpus):
+    cpus.setenv("WEB_CONCURRENCY", "4")
+    cpus.setenv("PASSWORD_HASHER_WORKERS", "3")
+    cpus.setenv("PASSWORD_HASHER_MAX_PENDING", "7")
+    cpus.setenv("PASSWORD_HASHER_QUEUE_TIMEOUT_SECONDS", "1.5")
+
+    hasher = create_password_hasher_from_env()
+
+    assert (hasher.max_workers, hasher.max_pending, hasher.queue_timeout_seconds()) == (3, 7, 1.5)
+
+
+def test_queue_timeout_follows_measured_hash_time():
+    hasher = PasswordHasher(rounds=12, max_workers=2, max_pending=62, use_processes=False)
+    assert hasher.queue_timeout_seconds() == pytest.approx(32 * password_hasher.ESTIMATED_SECONDS_AT_COST_12)
+
+    for _ in range(50):
+        hasher._observe(0.01)
+    assert hasher.queue_timeout_seconds() == MIN_QUEUE_TIMEOUT
+
+    for _ in range(50):
+        hasher._observe(1.0)
+    # 待ちが上限（62件）のとき、2並列で31回分＋自分の1回分の処理時間を待てる
+    assert hasher.queue_timeout_seconds() == pytest.approx(32.0, rel=0.01)
+
+
+def test_hash_and_verify_measure_run_time():
+    hasher = PasswordHasher(rounds=4, max_workers=1, max_pending=1, use_processes=False)
+    hasher.warm_up()
+    measured = hasher.hash_seconds
+
+    password_hash = hasher.hash("correct horse")
+
+    assert hasher.verify("correct horse", password_hash)
+    assert not hasher.verify("wrong", password_hash)
+    assert 0 < measured < password_hasher.ESTIMATED_SECONDS_AT_COST_12
+    assert hasher.hash_seconds != measured
@@ -0,0 +1,162 @@
+import sqlite3
+from datetime import date
+import pytest
+from src.core.sqlite_backend import split_statements
+from src.core.storage import QueryParameter
+from tests.conftest import ACTIVITIES_TABLE_ID, ROLLUPS_TABLE_ID, USER_ID
+
+MERGE_ROLLUP = f"""
+MERGE `{ROLLUPS_TABLE_ID}` AS target
+USING (
+    SELECT @user_id AS user_id, @day_1 AS rollup_date, 'business' AS category_id, 30 AS activity_minutes,
+           1.5 AS load_points, 1 AS activity_count
+    UNION ALL SELECT @user_id AS user_id, @day_2 AS rollup_date, 'study' AS category_id, 60 AS activity_minutes,
+           2.0 AS load_points, 1 AS activity_count
+) AS source
+ON target.user_id = source.user_id AND target.rollup_date = source.rollup_date AND target.category_id = source.category_id
+WHEN MATCHED THEN
+  UPDATE SET
+    activity_minutes = target.activity_minutes + source.activity_minutes,
+    load_points = target.load_points + source.load_points,
+    activity_count = target.activity_count + source.activity_count,
+    updated_at = CURRENT_TIMESTAMP()
+WHEN NOT MATCHED THEN
+  INSERT (user_id, rollup_date, category_id, activity_minutes, load_points, activity_count, updated_at)
+  VALUES (source.user_id, source.rollup_date, source.category_id, source.activity_minutes,
+          source.load_points, source.activity_count, CURRENT_TIMESTAMP())
+"""
+
+MERGE_PARAMS = [
+    QueryParameter("user_id", "STRING", USER_ID),
+    QueryParameter("day_1", "DATE", "2025-01-06"),
+    QueryParameter("day_2", "DATE", "2025-01-07"),
+]
+
+
+def _rollups(backend):
+    rows = backend.query(f"SELECT * FROM `{ROLLUPS_TABLE_ID}` ORDER BY rollup_date, category_id")
+    return [(row["rollup_date"], row["category_id"], row["activity_minutes"], row["load_points"], row["activity_count"])
+            for row in rows]
+
+
+def _insert_rollup(backend, day, category_id, minutes, points, count):
+    errors = backend.insert_rows(ROLLUPS_TABLE_ID, [{
+        "user_id": USER_ID, "rollup_date": day, "category_id": category_id, "activity_minutes": minutes,
+        "load_points": points, "activity_count": count, "updated_at": "2025-01-01T00:00:00+00:00",
+    }])
+    assert errors == []
+
+
+def test_merge_updates_matched_rows_and_inserts_unmatched_rows(backend):
+    _insert_rollup(backend, "2025-01-06", "business", 10, 0.5, 2)
+
+    result = backend.query(MERGE_ROLLUP, MERGE_PARAMS)
+
+    assert result.num_dml_affected_rows == 2
+    assert _rollups(backend) == [
+        (date(2025, 1, 6), "business", 40, 2.0, 3),
+        (date(2025, 1, 7), "study", 60, 2.0, 1),
+    ]
+
+
+def test_merge_is_repeatable(backend):
+    backend.query(MERGE_ROLLUP, MERGE_PARAMS)
+    backend.query(MERGE_ROLLUP, MERGE_PARAMS)
+
+    assert _rollups(backend) == [
+        (date(2025, 1, 6), "business", 60, 3.0, 2),
+        (date(2025, 1, 7), "study", 120, 4.0, 2),
+    ]
+
+
+def test_merge_without_not_matched_clause_only_updates(backend):
+    _insert_rollup(backend, "2025-01-06", "business", 10, 0.5, 2)
+    update_only = MERGE_ROLLUP[:MERGE_ROLLUP.index("WHEN NOT MATCHED")]
+
+    result = backend.query(update_only, MERGE_PARAMS)
+
+    assert result.num_dml_affected_rows == 1
+    assert _rollups(backend) == [(date(2025, 1, 6), "business", 40, 2.0, 3)]
+
+
+def test_unsupported_merge_is_rejected(backend):
+    with pytest.raises(ValueError):
+        backend.query(f"MERGE `{ROLLUPS_TABLE_ID}` USING other ON TRUE WHEN MATCHED THEN DELETE")
+
+
+def _insert_activity(backend, activity_id, start, end, fatigue_level=3):
+    errors = backend.insert_rows(ACTIVITIES_TABLE_ID, [{
+        "id": activity_id, "user_id": USER_ID, "start_time": start, "end_time": end,
+        "activity_content": activity_id, "category_id": "business", "fatigue_level": fatigue_level,
+        "created_at": start, "updated_at": start,
+    }])
+    assert errors == []
+
+
+def test_script_returns_rows_of_last_statement_and_drops_temp_tables(backend):
+    _insert_activity(backend, "a1", "2025-01-06T09:00:00Z", "2025-01-06T10:00:00Z", fatigue_level=1)
+    params = [QueryParameter("activity_id", "STRING", "a1"), QueryParameter("fatigue_level", "INT64", 4)]
+
+    result = backend.query(f"""
+        CREATE TEMP TABLE prior_rows AS SELECT * FROM `{ACTIVITIES_TABLE_ID}` WHERE id = @activity_id;
+        UPDATE `{ACTIVITIES_TABLE_ID}` SET fatigue_level = @fatigue_level WHERE id = @activity_id;
+        SELECT 'after' AS row_version, fatigue_level FROM `{ACTIVITIES_TABLE_ID}` WHERE id = @activity_id
+        UNION ALL
+        SELECT 'before' AS row_version, fatigue_level FROM prior_rows
+    """, params)
+
+    assert sorted((row["row_version"], row["fatigue_level"]) for row in result) == [("after", 4), ("before", 1)]
+    # BigQueryと同様、スクリプトの親ジョブはDML件数を返さない
+    assert result.num_dml_affected_rows is None
+    with pytest.raises(sqlite3.OperationalError):
+        backend.query("SELECT * FROM prior_rows")
+    # 同じ名前の一時テーブルを次のスクリプトで作り直せる
+    backend.query("CREATE TEMP TABLE prior_rows AS SELECT 1 AS x; SELECT x FROM prior_rows")
+
+
+def test_failed_script_is_rolled_back(backend):
+    _insert_activity(backend, "a1", "2025-01-06T09:00:00Z", "2025-01-06T10:00:00Z", fatigue_level=1)
+
+    with pytest.raises(sqlite3.OperationalError):
+        backend.query(f"""
+            UPDATE `{ACTIVITIES_TABLE_ID}` SET fatigue_level = 5 WHERE id = 'a1';
+            SELECT no_such_column FROM `{ACTIVITIES_TABLE_ID}`
+        """)
+
+    assert backend.query(f"SELECT fatigue_level FROM `{ACTIVITIES_TABLE_ID}`").first()["fatigue_level"] == 1
+
+
+def test_single_dml_statement_reports_affected_rows(backend):
+    _insert_activity(backend, "a1", "2025-01-06T09:00:00Z", "2025-01-06T10:00:00Z")
+    _insert_activity(backend, "a2", "2025-01-07T09:00:00Z", "2025-01-07T10:00:00Z")
+
+    result = backend.query(f"DELETE FROM `{ACTIVITIES_TABLE_ID}` WHERE start_time >= @since",
+                           [QueryParameter("since", "TIMESTAMP", "2025-01-07T00:00:00+00:00")])
+
+    assert result.num_dml_affected_rows == 1
+
+
+def test_timestamp_diff_truncates_toward_zero(backend):
+    _insert_activity(backend, "a1", "2025-01-06T09:00:00Z", "2025-01-06T09:01:59.900Z")
+    _insert_activity(backend, "a2", "2025-01-06T09:01:59.900Z", "2025-01-06T09:00:00Z")
+
+    rows = backend.query(f"""
+        SELECT id, TIMESTAMP_DIFF(end_time, start_time, MINUTE) AS minutes,
+               TIMESTAMP_DIFF(end_time, start_time, SECOND) AS seconds
+        FROM `{ACTIVITIES_TABLE_ID}` ORDER BY id
+    """)
+
+    assert [(row["id"], row["minutes"], row["seconds"]) for row in rows] == [("a1", 1, 119), ("a2", -1, -119)]
+
+
+def test_timestamp_parameters_compare_across_offsets(backend):
+    _insert_activity(backend, "a1", "2025-01-06T09:00:00+09:00", "2025-01-06T10:00:00+09:00")
+
+    rows = backend.query(f"SELECT id FROM `{ACTIVITIES_TABLE_ID}` WHERE start_time = @start",
+                         [QueryParameter("start", "TIMESTAMP", "2025-01-06T00:00:00Z")])
+
+    assert [row["id"] for row in rows] == ["a1"]
+
+
+def test_split_statements_ignores_semicolons_in_literals():
+    assert split_statements("SELECT ';' AS a; SELECT `x;y`; ;") == ["SELECT ';' AS a", " SELECT `x;y`"]